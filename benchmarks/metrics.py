@@ -0,0 +1,197 @@
+# AiRadioDramaCreator/benchmarks/metrics.py
+
+import math
+import os
+import sys
+import threading
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence
+)
+
+from core.mock_backend import (
+    MockBackendConfig,
+    MockGeminiBackend
+)
+
+try:
+    import resource
+except ImportError:
+    # Windows には resource モジュールが無い。子プロセスのCPU時間と最大RSSは記録しない
+    resource = None
+
+PERCENTILES = (50, 95, 99)
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """values の q パーセンタイルを線形補間で求める。空の場合は None を返す。"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100.0
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    if lower == upper:
+        return ordered[lower]
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def summarize(values: Iterable[float]) -> Dict[str, Any]:
+    """件数・平均・最大と p50/p95/p99 をまとめる (単位は秒)。"""
+    values = list(values)
+    summary: Dict[str, Any] = {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "max": max(values) if values else None,
+    }
+    for q in PERCENTILES:
+        summary[f"p{q}"] = percentile(values, q)
+    return summary
+
+def _current_rss_bytes() -> Optional[int]:
+    """現在の常駐メモリ (RSS) をバイト数で返す。取得できない環境では None。"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+def _max_rss_bytes() -> Optional[int]:
+    """プロセス開始からの最大RSSをバイト数で返す。取得できない環境では None。"""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS はバイト、Linux はKB単位で返す
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+def _cpu_seconds() -> float:
+    """このプロセスのすべてのスレッドと、終了した子プロセス (ffmpeg など) が使ったCPU時間の合計。"""
+    seconds = time.process_time()
+    if resource is not None:
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        seconds += children.ru_utime + children.ru_stime
+    return seconds
+
+class ResourceMonitor:
+    """
+    CPU時間とメモリのピークを、ステージごとに区切って計測するクラス。
+    RSSは別スレッドで interval 秒ごとに読み取り、区間内の最大値を記録する。
+    /proc が無い環境では、区間ではなくプロセス全体の最大RSSを記録する。
+    """
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._segment: Optional[str] = None
+        self._segment_cpu = 0.0
+        self._segment_wall = 0.0
+        self._segment_peak = 0
+        self._segments: Dict[str, Dict[str, Any]] = {}
+        self._started_cpu = 0.0
+        self._started_wall = 0.0
+        self._overall_peak = 0
+
+    def _sample(self):
+        rss = _current_rss_bytes()
+        if rss is None:
+            return
+        with self._lock:
+            self._segment_peak = max(self._segment_peak, rss)
+            self._overall_peak = max(self._overall_peak, rss)
+
+    def _sample_loop(self):
+        while not self._stop_event.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._started_cpu = _cpu_seconds()
+        self._started_wall = time.perf_counter()
+        self._sample()
+        self._thread = threading.Thread(target=self._sample_loop, name="benchmark-rss", daemon=True)
+        self._thread.start()
+
+    def _peak_mb(self, peak: int) -> Optional[float]:
+        if peak == 0:
+            peak = _max_rss_bytes() or 0
+        return round(peak / (1024 * 1024), 1) if peak else None
+
+    def _close_segment(self):
+        if self._segment is None:
+            return
+        self._sample()
+        with self._lock:
+            self._segments[self._segment] = {
+                "wall_seconds": time.perf_counter() - self._segment_wall,
+                "cpu_seconds": _cpu_seconds() - self._segment_cpu,
+                "peak_rss_mb": self._peak_mb(self._segment_peak),
+            }
+            self._segment = None
+
+    def begin(self, name: str):
+        """name の区間を開始する。前の区間は自動的に閉じる。"""
+        self._close_segment()
+        self._sample()
+        with self._lock:
+            self._segment = name
+            self._segment_cpu = _cpu_seconds()
+            self._segment_wall = time.perf_counter()
+            self._segment_peak = _current_rss_bytes() or 0
+
+    def stop(self) -> Dict[str, Any]:
+        """計測を終え、{区間名: {wall_seconds, cpu_seconds, peak_rss_mb}} と全体の値を返す。"""
+        self._close_segment()
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        return {
+            "segments": dict(self._segments),
+            "wall_seconds": time.perf_counter() - self._started_wall,
+            "cpu_seconds": _cpu_seconds() - self._started_cpu,
+            "peak_rss_mb": self._peak_mb(self._overall_peak),
+        }
+
+class TimedMockBackend(MockGeminiBackend):
+    """
+    リクエストから最初のチャンクが届くまでの時間 (TTFB) を、テキストと音声に分けて記録するモックバックエンド。
+    APIクライアントから見た時間を測るため、ストリームを開いた時刻から最初のチャンクを返した時刻までを数える。
+    """
+    def __init__(self, config: Optional[MockBackendConfig] = None, speech_models: Iterable[str] = ()):
+        super().__init__(config)
+        self.speech_models = set(speech_models)
+        self._ttfb_lock = threading.Lock()
+        self._ttfb: Dict[str, List[float]] = {"text": [], "speech": []}
+
+    def _kind(self, model: str) -> str:
+        return "speech" if model in self.speech_models else "text"
+
+    def _record_ttfb(self, model: str, seconds: float):
+        with self._ttfb_lock:
+            self._ttfb[self._kind(model)].append(seconds)
+
+    def ttfb(self) -> Dict[str, List[float]]:
+        with self._ttfb_lock:
+            return {kind: list(values) for kind, values in self._ttfb.items()}
+
+    def stream(self, model: str, contents: Any, config: Any) -> Iterator[Any]:
+        started = time.perf_counter()
+        first = True
+        for chunk in super().stream(model, contents, config):
+            if first:
+                self._record_ttfb(model, time.perf_counter() - started)
+                first = False
+            yield chunk
+
+    async def stream_async(self, model: str, contents: Any, config: Any) -> AsyncIterator[Any]:
+        started = time.perf_counter()
+        first = True
+        async for chunk in super().stream_async(model, contents, config):
+            if first:
+                self._record_ttfb(model, time.perf_counter() - started)
+                first = False
+            yield chunk
@@ -0,0 +1,438 @@
+# AiRadioDramaCreator/benchmarks/run_pipeline.py
+"""
+合成プロジェクトを作り、モックバックエンドに対して 台本 → SSML → 音声 を実行して処理性能を計測するベンチマーク。
+リポジトリのルートで実行する:
+
+    python -m benchmarks.run_pipeline --scenarios 20 --characters 4 --output result.json
+    python -m benchmarks.run_pipeline --scenarios 20 --characters 4 --compare result.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple
+)
+
+from benchmarks.metrics import (
+    ResourceMonitor,
+    TimedMockBackend,
+    summarize
+)
+from benchmarks.synthetic_project import build_synthetic_project
+from core.api_client import (
+    ApiKeyManager,
+    GeminiApiClientPool,
+    set_client_factory
+)
+from core.async_runner import shutdown_async_runner
+from core.manifest import (
+    STAGE_AUDIO,
+    STAGE_DIALOG,
+    STAGE_SSML
+)
+from core.mock_backend import (
+    MockBackendConfig,
+    MockGenaiClient
+)
+from core.models import (
+    Project,
+    RateLimit
+)
+from core.orchestrator import (
+    make_async_client_provider,
+    make_client_provider
+)
+from core.pipeline import (
+    ProductionPipeline,
+    StaleBuilder
+)
+from core.render_engine import (
+    STATUS_ERROR,
+    STATUS_PROCESSING,
+    STATUS_SUCCESS
+)
+
+MODE_STAGED = "staged"      # StaleBuilder で 台本 → SSML → 音声 をステージごとに順に実行する (ステージ単位の計測)
+MODE_PIPELINE = "pipeline"  # ProductionPipeline で各ステージを同時に動かす (一括実行の end-to-end の計測)
+STAGES = (STAGE_DIALOG, STAGE_SSML, STAGE_AUDIO)
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+class _StagedTimeline:
+    """StaleBuilder のステータス通知から、ステージごとの区間と各ファイルの処理時間を記録する。"""
+    def __init__(self, monitor: ResourceMonitor, backend: TimedMockBackend):
+        self.monitor = monitor
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._started: Dict[Tuple[str, str], float] = {}
+        self.latencies: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        self.failed: Dict[str, int] = {stage: 0 for stage in STAGES}
+        # ステージが始まった時点での、記録済みTTFBの件数 (ステージは順に実行されるため、差分がそのステージの分になる)
+        self.ttfb_offsets: Dict[str, Dict[str, int]] = {}
+
+    def on_status(self, stage: str, name: str, status: str):
+        now = time.perf_counter()
+        with self._lock:
+            if stage not in self.ttfb_offsets:
+                self.ttfb_offsets[stage] = {kind: len(values) for kind, values in self.backend.ttfb().items()}
+                self.monitor.begin(stage)
+            if status == STATUS_PROCESSING:
+                self._started[(stage, name)] = now
+            elif status in (STATUS_SUCCESS, STATUS_ERROR):
+                started = self._started.pop((stage, name), None)
+                if status == STATUS_ERROR:
+                    self.failed[stage] += 1
+                elif started is not None:
+                    self.latencies[stage].append(now - started)
+
+class _PipelineTimeline:
+    """ProductionPipeline のステータス通知から、各ファイルの end-to-end とステージ間の時間を記録する。"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started: Dict[str, float] = {}
+        self.finished: Dict[str, Tuple[str, float]] = {}
+        self.completed: Dict[str, Dict[str, float]] = {}
+
+    def on_status(self, name: str, status: str):
+        now = time.perf_counter()
+        with self._lock:
+            if status == STATUS_PROCESSING:
+                self.started.setdefault(Path(name).stem, now)
+            elif status in (STATUS_SUCCESS, STATUS_ERROR):
+                self.finished[Path(name).stem] = (status, now)
+
+    def on_stage_complete(self, stage: str, path: Path):
+        with self._lock:
+            self.completed.setdefault(path.stem, {})[stage] = time.perf_counter()
+
+    def stage_latencies(self) -> Dict[str, List[float]]:
+        """ステージごとの処理時間。前のステージの完了から数えるため、SSML・音声はキューでの待ち時間も含む。"""
+        latencies: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        for stem, completed in self.completed.items():
+            previous = self.started.get(stem)
+            for stage in STAGES:
+                if stage not in completed or previous is None:
+                    break
+                latencies[stage].append(completed[stage] - previous)
+                previous = completed[stage]
+        return latencies
+
+def _files_per_minute(files: int, seconds: float) -> Optional[float]:
+    return files / seconds * 60.0 if seconds > 0 else None
+
+def _install_backend(config: MockBackendConfig, project: Project) -> TimedMockBackend:
+    # 実行ごとに新しいバックエンドを作り、リクエストの順番 (障害のスケジュール) と統計を最初から数える
+    backend = TimedMockBackend(config, speech_models=[project.speech_model])
+    set_client_factory(lambda api_key: MockGenaiClient(api_key, backend))
+    return backend
+
+def _prepare_clients(project: Project) -> Tuple[ApiKeyManager, GeminiApiClientPool]:
+    key_manager = ApiKeyManager(
+        project.api_keys,
+        0,
+        rate_limits=project.rate_limits,
+        default_rate_limit=RateLimit()
+    )
+    client_pool = GeminiApiClientPool(key_manager, project.retry_policy)
+    # クライアントを作る時間は計測に含めない
+    client_pool.prewarm([project.text_model, project.speech_model], background=False)
+    return key_manager, client_pool
+
+def _build_project(args: argparse.Namespace, root_path: Path) -> Project:
+    return build_synthetic_project(
+        root_path,
+        scenarios=args.scenarios,
+        characters=args.characters,
+        scenario_chars=args.scenario_chars,
+        seed=args.seed,
+        api_keys=args.keys,
+        audio_format=args.audio_format,
+        max_workers=args.audio_workers,
+        interjection_mode=args.interjections
+    )
+
+def run_staged(args: argparse.Namespace, config: MockBackendConfig, root_path: Path) -> Dict[str, Any]:
+    """StaleBuilder でステージを1つずつ実行し、ステージごとの処理速度・レイテンシ・資源の使用量を返す。"""
+    project = _build_project(args, root_path)
+    backend = _install_backend(config, project)
+    key_manager, client_pool = _prepare_clients(project)
+
+    monitor = ResourceMonitor()
+    timeline = _StagedTimeline(monitor, backend)
+    builder = StaleBuilder(
+        project,
+        text_client_provider=make_client_provider(project, key_manager, project.text_model, client_pool),
+        speech_client_provider=make_client_provider(project, key_manager, project.speech_model, client_pool),
+        async_text_client_provider=make_async_client_provider(project, key_manager, project.text_model, client_pool),
+        on_status=timeline.on_status
+    )
+
+    monitor.start()
+    try:
+        results = builder.run()
+    finally:
+        resources = monitor.stop()
+        client_pool.close()
+
+    ttfb = backend.ttfb()
+    stage_order = [stage for stage in STAGES if stage in timeline.ttfb_offsets]
+    stages: Dict[str, Any] = {}
+    for i, stage in enumerate(stage_order):
+        start = timeline.ttfb_offsets[stage]
+        end = timeline.ttfb_offsets[stage_order[i + 1]] if i + 1 < len(stage_order) else {kind: len(values) for kind, values in ttfb.items()}
+        stage_ttfb = [value for kind, values in ttfb.items() for value in values[start[kind]:end[kind]]]
+        segment = resources["segments"].get(stage, {})
+        succeeded = sum(1 for status in results[stage].values() if status == STATUS_SUCCESS)
+        stages[stage] = {
+            "files": len(results[stage]),
+            "succeeded": succeeded,
+            "failed": timeline.failed[stage],
+            "wall_seconds": segment.get("wall_seconds"),
+            "files_per_minute": _files_per_minute(succeeded, segment.get("wall_seconds") or 0.0),
+            "latency": summarize(timeline.latencies[stage]),
+            "ttfb": summarize(stage_ttfb),
+            "cpu_seconds": segment.get("cpu_seconds"),
+            "peak_rss_mb": segment.get("peak_rss_mb"),
+        }
+
+    audio_succeeded = stages.get(STAGE_AUDIO, {}).get("succeeded", 0)
+    return {
+        "files": args.scenarios,
+        "succeeded": audio_succeeded,
+        "wall_seconds": resources["wall_seconds"],
+        "files_per_minute": _files_per_minute(audio_succeeded, resources["wall_seconds"]),
+        "cpu_seconds": resources["cpu_seconds"],
+        "peak_rss_mb": resources["peak_rss_mb"],
+        "ttfb": {kind: summarize(values) for kind, values in ttfb.items()},
+        "stages": stages,
+        "backend": backend.stats(),
+    }
+
+def run_pipeline(args: argparse.Namespace, config: MockBackendConfig, root_path: Path) -> Dict[str, Any]:
+    """ProductionPipeline で各ステージを同時に動かし、end-to-end の処理速度・レイテンシ・資源の使用量を返す。"""
+    project = _build_project(args, root_path)
+    backend = _install_backend(config, project)
+    key_manager, client_pool = _prepare_clients(project)
+
+    monitor = ResourceMonitor()
+    timeline = _PipelineTimeline()
+    pipeline = ProductionPipeline(
+        project,
+        text_client_provider=make_client_provider(project, key_manager, project.text_model, client_pool),
+        speech_client_provider=make_client_provider(project, key_manager, project.speech_model, client_pool),
+        async_text_client_provider=make_async_client_provider(project, key_manager, project.text_model, client_pool),
+        queue_size=args.queue_size,
+        on_status=timeline.on_status,
+        on_stage_complete=timeline.on_stage_complete
+    )
+
+    script_files = sorted((project.root_path / "script").glob("*.txt"))
+    monitor.start()
+    monitor.begin(MODE_PIPELINE)
+    try:
+        results = pipeline.run(script_files)
+    finally:
+        resources = monitor.stop()
+        client_pool.close()
+
+    succeeded = sum(1 for status in results.values() if status == STATUS_SUCCESS)
+    end_to_end = [
+        finished - timeline.started[stem]
+        for stem, (status, finished) in timeline.finished.items()
+        if status == STATUS_SUCCESS and stem in timeline.started
+    ]
+    stage_latencies = timeline.stage_latencies()
+    return {
+        "files": len(script_files),
+        "succeeded": succeeded,
+        "failed": len(script_files) - succeeded,
+        "wall_seconds": resources["wall_seconds"],
+        "files_per_minute": _files_per_minute(succeeded, resources["wall_seconds"]),
+        "cpu_seconds": resources["cpu_seconds"],
+        "peak_rss_mb": resources["peak_rss_mb"],
+        "latency": summarize(end_to_end),
+        "ttfb": {kind: summarize(values) for kind, values in backend.ttfb().items()},
+        "stages": {stage: {"latency": summarize(stage_latencies[stage])} for stage in STAGES},
+        "backend": backend.stats(),
+    }
+
+def _git_revision() -> Dict[str, Any]:
+    def git(*command: str) -> Optional[str]:
+        try:
+            return subprocess.run(
+                ["git", *command], cwd=REPO_ROOT, capture_output=True, text=True, timeout=10, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(status) if status is not None else None}
+
+# 比較で表示する指標 (キーのパス, 表示名, 大きいほど良いか)
+_COMPARED_METRICS = [
+    (("files_per_minute",), "files/min", True),
+    (("wall_seconds",), "wall (s)", False),
+    (("cpu_seconds",), "cpu (s)", False),
+    (("peak_rss_mb",), "peak RSS (MB)", False),
+    (("latency", "p50"), "latency p50 (s)", False),
+    (("latency", "p95"), "latency p95 (s)", False),
+    (("latency", "p99"), "latency p99 (s)", False),
+    (("ttfb", "p50"), "TTFB p50 (s)", False),
+    (("ttfb", "p95"), "TTFB p95 (s)", False),
+]
+
+def _lookup(data: Dict[str, Any], path: Tuple[str, ...]) -> Optional[float]:
+    for key in path:
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data if isinstance(data, (int, float)) else None
+
+def compare_results(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """2つの計測結果を比べ、指標ごとの変化を表示用の行にして返す。"""
+    lines = [f"比較対象: {baseline.get('meta', {}).get('git', {}).get('commit')} ({baseline.get('meta', {}).get('timestamp')})"]
+    for mode, result in current.get("results", {}).items():
+        base = baseline.get("results", {}).get(mode)
+        if base is None:
+            continue
+        sections = [(mode, result, base)]
+        sections += [
+            (f"{mode}/{stage}", result["stages"][stage], base.get("stages", {}).get(stage, {}))
+            for stage in STAGES if stage in result.get("stages", {})
+        ]
+        for label, now, before in sections:
+            lines.append(f"[{label}]")
+            for path, name, higher_is_better in _COMPARED_METRICS:
+                new_value, old_value = _lookup(now, path), _lookup(before, path)
+                if new_value is None or old_value is None:
+                    continue
+                change = (new_value - old_value) / old_value * 100.0 if old_value else 0.0
+                better = change > 0 if higher_is_better else change < 0
+                mark = "" if abs(change) < 5.0 else (" (改善)" if better else " (悪化)")
+                lines.append(f"  {name:<16} {old_value:>10.3f} -> {new_value:>10.3f}  {change:+6.1f}%{mark}")
+    return lines
+
+def format_summary(results: Dict[str, Dict[str, Any]]) -> List[str]:
+    lines = []
+    for mode, result in results.items():
+        lines.append(
+            f"[{mode}] {result['succeeded']}/{result['files']} 件成功, {result['wall_seconds']:.2f}s, "
+            f"{(result['files_per_minute'] or 0.0):.1f} files/min, CPU {result['cpu_seconds']:.2f}s, "
+            f"peak RSS {result['peak_rss_mb']} MB"
+        )
+        for stage, stage_result in result["stages"].items():
+            latency = stage_result["latency"]
+            if latency["count"] == 0:
+                continue
+            extra = ""
+            if "files_per_minute" in stage_result:
+                extra = f", {(stage_result['files_per_minute'] or 0.0):.1f} files/min"
+            if stage_result.get("ttfb", {}).get("p50") is not None:
+                extra += f", TTFB p50 {stage_result['ttfb']['p50']:.3f}s"
+            lines.append(
+                f"  {stage:<7} p50 {latency['p50']:.3f}s  p95 {latency['p95']:.3f}s  p99 {latency['p99']:.3f}s{extra}"
+            )
+    return lines
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="合成プロジェクトをモックバックエンドで処理し、処理速度・TTFB・レイテンシ・CPU時間・メモリを計測する。"
+    )
+    parser.add_argument("--scenarios", type=int, default=20, help="シナリオの本数 (N)")
+    parser.add_argument("--characters", type=int, default=4, help="登場人物の人数 (M)")
+    parser.add_argument("--scenario-chars", type=int, default=600, help="シナリオ1本あたりのおおよその文字数")
+    parser.add_argument("--seed", type=int, default=0, help="合成シナリオとモックバックエンドの乱数のシード値")
+    parser.add_argument("--keys", type=int, default=4, help="ダミーのAPIキーの数")
+    parser.add_argument("--audio-workers", type=int, default=4, help="音声生成を同時に実行するファイル数 (max_workers)")
+    parser.add_argument("--queue-size", type=int, default=None, help="pipeline モードのステージ間のキューの大きさ")
+    parser.add_argument("--interjections", choices=["off", "batch", "per_spot"], default="off", help="相槌の挿入方法")
+    parser.add_argument("--audio-format", choices=["wav", "mp3", "opus"], default="wav", help="WAVと同時に作る圧縮形式 (mp3/opus は ffmpeg が必要)")
+    parser.add_argument(
+        "--mode", choices=[MODE_STAGED, MODE_PIPELINE, "both"], default="both",
+        help="staged: ステージごとに順に実行 / pipeline: 一括実行 / both: 両方"
+    )
+    parser.add_argument("--mock-config", type=Path, default=None, help="モックバックエンドの設定 (JSON)。省略時は既定値")
+    parser.add_argument("--time-scale", type=float, default=None, help="モックバックエンドの待ち時間の倍率 (設定ファイルの値より優先)")
+    parser.add_argument("--output", type=Path, default=None, help="計測結果を書き出すJSONファイル")
+    parser.add_argument("--compare", type=Path, default=None, help="比較する過去の計測結果 (JSON)")
+    parser.add_argument("--workdir", type=Path, default=None, help="合成プロジェクトを作るフォルダ。指定した場合は実行後も残す")
+    parser.add_argument("--log", type=Path, default=None, help="処理中のログの出力先。省略時は作業フォルダの benchmark.log (--workdir が無い場合は作業フォルダごと削除される)")
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_arg_parser().parse_args(argv)
+    if args.scenarios < 1:
+        print("エラー: --scenarios は1以上を指定してください。", file=sys.stderr)
+        return 2
+
+    config = MockBackendConfig.from_file(args.mock_config) if args.mock_config else MockBackendConfig()
+    if args.time_scale is not None:
+        config.time_scale = args.time_scale
+
+    workdir = args.workdir.resolve() if args.workdir else Path(tempfile.mkdtemp(prefix="radio-drama-bench-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    log_path = args.log or workdir / "benchmark.log"
+    modes = [MODE_STAGED, MODE_PIPELINE] if args.mode == "both" else [args.mode]
+    runners = {MODE_STAGED: run_staged, MODE_PIPELINE: run_pipeline}
+
+    results: Dict[str, Dict[str, Any]] = {}
+    try:
+        for mode in modes:
+            print(f"--- {mode}: シナリオ{args.scenarios}本 x 登場人物{args.characters}人 を計測しています ---", file=sys.stderr)
+            root_path = workdir / mode
+            if root_path.exists():
+                shutil.rmtree(root_path)
+            # 処理中のログは量が多いため、計測結果とは別のファイルに書き出す
+            with open(log_path, "a", encoding="utf-8") as log_file, \
+                    contextlib.redirect_stdout(log_file), contextlib.redirect_stderr(log_file):
+                results[mode] = runners[mode](args, config, root_path)
+    finally:
+        set_client_factory(None)
+        shutdown_async_runner()
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "git": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+            "mock_backend": config.to_dict(),
+        },
+        "results": results,
+    }
+
+    for line in format_summary(results):
+        print(line)
+    if args.compare is not None:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            for line in compare_results(report, json.load(f)):
+                print(line)
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"計測結果を保存しました: {args.output}")
+
+    failed = sum(result["files"] - result["succeeded"] for result in results.values())
+    return 0 if failed == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
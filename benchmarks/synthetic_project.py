@@ -0,0 +1,119 @@
+# AiRadioDramaCreator/benchmarks/synthetic_project.py
+
+import random
+from pathlib import Path
+from typing import (
+    List,
+    Optional
+)
+
+from core.models import (
+    Character,
+    Project,
+    RateLimit,
+    RetryPolicy,
+    Voice
+)
+from utils.project_loader import (
+    load_project_from_file,
+    save_project_config
+)
+
+# 合成シナリオに使う場面と出来事。シード値ごとに組み合わせを変え、ファイルごとに内容が異なるようにする
+_PLACES = ["古い喫茶店", "夜の駅のホーム", "雨の商店街", "放課後の図書室", "海辺の灯台", "山あいの温泉宿", "深夜のラジオ局", "港の倉庫"]
+_EVENTS = [
+    "{a}が{b}に古い手紙を見せる。",
+    "{a}は{b}の言葉に驚き、しばらく黙り込む。",
+    "{b}が{a}に昔の約束を思い出させる。",
+    "{a}と{b}は窓の外の音に耳を澄ませる。",
+    "{a}が{b}に頼みごとをするが、{b}は首を横に振る。",
+    "{b}は{a}をからかいながらも、本心では心配している。",
+    "{a}が落とした鍵を{b}が拾って差し出す。",
+    "{a}と{b}は次に会う日を決めて別れる。",
+]
+
+def synthetic_scenario(index: int, names: List[str], chars: int, rng: random.Random) -> str:
+    """登場人物の名前を含む、おおよそ chars 文字の合成シナリオを作る。"""
+    lines = [f"第{index + 1}話。舞台は{rng.choice(_PLACES)}。"]
+    length = len(lines[0])
+    while length < chars:
+        a, b = rng.sample(names, 2) if len(names) > 1 else (names[0], names[0])
+        line = rng.choice(_EVENTS).format(a=a, b=b)
+        lines.append(line)
+        length += len(line)
+    return "\n".join(lines) + "\n"
+
+def synthetic_characters(count: int, rng: random.Random) -> List[Character]:
+    """count 人分の登場人物を作る。ボイスは Voice の定義順に割り当てる。"""
+    voices = list(Voice)
+    characters = []
+    for i in range(count):
+        characters.append(Character(
+            name=f"人物{i + 1}",
+            voice=voices[i % len(voices)],
+            personality=rng.choice(["明るい", "物静か", "皮肉屋", "心配性", "頑固"]),
+            traits=[rng.choice(["几帳面", "好奇心旺盛", "涙もろい", "負けず嫌い"])],
+            speech_style=rng.choice(["丁寧語", "くだけた話し方", "ぶっきらぼう"]),
+            verbal_tics=[rng.choice(["えっと", "まあね", "なるほど"])]
+        ))
+    return characters
+
+def build_synthetic_project(
+        root_path: Path,
+        scenarios: int,
+        characters: int,
+        scenario_chars: int = 600,
+        seed: int = 0,
+        api_keys: int = 4,
+        audio_format: str = "wav",
+        max_workers: int = 4,
+        interjection_mode: str = "off",
+        text_model: str = "gemini-2.5-flash",
+        speech_model: str = "gemini-2.5-flash-preview-tts",
+        project_kwargs: Optional[dict] = None) -> Project:
+    """
+    N本のシナリオとM人の登場人物を持つ合成プロジェクトを root_path に作り、project.json を保存して読み込み直したものを返す。
+    script/ にシナリオを書き出すだけで、台本・SSML・音声は作らない (計測対象のステージで作る)。
+    APIキーは計測用のダミーで、モックバックエンドでしか使えない。
+    """
+    if characters < 1:
+        raise ValueError("登場人物は1人以上必要です。")
+
+    rng = random.Random(seed)
+    cast = synthetic_characters(characters, rng)
+    project = Project(
+        project_name=f"benchmark-{scenarios}x{characters}",
+        project_description="ベンチマーク用の合成プロジェクト",
+        api_keys=[f"bench-key-{i + 1}" for i in range(max(1, api_keys))],
+        api_index=0,
+        speech_model=speech_model,
+        text_model=text_model,
+        root_path=str(root_path),
+        characters=cast,
+        max_workers=max_workers,
+        # 利用枠の待ちではなく処理そのものを計測するため、RPM/TPMの制限は設けない
+        rate_limits={text_model: RateLimit(), speech_model: RateLimit()},
+        # 注入した障害からの復帰を実時間で待ちすぎないよう、リトライの待機は短くする
+        retry_policy=RetryPolicy(base_delay=0.1, max_delay=2.0, max_total_seconds=120.0, jitter=0.0),
+        audio_format=audio_format,
+        interjection_mode=interjection_mode,
+        **(project_kwargs or {})
+    )
+
+    names = [character.name for character in cast]
+    script_dir = project.root_path / "script"
+    width = len(str(max(scenarios - 1, 0)))
+    for i in range(scenarios):
+        # 登場人物が多い場合も、1本のシナリオに出てくるのは数人に絞る (実際の作品に近づける)
+        featured = rng.sample(names, min(len(names), rng.randint(2, 4))) if len(names) > 1 else names
+        text = synthetic_scenario(i, featured, scenario_chars, rng)
+        (script_dir / f"scenario_{i:0{width}d}.txt").write_text(text, encoding="utf-8")
+
+    project_file = project.root_path / "project.json"
+    if not save_project_config(project, project_file):
+        raise RuntimeError(f"合成プロジェクトの設定を保存できませんでした: {project_file}")
+    # CLIと同じ経路で読み込み直し、保存した設定がそのまま使われることを確かめる
+    loaded = load_project_from_file(project_file)
+    if loaded is None:
+        raise RuntimeError(f"合成プロジェクトの設定を読み込めませんでした: {project_file}")
+    return loaded
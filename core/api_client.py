@@ -1,41 +1,547 @@
 # api_client.py
 
+import asyncio
 import sys # エラー警告出力のためにsysをインポート
+import random
+import threading
+import time
 from google import genai
-from typing import List
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .async_runner import current_async_runner
+from .models import RateLimit, RetryPolicy
+
+# genai.Client の代わりに使うクライアントを作る関数。負荷試験用のモックバックエンド (core/mock_backend.py) が差し替える
+_client_factory: Optional[Callable[[str], Any]] = None
+
+def set_client_factory(factory: Optional[Callable[[str], Any]]):
+    """
+    GeminiApiClient が内部で使うクライアントの作り方を差し替える。factory はAPIキーを受け取り、
+    genai.Client と同じ models / aio.models を持つオブジェクトを返す。None を渡すと genai.Client に戻す。
+    """
+    global _client_factory
+    _client_factory = factory
+
+def estimate_tokens(text: str) -> int:
+    """
+    リクエストの消費トークン数を概算する。
+    日本語は概ね1文字1トークン前後になるため、文字数をそのまま目安として使う。
+    """
+    return len(text) if text else 0
+
+# classify_api_error が返すエラー種別
+ERROR_QUOTA = "quota"       # 429 / RESOURCE_EXHAUSTED: 利用枠の超過
+ERROR_AUTH = "auth"         # 401 / 403: APIキーが無効、または権限が無い
+ERROR_SERVER = "server"     # 5xx: サーバー側の一時的な障害
+ERROR_NETWORK = "network"   # 接続断・タイムアウト
+ERROR_FATAL = "fatal"       # 上記以外（リクエスト内容の不備など）
+
+def classify_api_error(error: Exception) -> str:
+    """
+    genai SDK などから送出された例外を、APIキーの管理やリトライ判定に使う種別に分類する。
+    SDKの例外クラスに依存しないよう、code / status 属性とメッセージから判定する。
+    """
+    code = getattr(error, "code", None)
+    status = str(getattr(error, "status", "") or "").upper()
+    message = str(error)
+
+    if code == 429 or status == "RESOURCE_EXHAUSTED" or "RESOURCE_EXHAUSTED" in message or "quota" in message.lower():
+        return ERROR_QUOTA
+    if code in (401, 403) or status in ("UNAUTHENTICATED", "PERMISSION_DENIED") \
+            or "API_KEY_INVALID" in message or "API key not valid" in message:
+        return ERROR_AUTH
+    if isinstance(code, int) and 500 <= code < 600:
+        return ERROR_SERVER
+    if status in ("UNAVAILABLE", "INTERNAL", "DEADLINE_EXCEEDED"):
+        return ERROR_SERVER
+    # httpx など、SDKが内部で使う通信ライブラリの例外も名前で拾う
+    if isinstance(error, (ConnectionError, TimeoutError)) \
+            or any(name in type(error).__name__ for name in ("Timeout", "Connect", "RemoteProtocol", "ReadError")):
+        return ERROR_NETWORK
+    return ERROR_FATAL
+
+class _TokenBucket:
+    """
+    1分あたりの上限を、連続的に補充されるバケットとして管理するクラス。
+    容量は1分ぶんの上限値で、空になっても経過時間に応じて少しずつ回復する。
+    """
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.refill_per_second = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+            self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """amount を消費できるようになるまでの秒数を返す（0なら即座に消費可能）。"""
+        self._refill(now)
+        # 1分ぶんの上限を超える要求は、満タンになるまで待てば通す
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def consume(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+    def remaining_ratio(self, now: float) -> float:
+        """残り枠の割合 (0.0〜1.0) を返す。"""
+        self._refill(now)
+        return max(0.0, self.tokens) / self.capacity
+
+class _KeyBudget:
+    """APIキー1つ・モデル1つぶんのRPM/TPMバケットの組。"""
+    def __init__(self, limit: RateLimit):
+        self.requests = _TokenBucket(limit.requests_per_minute) if limit.requests_per_minute else None
+        self.tokens = _TokenBucket(limit.tokens_per_minute) if limit.tokens_per_minute else None
+
+    def wait_time(self, estimated_tokens: int, now: float) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens is not None and estimated_tokens > 0:
+            wait = max(wait, self.tokens.wait_time(estimated_tokens, now))
+        return wait
+
+    def consume(self, estimated_tokens: int, now: float):
+        if self.requests is not None:
+            self.requests.consume(1, now)
+        if self.tokens is not None and estimated_tokens > 0:
+            self.tokens.consume(estimated_tokens, now)
+
+    def remaining_ratio(self, now: float) -> float:
+        """RPM/TPMのうち、より逼迫している方の残り枠の割合を返す。制限が無ければ 1.0。"""
+        ratios = [bucket.remaining_ratio(now) for bucket in (self.requests, self.tokens) if bucket is not None]
+        return min(ratios) if ratios else 1.0
+
+class _KeyHealth:
+    """APIキーごとの健全性。エラーが続いたキーは一定時間隔離する。"""
+    def __init__(self):
+        self.consecutive_failures = 0
+        self.quarantined_until = 0.0
+        self.last_error_kind: Optional[str] = None
 
 class ApiKeyManager:
-    def __init__(self, keys: List[str], default_index: int = 0):
+    # 隔離時間（秒）。連続して失敗するたびに倍になり、上限で頭打ちになる
+    QUOTA_COOLDOWN_SECONDS = 60.0
+    AUTH_COOLDOWN_SECONDS = 600.0
+    MAX_COOLDOWN_SECONDS = 3600.0
+
+    def __init__(
+            self,
+            keys: List[str],
+            default_index: int = 0,
+            rate_limits: Optional[Dict[str, RateLimit]] = None,
+            default_rate_limit: Optional[RateLimit] = None):
+        """
+        Args:
+            keys (List[str]): APIキーのリスト。
+            default_index (int): 最初に使うAPIキーのインデックス。
+            rate_limits (Dict[str, RateLimit]): モデル名ごとの、APIキー1つあたりの利用上限。
+            default_rate_limit (RateLimit): rate_limits に無いモデルに適用する利用上限。
+        """
         # 変数名を 'api_key_list' に統一
         self.api_key_list = [key for key in keys if key and not key.isspace()]
 
         if not self.api_key_list: # 変数名を修正
             raise ValueError("有効なAPIキーが一つも提供されていません。")
-        
+
         # default_index がリストの範囲内にあるかを確認
         if not (0 <= default_index < len(self.api_key_list)): # 変数名を修正
             # Warning: Default index is invalid. Starting from key #1. のメッセージを維持しつつ、sys.stderrを使用
             print(f"Warning: Default index {default_index} is invalid or out of range. Starting from key #1.", file=sys.stderr)
             default_index = 0 # 無効な場合は0にフォールバック
-        
+
         # ユーザーの指示に基づき、'default_api_key' 属性を追加
         self.default_api_key = self.api_key_list[default_index] # 変数名を修正
-        
+
         # get_next_key メソッドの既存の振る舞いを維持するため、current_index も引き続き保持
-        self.current_index = default_index 
-        
+        self.current_index = default_index
+
+        # (APIキー, モデル名) ごとの利用枠。複数スレッドから参照されるため Condition で保護する
+        self.rate_limits = rate_limits if rate_limits is not None else {}
+        self.default_rate_limit = default_rate_limit if default_rate_limit is not None else RateLimit()
+        self._budgets: Dict[Tuple[str, str], _KeyBudget] = {}
+        self._health: Dict[str, _KeyHealth] = {key: _KeyHealth() for key in self.api_key_list}
+        self._condition = threading.Condition()
+
         print(f"Default API key set to #{default_index}.")
-        
+
     def get_next_key(self) -> str:
-        # 変数名を 'api_key_list' に修正
-        key = self.api_key_list[self.current_index]
-        print(f"--- Using API Key #{self.current_index + 1} ---")
-        # 変数名を 'api_key_list' に修正
-        self.current_index = (self.current_index) % len(self.api_key_list)
-        return key
+        """
+        隔離中でないAPIキーをラウンドロビンで1つ返す（利用枠は確認しない）。
+        全てのキーが隔離中の場合は、最も早く隔離が解けるキーを返す。
+        """
+        with self._condition:
+            now = time.monotonic()
+            num_keys = len(self.api_key_list)
+            for offset in range(num_keys):
+                index = (self.current_index + offset) % num_keys
+                if self._health[self.api_key_list[index]].quarantined_until <= now:
+                    break
+            else:
+                index = min(range(num_keys), key=lambda i: self._health[self.api_key_list[i]].quarantined_until)
+
+            key = self.api_key_list[index]
+            print(f"--- Using API Key #{index + 1} ---")
+            # 次の呼び出しでは、今回のキーの次から探し始める
+            self.current_index = (index + 1) % num_keys
+            return key
+
+    def report_success(self, key: str):
+        """リクエストが成功したことを記録し、キーの連続失敗回数をリセットする。"""
+        with self._condition:
+            health = self._health.get(key)
+            if health is not None:
+                health.consecutive_failures = 0
+                health.last_error_kind = None
+
+    def report_error(self, key: str, error: Exception, cooldown: Optional[float] = None) -> str:
+        """
+        リクエストの失敗を記録する。利用枠超過や認証エラーの場合はキーを一定時間隔離する。
+        cooldown にサーバーが指定した待機秒数を渡すと、その時間だけ隔離する。
+        分類したエラー種別を返す。
+        """
+        kind = classify_api_error(error)
+        if kind not in (ERROR_QUOTA, ERROR_AUTH):
+            return kind
+
+        with self._condition:
+            health = self._health.get(key)
+            if health is None:
+                return kind
+
+            health.consecutive_failures += 1
+            health.last_error_kind = kind
+            if cooldown is None:
+                base = self.QUOTA_COOLDOWN_SECONDS if kind == ERROR_QUOTA else self.AUTH_COOLDOWN_SECONDS
+                cooldown = min(base * (2 ** (health.consecutive_failures - 1)), self.MAX_COOLDOWN_SECONDS)
+            health.quarantined_until = max(health.quarantined_until, time.monotonic() + cooldown)
+
+            index = self.api_key_list.index(key)
+            print(f"--- API Key #{index + 1} を{cooldown:.0f}秒間隔離します ({kind}: {error}) ---", file=sys.stderr)
+            self._condition.notify_all()
+        return kind
+
+    def is_quarantined(self, key: str) -> bool:
+        """キーが隔離中かどうかを返す。"""
+        with self._condition:
+            health = self._health.get(key)
+            return health is not None and health.quarantined_until > time.monotonic()
+
+    def get_key_status(self) -> List[Dict[str, object]]:
+        """各APIキーの状態（隔離中かどうか、残り隔離秒数、直近のエラー種別）を返す。"""
+        with self._condition:
+            now = time.monotonic()
+            return [
+                {
+                    "index": index + 1,
+                    "quarantined": self._health[key].quarantined_until > now,
+                    "cooldown_remaining": max(0.0, self._health[key].quarantined_until - now),
+                    "last_error": self._health[key].last_error_kind,
+                }
+                for index, key in enumerate(self.api_key_list)
+            ]
+
+    def _get_budget(self, key: str, model_name: str) -> _KeyBudget:
+        budget = self._budgets.get((key, model_name))
+        if budget is None:
+            limit = self.rate_limits.get(model_name, self.default_rate_limit)
+            budget = _KeyBudget(limit)
+            self._budgets[(key, model_name)] = budget
+        return budget
+
+    def _try_acquire(self, model_name: str, estimated_tokens: int, now: float) -> Tuple[Optional[str], Optional[float]]:
+        """
+        利用枠に余裕のあるキーを1つ確保できれば (キー, None) を、できなければ (None, 最も早く枠が空くまでの秒数) を返す。
+        self._condition を取得した状態で呼ぶこと。
+        """
+        shortest_wait = None
+        num_keys = len(self.api_key_list)
+        candidates: List[int] = []
+        weights: List[float] = []
+
+        for offset in range(num_keys):
+            index = (self.current_index + offset) % num_keys
+            key = self.api_key_list[index]
+
+            quarantine_wait = self._health[key].quarantined_until - now
+            if quarantine_wait > 0:
+                wait = quarantine_wait
+            else:
+                budget = self._get_budget(key, model_name)
+                wait = budget.wait_time(estimated_tokens, now)
+                if wait <= 0:
+                    candidates.append(index)
+                    # 残り枠が多いキーほど選ばれやすくする（枠が尽きかけでも0にはしない）
+                    weights.append(max(budget.remaining_ratio(now), 0.01))
+                    continue
+
+            if shortest_wait is None or wait < shortest_wait:
+                shortest_wait = wait
+
+        if not candidates:
+            return None, shortest_wait
+
+        if max(weights) - min(weights) < 1e-6:
+            # 残り枠に差が無ければ、純粋なラウンドロビンで次のキーを使う
+            index = candidates[0]
+        else:
+            index = random.choices(candidates, weights=weights, k=1)[0]
+        key = self.api_key_list[index]
+        self._get_budget(key, model_name).consume(estimated_tokens, now)
+        self.current_index = (index + 1) % num_keys
+        print(f"--- Using API Key #{index + 1} ({model_name}) ---")
+        return key, None
+
+    def acquire_key(
+            self,
+            model_name: str,
+            estimated_tokens: int = 0,
+            stop_event: Optional[threading.Event] = None,
+            timeout: Optional[float] = None) -> Optional[str]:
+        """
+        指定モデルのRPM/TPM枠に余裕があるAPIキーを1つ確保して返す。
+        隔離中のキーは使わず、枠に余裕のあるキーの中から残り枠の割合に応じた重みで選ぶ。
+        どのキーにも余裕がない場合は、最も早く枠が空くまで待機する。
+        stop_event がセットされた場合や timeout を超えた場合は None を返す。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        announced = False
+
+        with self._condition:
+            while True:
+                if stop_event is not None and stop_event.is_set():
+                    return None
+
+                now = time.monotonic()
+                key, shortest_wait = self._try_acquire(model_name, estimated_tokens, now)
+                if key is not None:
+                    return key
+
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        return None
+                    shortest_wait = min(shortest_wait, remaining)
+
+                if not announced:
+                    print(f"--- {model_name}: 全APIキーの利用枠が不足しています。{shortest_wait:.1f}秒待機します ---")
+                    announced = True
+
+                # 中断要求に素早く反応できるよう、待機は短い間隔に区切る
+                self._condition.wait(min(shortest_wait, 0.5) if stop_event is not None else shortest_wait)
+
+    async def acquire_key_async(
+            self,
+            model_name: str,
+            estimated_tokens: int = 0,
+            stop_event: Optional[threading.Event] = None) -> Optional[str]:
+        """
+        acquire_key の非同期版。枠が空くまでの待機はスレッドを止めずに asyncio.sleep で行うため、
+        1つのイベントループ上で多数のリクエストが同時に枠を待てる。stop_event がセットされた場合は None を返す。
+        """
+        announced = False
+        while True:
+            if stop_event is not None and stop_event.is_set():
+                return None
+
+            with self._condition:
+                key, shortest_wait = self._try_acquire(model_name, estimated_tokens, time.monotonic())
+            if key is not None:
+                return key
+
+            if not announced:
+                print(f"--- {model_name}: 全APIキーの利用枠が不足しています。{shortest_wait:.1f}秒待機します ---")
+                announced = True
+            # 隔離の解除や他の利用者の枠の返却に気付けるよう、待機は短い間隔に区切る
+            await asyncio.sleep(min(shortest_wait, 0.5))
 
 class GeminiApiClient:
-    def __init__(self, api_key, model_name):
+    def __init__(
+            self,
+            api_key,
+            model_name,
+            key_manager: Optional[ApiKeyManager] = None,
+            retry_policy: Optional[RetryPolicy] = None):
         self.api_key = api_key
         self.model_name = model_name
-        self.client = genai.Client(api_key=api_key)
\ No newline at end of file
+        # 成否を報告する先。設定されていれば、エラーの続くキーが自動で隔離される
+        self.key_manager = key_manager
+        # 一時的なエラー (429 / 5xx / 通信断) のリトライ方針
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.client = _client_factory(api_key) if _client_factory is not None else genai.Client(api_key=api_key)
+        # このクライアントを作ったプール。別のキーに取り替えるときは、プールのクライアントを使い回す
+        self.pool: Optional["GeminiApiClientPool"] = None
+
+    def report_success(self):
+        if self.key_manager is not None:
+            self.key_manager.report_success(self.api_key)
+
+    def report_error(self, error: Exception, cooldown: Optional[float] = None) -> str:
+        """エラーを ApiKeyManager に報告し、分類したエラー種別を返す。"""
+        if self.key_manager is not None:
+            return self.key_manager.report_error(self.api_key, error, cooldown)
+        return classify_api_error(error)
+
+    def _for_key(self, api_key: str, model_name: Optional[str] = None) -> "GeminiApiClient":
+        """同じ設定で、別のAPIキー (と model_name を指定した場合は別のモデル) のクライアントを返す。"""
+        model_name = model_name or self.model_name
+        if self.pool is not None:
+            return self.pool.get(api_key, model_name)
+        return GeminiApiClient(api_key, model_name, key_manager=self.key_manager, retry_policy=self.retry_policy)
+
+    def for_model(self, model_name: Optional[str]) -> "GeminiApiClient":
+        """
+        同じAPIキーで model_name を使うクライアントを返す (同じモデルなら自分自身)。
+        リトライ時のキーの取り替えや利用枠の確保が、実際に呼び出すモデルに対して行われるようにする。
+        """
+        if not model_name or model_name == self.model_name:
+            return self
+        return self._for_key(self.api_key, model_name)
+
+    def replacement(
+            self,
+            estimated_tokens: int = 0,
+            stop_event: Optional[threading.Event] = None) -> Optional["GeminiApiClient"]:
+        """
+        リトライの前に呼び、このクライアントのキーが隔離されていれば、利用枠を確保した別のキーのクライアントを返す。
+        隔離されていなければ自分自身を返す。どのキーも隔離中であれば、最も早く使えるようになるまで待つ。
+        中断された場合は None を返す。
+        """
+        if self.key_manager is None or not self.key_manager.is_quarantined(self.api_key):
+            return self
+        api_key = self.key_manager.acquire_key(self.model_name, estimated_tokens, stop_event)
+        if api_key is None:
+            return None
+        return self._for_key(api_key)
+
+    async def replacement_async(
+            self,
+            estimated_tokens: int = 0,
+            stop_event: Optional[threading.Event] = None) -> Optional["GeminiApiClient"]:
+        """replacement の非同期版 (ApiKeyManager.acquire_key_async)。"""
+        if self.key_manager is None or not self.key_manager.is_quarantined(self.api_key):
+            return self
+        api_key = await self.key_manager.acquire_key_async(self.model_name, estimated_tokens, stop_event)
+        if api_key is None:
+            return None
+        return self._for_key(api_key)
+
+    def close(self):
+        """
+        クライアントが持つHTTP接続を閉じる。閉じた後は使えない。
+        非同期の接続は、それを使ったイベントループ (共有の AsyncRunner) がまだ動いていればその上で閉じる。
+        """
+        aio = getattr(self.client, "aio", None)
+        runner = current_async_runner()
+        if runner is not None and hasattr(aio, "aclose"):
+            try:
+                runner.run(aio.aclose(), timeout=5.0)
+            except Exception as e:
+                print(f"警告: 非同期APIクライアントを閉じられませんでした ({self.model_name}): {e}", file=sys.stderr)
+        close = getattr(self.client, "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception as e:
+                print(f"警告: APIクライアントを閉じられませんでした ({self.model_name}): {e}", file=sys.stderr)
+
+class GeminiApiClientPool:
+    """
+    (APIキー, モデル名) ごとに GeminiApiClient を1つだけ作って使い回すプール。
+    genai.Client は内部にHTTPの接続を持つため、使い回せばリクエストごとの接続の確立が不要になる。
+    クライアントは状態を書き換えないため、同じものを複数のスレッド (Worker) に同時に渡してよい。
+    """
+    def __init__(self, key_manager: ApiKeyManager, retry_policy: Optional[RetryPolicy] = None):
+        self.key_manager = key_manager
+        self.retry_policy = retry_policy
+        self._clients: Dict[Tuple[str, str], GeminiApiClient] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def get(self, api_key: str, model_name: str) -> GeminiApiClient:
+        """指定したキーとモデルのクライアントを返す。まだ無ければ作る。"""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("GeminiApiClientPool は既に閉じられています。")
+            client = self._clients.get((api_key, model_name))
+            if client is None:
+                client = GeminiApiClient(
+                    api_key,
+                    model_name,
+                    key_manager=self.key_manager,
+                    retry_policy=self.retry_policy
+                )
+                client.pool = self
+                self._clients[(api_key, model_name)] = client
+            return client
+
+    def acquire(
+            self,
+            model_name: str,
+            estimated_tokens: int = 0,
+            stop_event: Optional[threading.Event] = None) -> Optional[GeminiApiClient]:
+        """利用枠に余裕のあるAPIキーを確保し (ApiKeyManager.acquire_key)、そのキーのクライアントを返す。中断された場合は None。"""
+        api_key = self.key_manager.acquire_key(model_name, estimated_tokens, stop_event)
+        if api_key is None:
+            return None
+        return self.get(api_key, model_name)
+
+    async def acquire_async(
+            self,
+            model_name: str,
+            estimated_tokens: int = 0,
+            stop_event: Optional[threading.Event] = None) -> Optional[GeminiApiClient]:
+        """acquire の非同期版 (ApiKeyManager.acquire_key_async)。"""
+        api_key = await self.key_manager.acquire_key_async(model_name, estimated_tokens, stop_event)
+        if api_key is None:
+            return None
+        return self.get(api_key, model_name)
+
+    def prewarm(self, model_names: Iterable[str], background: bool = True) -> Optional[threading.Thread]:
+        """
+        すべてのAPIキーについて、model_names のクライアントを先に作っておく。
+        background が True の場合は別スレッドで作り、そのスレッドを返す (プロジェクトを開く操作を待たせない)。
+        """
+        pairs = [
+            (api_key, model_name)
+            for model_name in dict.fromkeys(name for name in model_names if name)
+            for api_key in self.key_manager.api_key_list
+        ]
+
+        def warm():
+            for api_key, model_name in pairs:
+                if self._closed:
+                    return
+                try:
+                    self.get(api_key, model_name)
+                except Exception as e:
+                    if not self._closed:
+                        print(f"警告: APIクライアントを準備できませんでした ({model_name}): {e}", file=sys.stderr)
+                    return
+
+        if not background:
+            warm()
+            return None
+        thread = threading.Thread(target=warm, name="api-client-prewarm", daemon=True)
+        thread.start()
+        return thread
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._clients)
+
+    def close(self):
+        """すべてのクライアントを閉じる。以降の get / acquire はエラーになる。"""
+        with self._lock:
+            self._closed = True
+            clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            client.close()
@@ -0,0 +1,152 @@
+# AiRadioDramaCreator/core/async_runner.py
+
+import asyncio
+import concurrent.futures
+import threading
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Coroutine,
+    Iterable,
+    List,
+    Optional,
+    TypeVar
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+class AsyncRunner:
+    """
+    専用のスレッドでイベントループを1つ動かし続け、同期コード (QtのWorkerやCLI) からコルーチンを実行するためのクラス。
+    非同期のAPI呼び出しはすべてこのループ上で動くため、同時に数百件のリクエストを待っていてもスレッドは1本で済む。
+    """
+    def __init__(self, name: str = "async-runner"):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name=name, daemon=True)
+        self._closed = False
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    @property
+    def is_running(self) -> bool:
+        return not self._closed and self._thread.is_alive()
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> "concurrent.futures.Future[T]":
+        """コルーチンをループに投入し、結果を受け取るための Future を返す (完了を待たない)。"""
+        if self._closed:
+            coro.close()
+            raise RuntimeError("AsyncRunner は既に終了しています。")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(
+            self,
+            coro: Coroutine[Any, Any, T],
+            stop_event: Optional[threading.Event] = None,
+            timeout: Optional[float] = None) -> T:
+        """
+        コルーチンをループ上で実行し、完了まで呼び出し元のスレッドで待って結果を返す。
+        stop_event がセットされた場合や timeout を超えた場合は、コルーチンをキャンセルして
+        concurrent.futures.CancelledError / TimeoutError を送出する。
+        """
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("AsyncRunner.run はループのスレッドからは呼べません。")
+
+        future = self.submit(coro)
+        if stop_event is None:
+            try:
+                return future.result(timeout)
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+                raise
+
+        # 中断要求に素早く反応できるよう、待機は短い間隔に区切る
+        waited = 0.0
+        while True:
+            try:
+                return future.result(0.2)
+            except concurrent.futures.TimeoutError:
+                waited += 0.2
+                if stop_event.is_set():
+                    future.cancel()
+                    raise concurrent.futures.CancelledError()
+                if timeout is not None and waited >= timeout:
+                    future.cancel()
+                    raise
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """ループに残っているタスクをキャンセルしてから、ループとスレッドを終了する。"""
+        if self._closed:
+            return
+        self._closed = True
+
+        async def cancel_pending():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            asyncio.run_coroutine_threadsafe(cancel_pending(), self._loop).result(timeout)
+        except Exception as e:
+            print(f"警告: 非同期タスクの終了を待てませんでした: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._loop.close()
+
+async def gather_limited(
+        func: Callable[[T], Awaitable[R]],
+        items: Iterable[T],
+        max_concurrency: int) -> List[R]:
+    """
+    items の各要素に func を適用したコルーチンを、同時に最大 max_concurrency 件ずつ実行し、入力の順に結果を返す。
+    1つが例外を送出した場合は、他をキャンセルしてその例外を送出する。
+    """
+    semaphore = asyncio.Semaphore(max(1, int(max_concurrency)))
+
+    async def run_one(item: T) -> R:
+        async with semaphore:
+            return await func(item)
+
+    tasks = [asyncio.ensure_future(run_one(item)) for item in items]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+# アプリ全体で共有するランナー。最初に使われたときに作る
+_shared_runner: Optional[AsyncRunner] = None
+_shared_runner_lock = threading.Lock()
+
+def get_async_runner() -> AsyncRunner:
+    """アプリ全体で共有する AsyncRunner を返す (無ければ作る)。"""
+    global _shared_runner
+    with _shared_runner_lock:
+        if _shared_runner is None or not _shared_runner.is_running:
+            _shared_runner = AsyncRunner()
+        return _shared_runner
+
+def current_async_runner() -> Optional[AsyncRunner]:
+    """動いている共有の AsyncRunner を返す。無い場合は作らずに None を返す。"""
+    with _shared_runner_lock:
+        return _shared_runner if _shared_runner is not None and _shared_runner.is_running else None
+
+def shutdown_async_runner():
+    """共有の AsyncRunner を終了する。アプリの終了時に呼ぶ。"""
+    global _shared_runner
+    with _shared_runner_lock:
+        runner, _shared_runner = _shared_runner, None
+    if runner is not None:
+        runner.close()
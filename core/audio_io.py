@@ -0,0 +1,311 @@
+# AiRadioDramaCreator/core/audio_io.py
+
+import os
+import queue
+import shutil
+import struct
+import subprocess
+import threading
+import uuid
+import wave
+from pathlib import Path
+from typing import (
+    Dict,
+    Optional,
+    Tuple
+)
+
+DEFAULT_SAMPLE_RATE = 24000
+DEFAULT_BITS_PER_SAMPLE = 16
+
+def parse_audio_mime_type(mime_type: str) -> Dict[str, int]:
+    """'audio/L16;rate=24000' のようなMIMEタイプから、量子化ビット数とサンプルレートを取り出す。"""
+    bits_per_sample = DEFAULT_BITS_PER_SAMPLE
+    rate = DEFAULT_SAMPLE_RATE
+
+    for param in (mime_type or "").split(";"):
+        param = param.strip()
+        if param.lower().startswith("rate="):
+            try:
+                rate = int(param.split("=", 1)[1])
+            except (ValueError, IndexError):
+                pass
+        elif param.startswith("audio/L"):
+            try:
+                bits_per_sample = int(param.split("L", 1)[1])
+            except (ValueError, IndexError):
+                pass
+
+    return {"bits_per_sample": bits_per_sample, "rate": rate}
+
+def build_wav_header(data_size: int, sample_rate: int, bits_per_sample: int, num_channels: int = 1) -> bytes:
+    """PCMデータに付与する44バイトのWAVヘッダを生成する。"""
+    block_align = num_channels * (bits_per_sample // 8)
+    byte_rate = sample_rate * block_align
+
+    # http://soundfile.sapp.org/doc/WaveFormat/
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE", b"fmt ",
+        16, 1, num_channels, sample_rate,
+        byte_rate, block_align, bits_per_sample,
+        b"data", data_size
+    )
+
+def pcm_to_wav(pcm: bytes, sample_rate: int, bits_per_sample: int, num_channels: int = 1) -> bytes:
+    return build_wav_header(len(pcm), sample_rate, bits_per_sample, num_channels) + pcm
+
+def read_wav(wav_file: Path) -> Tuple[bytes, int, int]:
+    """WAVファイルを読み込み、(PCMデータ, サンプルレート, 量子化ビット数) を返す。"""
+    with wave.open(str(wav_file), "rb") as wav:
+        return wav.readframes(wav.getnframes()), wav.getframerate(), wav.getsampwidth() * 8
+
+def write_wav(wav_file: Path, pcm: bytes, sample_rate: int, bits_per_sample: int):
+    wav_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(wav_file, "wb") as f:
+        f.write(pcm_to_wav(pcm, sample_rate, bits_per_sample))
+
+class StreamingWavWriter:
+    """
+    届いた音声チャンクをその場で一時ファイルに書き込むWAVライター。
+    先にサイズ0のヘッダを書いておき、close() でRIFF/dataのサイズを書き換えてから
+    出力先へ名前を変える。音声全体をメモリに保持しないため、長さに関わらず使用メモリは一定になる。
+    """
+    def __init__(
+            self,
+            output_path: Path,
+            sample_rate: int = DEFAULT_SAMPLE_RATE,
+            bits_per_sample: int = DEFAULT_BITS_PER_SAMPLE,
+            num_channels: int = 1,
+            write_header: bool = True):
+        """
+        Args:
+            output_path (Path): 完成したファイルの保存先。
+            write_header (bool): False の場合はヘッダを付けずにそのまま書き込む (APIがWAVなどのコンテナ形式で返す場合)。
+        """
+        self.output_path = Path(output_path)
+        self.sample_rate = sample_rate
+        self.bits_per_sample = bits_per_sample
+        self.num_channels = num_channels
+        self.write_header = write_header
+        self.data_size = 0
+
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        # 同じフォルダに作ることで、最後の名前の変更がアトミックになる
+        self._tmp_path = self.output_path.parent / f".{self.output_path.name}.{uuid.uuid4().hex}.tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._write_placeholder_header()
+
+    def _write_placeholder_header(self):
+        if self.write_header:
+            self._file.write(build_wav_header(0, self.sample_rate, self.bits_per_sample, self.num_channels))
+
+    def write(self, data: bytes):
+        self._file.write(data)
+        self.data_size += len(data)
+
+    def reset(self):
+        """書き込んだ音声を破棄する。ストリームを最初から受け直す場合に使う。"""
+        self._file.seek(0)
+        self._file.truncate()
+        self.data_size = 0
+        self._write_placeholder_header()
+
+    def close(self) -> Path:
+        """ヘッダのサイズを確定させてファイルを閉じ、出力先に移動してそのパスを返す。"""
+        try:
+            if self.write_header:
+                self._file.seek(0)
+                self._file.write(build_wav_header(self.data_size, self.sample_rate, self.bits_per_sample, self.num_channels))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        finally:
+            self._file.close()
+        os.replace(self._tmp_path, self.output_path)
+        return self.output_path
+
+    def abort(self):
+        """書きかけの一時ファイルを削除する。出力先のファイルには触れず、close() 後に呼んでも何もしない。"""
+        if not self._file.closed:
+            self._file.close()
+        try:
+            self._tmp_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "StreamingWavWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        elif not self._file.closed:
+            self.close()
+        return False
+
+# 圧縮形式ごとの ffmpeg の出力設定
+ENCODER_ARGS = {
+    "mp3": ["-codec:a", "libmp3lame", "-q:a", "2", "-f", "mp3"],
+    "opus": ["-codec:a", "libopus", "-b:a", "64k", "-f", "ogg"],
+}
+
+class FfmpegEncoder:
+    """
+    PCMを ffmpeg の標準入力へ流し込み、音声生成と並行してMP3/Opusに圧縮するエンコーダー。
+    書き込みは専用スレッドが行うため、呼び出し側 (ストリームの受信) は ffmpeg の処理を待たない。
+    キューが一杯になったときだけ write() が待たされる (バックプレッシャー)。
+    """
+    def __init__(
+            self,
+            output_path: Path,
+            sample_rate: int,
+            bits_per_sample: int,
+            audio_format: str = "mp3",
+            num_channels: int = 1,
+            max_pending_chunks: int = 64):
+        if audio_format not in ENCODER_ARGS:
+            raise ValueError(f"未対応の圧縮形式です: {audio_format} (対応形式: {', '.join(ENCODER_ARGS)})")
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise FileNotFoundError("ffmpeg not found. Please install ffmpeg and ensure it's in your system's PATH.")
+
+        self.output_path = Path(output_path)
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp_path = self.output_path.parent / f".{self.output_path.name}.{uuid.uuid4().hex}.tmp"
+
+        sample_format = "u8" if bits_per_sample == 8 else f"s{bits_per_sample}le"
+        command = [
+            ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+            "-f", sample_format, "-ar", str(sample_rate), "-ac", str(num_channels), "-i", "pipe:0",
+            *ENCODER_ARGS[audio_format],
+            str(self._tmp_path)
+        ]
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        self._queue: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=max_pending_chunks)
+        self._error: Optional[Exception] = None
+        self._thread = threading.Thread(target=self._feed, name="ffmpeg-feed", daemon=True)
+        self._thread.start()
+
+    def _feed(self):
+        while True:
+            data = self._queue.get()
+            if data is None:
+                break
+            # ffmpeg が先に終了した場合も、write() が詰まらないようキューは読み捨てる
+            if self._error is not None:
+                continue
+            try:
+                self._process.stdin.write(data)
+            except OSError as e:
+                self._error = e
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+
+    def write(self, data: bytes):
+        self._queue.put(data)
+
+    def close(self) -> Path:
+        """残りのPCMを流し切ってエンコードの完了を待ち、出力先に移動してそのパスを返す。"""
+        self._queue.put(None)
+        self._thread.join()
+        stderr = self._process.stderr.read().decode("utf-8", errors="replace").strip()
+        return_code = self._process.wait()
+        self._process.stderr.close()
+
+        if return_code != 0 or self._error is not None:
+            self._remove_tmp()
+            raise RuntimeError(f"ffmpeg によるエンコードに失敗しました (終了コード {return_code}): {stderr or self._error}")
+
+        os.replace(self._tmp_path, self.output_path)
+        return self.output_path
+
+    def abort(self):
+        """エンコードを打ち切り、書きかけの一時ファイルを削除する。"""
+        if self._process.poll() is None:
+            self._process.kill()
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._process.wait()
+        if self._process.stderr and not self._process.stderr.closed:
+            self._process.stderr.close()
+        self._remove_tmp()
+
+    def _remove_tmp(self):
+        try:
+            self._tmp_path.unlink()
+        except FileNotFoundError:
+            pass
+
+class EncodingWavWriter(StreamingWavWriter):
+    """
+    WAVへの書き込みと同時に、同じチャンクを FfmpegEncoder に渡して圧縮ファイルも作るライター。
+    ffmpeg が使えない場合はWAVだけを書き込む。
+    """
+    def __init__(
+            self,
+            output_path: Path,
+            sample_rate: int = DEFAULT_SAMPLE_RATE,
+            bits_per_sample: int = DEFAULT_BITS_PER_SAMPLE,
+            num_channels: int = 1,
+            write_header: bool = True,
+            audio_format: Optional[str] = "mp3"):
+        """
+        Args:
+            audio_format (str): 圧縮形式 ("mp3" / "opus")。None または "wav" の場合は圧縮しない。
+        """
+        super().__init__(output_path, sample_rate, bits_per_sample, num_channels, write_header)
+        # コンテナ形式 (write_header=False) のデータはPCMとして扱えないため圧縮しない
+        self.audio_format = audio_format if write_header and audio_format not in (None, "wav") else None
+        self.encoded_path: Optional[Path] = None
+        self._encoder: Optional[FfmpegEncoder] = None
+        self._start_encoder()
+
+    def _start_encoder(self):
+        if self.audio_format is None:
+            return
+        try:
+            self._encoder = FfmpegEncoder(
+                self.output_path.with_suffix(f".{self.audio_format}"),
+                self.sample_rate, self.bits_per_sample, self.audio_format, self.num_channels
+            )
+        except (FileNotFoundError, ValueError) as e:
+            print(f"警告: {self.audio_format} へのエンコードを行いません: {e}")
+            self.audio_format = None
+
+    def write(self, data: bytes):
+        super().write(data)
+        if self._encoder is not None:
+            self._encoder.write(data)
+
+    def reset(self):
+        super().reset()
+        # ffmpeg の入力は巻き戻せないため、エンコーダーごと作り直す
+        if self._encoder is not None:
+            self._encoder.abort()
+            self._encoder = None
+            self._start_encoder()
+
+    def close(self) -> Path:
+        """WAVを確定させ、エンコードの完了を待つ。圧縮ファイルのパスは encoded_path に入る。"""
+        try:
+            wav_path = super().close()
+        except Exception:
+            self.abort()
+            raise
+
+        if self._encoder is not None:
+            encoder, self._encoder = self._encoder, None
+            try:
+                self.encoded_path = encoder.close()
+            except RuntimeError as e:
+                print(f"警告: {e}")
+        return wav_path
+
+    def abort(self):
+        super().abort()
+        if self._encoder is not None:
+            self._encoder.abort()
+            self._encoder = None
@@ -0,0 +1,433 @@
+# AiRadioDramaCreator/core/cache.py
+
+import hashlib
+import json
+import os
+import random
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from .audio_io import read_wav, pcm_to_wav
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple
+)
+
+# プロジェクトのルート直下に作るキャッシュ用フォルダ
+CACHE_DIR_NAME = ".cache"
+
+# 合計サイズの見積もりが上限内でも、この回数の保存ごとにフォルダを走査し直す
+# (同じフォルダを使う別のインスタンスやプロセスの書き込みで、見積もりがずれても追いつけるようにする)
+PRUNE_RESCAN_PUTS = 64
+# 保存時に上限を超えた場合は、上限のこの割合まで減らす (上限付近で保存のたびに走査し直さないようにする)
+PRUNE_LOW_WATER = 0.9
+
+def hash_key(payload: Any) -> str:
+    """JSONに変換可能な値から、内容に対応するSHA-256のキーを生成する。"""
+    serialized = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+class LruDirectoryCache:
+    """
+    1エントリ = 1フォルダとしてディスクに保存する、容量制限付きのキャッシュ。
+    エントリのフォルダの更新日時を最終利用日時として扱い、容量を超えたら古いものから削除する。
+    合計サイズはメモリ上で数えておき、保存のたびにフォルダ全体を走査するのは上限を超えたときだけにする。
+    """
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # 合計サイズの見積もり。最初に走査するまでは分からないため None
+        self._total_bytes: Optional[int] = None
+        self._puts_since_scan = 0
+
+    def _entry_dir(self, key: str) -> Path:
+        # 1フォルダにエントリが集中しないよう、キーの先頭2文字で振り分ける
+        return self.cache_dir / key[:2] / key
+
+    def _touch(self, entry_dir: Path):
+        now = time.time()
+        try:
+            os.utime(entry_dir, (now, now))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _entry_size(entry_dir: Path) -> int:
+        try:
+            return sum(f.stat().st_size for f in entry_dir.iterdir() if f.is_file())
+        except OSError:
+            return 0
+
+    def _iter_entries(self) -> List[Tuple[Path, float, int]]:
+        """(エントリのフォルダ, 最終利用日時, サイズ) のリストを返す。"""
+        entries = []
+        if not self.cache_dir.is_dir():
+            return entries
+        for shard in self.cache_dir.iterdir():
+            if not shard.is_dir():
+                continue
+            for entry_dir in shard.iterdir():
+                # 書き込み途中の一時フォルダは対象外
+                if not entry_dir.is_dir() or entry_dir.name.startswith("."):
+                    continue
+                try:
+                    entries.append((entry_dir, entry_dir.stat().st_mtime, self._entry_size(entry_dir)))
+                except OSError:
+                    continue
+        return entries
+
+    def get_entry(self, key: str) -> Optional[Path]:
+        """キーに対応するエントリのフォルダを返す。見つからなければ None。"""
+        entry_dir = self._entry_dir(key)
+        if entry_dir.is_dir():
+            self._touch(entry_dir)
+            return entry_dir
+        return None
+
+    def put_files(self, key: str, files: Dict[str, Path]) -> Optional[Path]:
+        """
+        {保存名: 元ファイル} をエントリとしてコピーする。
+        一時フォルダに書き込んでから名前を変えるため、読み手が書きかけのエントリを見ることはない。
+        """
+        return self._put(key, lambda tmp_dir: [shutil.copy2(src, tmp_dir / name) for name, src in files.items()])
+
+    def put_data(self, key: str, data: Dict[str, bytes]) -> Optional[Path]:
+        """{保存名: バイト列} をエントリとして書き込む。"""
+        return self._put(key, lambda tmp_dir: [(tmp_dir / name).write_bytes(value) for name, value in data.items()])
+
+    def _put(self, key: str, write_entry: Callable[[Path], Any]) -> Optional[Path]:
+        entry_dir = self._entry_dir(key)
+        entry_dir.parent.mkdir(parents=True, exist_ok=True)
+        tmp_dir = entry_dir.parent / f".{key}.{uuid.uuid4().hex}.tmp"
+        try:
+            tmp_dir.mkdir()
+            write_entry(tmp_dir)
+            added = self._entry_size(tmp_dir)
+            with self._lock:
+                if entry_dir.exists():
+                    added -= self._entry_size(entry_dir)
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                os.replace(tmp_dir, entry_dir)
+                self._touch(entry_dir)
+                if self._total_bytes is not None:
+                    self._total_bytes += added
+                self._puts_since_scan += 1
+                needs_prune = (
+                    self._total_bytes is None
+                    or self._total_bytes > self.max_bytes
+                    or self._puts_since_scan >= PRUNE_RESCAN_PUTS
+                )
+        except OSError as e:
+            print(f"警告: キャッシュへの保存に失敗しました ({key[:12]}...): {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return None
+
+        if needs_prune:
+            with self._lock:
+                over_limit = self._total_bytes is not None and self._total_bytes > self.max_bytes
+            self.prune(int(self.max_bytes * PRUNE_LOW_WATER) if over_limit else None)
+        return entry_dir
+
+    def stats(self) -> Dict[str, Any]:
+        """エントリ数・合計サイズ・容量上限・最古/最新の利用日時を返す。"""
+        entries = self._iter_entries()
+        last_used = [mtime for _, mtime, _ in entries]
+        return {
+            "path": str(self.cache_dir),
+            "entries": len(entries),
+            "total_bytes": sum(size for _, _, size in entries),
+            "max_bytes": self.max_bytes,
+            "oldest": min(last_used) if last_used else None,
+            "newest": max(last_used) if last_used else None,
+        }
+
+    def prune(self, max_bytes: Optional[int] = None) -> Tuple[int, int]:
+        """
+        合計サイズが max_bytes (省略時は容量上限) 以下になるまで、最終利用日時の古いエントリから削除する。
+        (削除したエントリ数, 解放したバイト数) を返す。
+        """
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        with self._lock:
+            entries = sorted(self._iter_entries(), key=lambda entry: entry[1])
+            total = sum(size for _, _, size in entries)
+            removed = 0
+            freed = 0
+            for entry_dir, _, size in entries:
+                if total <= limit:
+                    break
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+                freed += size
+                removed += 1
+            self._total_bytes = total
+            self._puts_since_scan = 0
+        return removed, freed
+
+    def clear(self) -> Tuple[int, int]:
+        """全エントリを削除する。"""
+        return self.prune(max_bytes=0)
+
+    def remove(self, key: str) -> bool:
+        """キーに対応するエントリを削除する。削除した場合は True。"""
+        entry_dir = self._entry_dir(key)
+        with self._lock:
+            if not entry_dir.is_dir():
+                return False
+            size = self._entry_size(entry_dir)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            if self._total_bytes is not None:
+                self._total_bytes = max(0, self._total_bytes - size)
+        return True
+
+class AudioCache(LruDirectoryCache):
+    """
+    SSML・話者とボイスの対応・モデル名・temperature・圧縮形式が同じなら、同じ音声が得られるものとして
+    生成済みのWAV/MP3/Opusを再利用するためのキャッシュ。
+    """
+    AUDIO_SUFFIXES = (".wav", ".mp3", ".opus")
+
+    @classmethod
+    def for_project(cls, project) -> Optional["AudioCache"]:
+        """プロジェクトの設定から、ルート直下の .cache/audio を使うキャッシュを生成する。"""
+        if project is None or project.root_path is None:
+            return None
+        max_bytes = int(project.audio_cache_max_mb * 1024 * 1024)
+        return cls(project.root_path / CACHE_DIR_NAME / "audio", max_bytes)
+
+    @staticmethod
+    def make_key(ssml_text: str, speakers: Dict[str, str], model_name: str, temperature: float, audio_format: Optional[str] = "mp3") -> str:
+        return hash_key({
+            "ssml": ssml_text,
+            "speakers": speakers,
+            "model": model_name,
+            "temperature": temperature,
+            "format": audio_format,
+        })
+
+    def restore(self, key: str, output_dir: Path, basename: str, audio_format: Optional[str] = None) -> Optional[Path]:
+        """
+        キャッシュ済みのWAVと audio_format ("mp3" / "opus") の圧縮ファイルを output_dir/basename.* にコピーする。
+        キャッシュに無ければ None、あれば圧縮ファイル (無ければ WAV) のパスを返す。
+        他の形式のファイルはコピーしない (別の設定で作った古いファイルで上書きしないようにする)。
+        """
+        entry_dir = self.get_entry(key)
+        if entry_dir is None:
+            return None
+
+        suffixes = [".wav"]
+        if audio_format and f".{audio_format}" in self.AUDIO_SUFFIXES and audio_format != "wav":
+            suffixes.insert(0, f".{audio_format}")
+
+        output_dir.mkdir(parents=True, exist_ok=True)
+        restored: List[Path] = []
+        for suffix in suffixes:
+            cached_file = entry_dir / f"audio{suffix}"
+            if cached_file.is_file():
+                dest = output_dir / f"{basename}{suffix}"
+                shutil.copy2(cached_file, dest)
+                restored.append(dest)
+
+        # 生成時に ffmpeg が無く WAV だけを登録した場合は、WAV を返す
+        return restored[0] if restored else None
+
+    def store(self, key: str, audio_files: List[Path]) -> Optional[Path]:
+        """
+        生成したWAV/MP3/Opusをキャッシュに登録する。
+        audio_files には今回の生成で書き出したファイルだけを渡すこと (前回の生成の残りを登録しないため)。
+        """
+        files = {
+            f"audio{path.suffix}": path
+            for path in audio_files
+            if path is not None and path.suffix in self.AUDIO_SUFFIXES and path.is_file()
+        }
+        if not files:
+            return None
+        return self.put_files(key, files)
+
+class SegmentCache(LruDirectoryCache):
+    """
+    発話 (SSMLセグメント) 単位で生成した音声のキャッシュ。
+    台詞・話者・ボイス・モデル名・temperature が同じ発話は、ファイル全体を作り直すときも再利用する。
+    """
+    @classmethod
+    def for_project(cls, project) -> Optional["SegmentCache"]:
+        """プロジェクトの設定から、ルート直下の .cache/segments を使うキャッシュを生成する。"""
+        if project is None or project.root_path is None:
+            return None
+        max_bytes = int(project.audio_cache_max_mb * 1024 * 1024)
+        return cls(project.root_path / CACHE_DIR_NAME / "segments", max_bytes)
+
+    @staticmethod
+    def make_key(segment_ssml: str, speaker: str, voice_name: str, model_name: str, temperature: float) -> str:
+        return hash_key({
+            "segment": segment_ssml,
+            "speaker": speaker,
+            "voice": voice_name,
+            "model": model_name,
+            "temperature": temperature,
+        })
+
+    def load(self, key: str) -> Optional[Tuple[bytes, int, int]]:
+        """キャッシュ済みの発話を (PCMデータ, サンプルレート, 量子化ビット数) で返す。無ければ None。"""
+        entry_dir = self.get_entry(key)
+        if entry_dir is None:
+            return None
+        try:
+            return read_wav(entry_dir / "segment.wav")
+        except Exception as e:
+            print(f"警告: キャッシュ済みの発話を読み込めませんでした ({key[:12]}...): {e}")
+            return None
+
+    def save(self, key: str, pcm: bytes, sample_rate: int, bits_per_sample: int) -> Optional[Path]:
+        return self.put_data(key, {"segment.wav": pcm_to_wav(pcm, sample_rate, bits_per_sample)})
+
+class ResponseCache(LruDirectoryCache):
+    """
+    テキスト生成の応答キャッシュ。モデル名・生成パラメータ・プロンプトが同じなら、
+    APIを呼ばずに (利用枠も消費せずに) 前回の応答を返す。
+    """
+    def __init__(self, cache_dir: Path, max_bytes: int, refresh: bool = False):
+        """
+        Args:
+            refresh (bool): True の場合はキャッシュを読まずに生成し直し (撮り直し)、新しい応答で上書きする。
+        """
+        super().__init__(cache_dir, max_bytes)
+        self.refresh = refresh
+
+    @classmethod
+    def for_project(cls, project, refresh: bool = False) -> Optional["ResponseCache"]:
+        """プロジェクトの設定から、ルート直下の .cache/responses を使うキャッシュを生成する。無効な場合は None。"""
+        if project is None or project.root_path is None or not project.response_cache_enabled:
+            return None
+        max_bytes = int(project.response_cache_max_mb * 1024 * 1024)
+        return cls(project.root_path / CACHE_DIR_NAME / "responses", max_bytes, refresh)
+
+    @staticmethod
+    def make_key(model_name: str, params: Dict[str, Any], prompt: str) -> str:
+        return hash_key({
+            "model": model_name,
+            "params": params,
+            "prompt": prompt,
+        })
+
+    def load(self, key: str) -> Optional[str]:
+        """キャッシュ済みの応答を返す。無い場合と、撮り直し (refresh) の場合は None。"""
+        if self.refresh:
+            return None
+        entry_dir = self.get_entry(key)
+        if entry_dir is None:
+            return None
+        try:
+            return (entry_dir / "response.txt").read_text(encoding="utf-8")
+        except OSError as e:
+            print(f"警告: キャッシュ済みの応答を読み込めませんでした ({key[:12]}...): {e}")
+            return None
+
+    def save(self, key: str, text: str) -> Optional[Path]:
+        return self.put_data(key, {"response.txt": text.encode("utf-8")})
+
+class InterjectionMemo(LruDirectoryCache):
+    """
+    (相槌を打つキャラクターの設定, 直前のセリフ) ごとに、生成済みの相槌を複数パターン覚えておくメモ。
+    パターンが max_variants 個たまったキーは、APIを呼ばずにその中から選んで使う。
+    """
+    def __init__(self, cache_dir: Path, max_bytes: int, max_variants: int = 3):
+        super().__init__(cache_dir, max_bytes)
+        self.max_variants = max(1, int(max_variants))
+        # 同じキーへのパターンの追加 (読み込み → 追記 → 保存) が並行しても取りこぼさないようにする
+        self._variants_lock = threading.Lock()
+
+    @classmethod
+    def for_project(cls, project) -> Optional["InterjectionMemo"]:
+        """プロジェクトの設定から、ルート直下の .cache/interjections を使うメモを生成する。無効な場合は None。"""
+        if project is None or project.root_path is None or not project.interjection_memo_enabled:
+            return None
+        max_bytes = int(project.interjection_memo_max_mb * 1024 * 1024)
+        return cls(project.root_path / CACHE_DIR_NAME / "interjections", max_bytes, project.interjection_memo_variants)
+
+    @staticmethod
+    def make_key(character_profile: str, previous_speech: str) -> str:
+        return hash_key({
+            "character": hashlib.sha256(character_profile.encode("utf-8")).hexdigest(),
+            "previous": previous_speech,
+        })
+
+    def _read(self, entry_dir: Path) -> Optional[Dict[str, Any]]:
+        try:
+            with open(entry_dir / "variants.json", "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return record if isinstance(record, dict) and isinstance(record.get("variants"), list) else None
+
+    def pick(self, key: str) -> Optional[str]:
+        """パターンが十分にたまっていれば、その中から1つを選んで返す。まだ少ない場合は None (新しく生成させる)。"""
+        entry_dir = self.get_entry(key)
+        record = self._read(entry_dir) if entry_dir is not None else None
+        if record is None or len(record["variants"]) < self.max_variants:
+            return None
+        return random.choice(record["variants"])
+
+    def add(self, key: str, interjection: str, character_name: str, previous_speech: str) -> Optional[Path]:
+        """生成した相槌をパターンに加える (同じ相槌は重複させず、上限を超えたら古いものから捨てる)。"""
+        with self._variants_lock:
+            entry_dir = self._entry_dir(key)
+            record = (self._read(entry_dir) if entry_dir.is_dir() else None) or {"variants": []}
+            variants = [variant for variant in record["variants"] if variant != interjection] + [interjection]
+            record = {
+                "character": character_name,
+                "previous_speech": previous_speech,
+                "variants": variants[-self.max_variants:],
+            }
+            data = json.dumps(record, ensure_ascii=False, indent=2).encode("utf-8")
+            return self.put_data(key, {"variants.json": data})
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """
+        一覧表示用に、全エントリを最終利用日時の新しい順で返す。
+        各要素は {"key", "character", "previous_speech", "variants", "last_used"}。
+        """
+        entries = []
+        for entry_dir, last_used, _ in sorted(self._iter_entries(), key=lambda entry: entry[1], reverse=True):
+            record = self._read(entry_dir)
+            if record is None:
+                continue
+            entries.append({
+                "key": entry_dir.name,
+                "character": record.get("character", ""),
+                "previous_speech": record.get("previous_speech", ""),
+                "variants": record["variants"],
+                "last_used": last_used,
+            })
+        return entries
+
+def project_audio_caches(project) -> List[LruDirectoryCache]:
+    """プロジェクトが使う音声関連のキャッシュ (ファイル単位・発話単位) をまとめて返す。"""
+    caches = [AudioCache.for_project(project), SegmentCache.for_project(project)]
+    return [cache for cache in caches if cache is not None]
+
+def project_caches(project) -> List[LruDirectoryCache]:
+    """プロジェクトが使うすべてのキャッシュ (音声・テキスト応答・相槌メモ) をまとめて返す。"""
+    caches = project_audio_caches(project) + [ResponseCache.for_project(project), InterjectionMemo.for_project(project)]
+    return [cache for cache in caches if cache is not None]
+
+def format_cache_stats(stats: Dict[str, Any]) -> str:
+    """stats() の結果を、ログやダイアログ向けの文字列に整形する。"""
+    def fmt_time(value: Optional[float]) -> str:
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(value)) if value else "-"
+
+    return (
+        f"場所: {stats['path']}\n"
+        f"エントリ数: {stats['entries']}\n"
+        f"使用量: {stats['total_bytes'] / (1024 * 1024):.1f} MB / {stats['max_bytes'] / (1024 * 1024):.0f} MB\n"
+        f"最終利用 (最古): {fmt_time(stats['oldest'])}\n"
+        f"最終利用 (最新): {fmt_time(stats['newest'])}\n"
+    )
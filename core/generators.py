@@ -1,7 +1,9 @@
 # AiRadioDramaCreator/core/generators.py
 
+import asyncio
 import mimetypes
 import struct
+import threading
 from pathlib import Path
 from pydub import AudioSegment
 from google.genai import types
@@ -12,26 +14,74 @@ from .models import (
     WriteConfig
 )
 from .models import SceneConfig
-from .api_client import GeminiApiClient
+from .api_client import (
+    GeminiApiClient,
+    estimate_tokens
+)
+from .cache import ResponseCache
+from .retry import (
+    RetryInterrupted,
+    call_with_retry,
+    call_with_retry_async
+)
+from .audio_io import (
+    EncodingWavWriter,
+    parse_audio_mime_type
+)
 
 from typing import (
+    Awaitable,
+    Callable,
     List, 
     Dict, 
     Union, 
     Any, 
-    Optional
+    Optional,
+    Tuple
 )
 
+def _retry_hooks(owner: Any, estimated_tokens: int, stop_event: Optional[threading.Event]) -> Dict[str, Any]:
+    """
+    owner.connector でAPIを呼ぶ処理の call_with_retry に渡す、on_error / before_retry / stop_event を返す。
+    失敗は現在のクライアントのキーに報告し、利用枠の超過などでキーが隔離された場合は、
+    次の試行の前に利用枠を確保した別のキーのクライアントへ取り替える (隔離されたキーで再試行しない)。
+    """
+    def on_error(error: Exception, retry_after: Optional[float]) -> str:
+        return owner.connector.report_error(error, retry_after)
+
+    def before_retry(error: Exception):
+        connector = owner.connector.replacement(estimated_tokens, stop_event)
+        if connector is None:
+            raise RetryInterrupted("別のAPIキーの利用枠を待っている間に中断されました。")
+        owner.connector = connector
+
+    return {"on_error": on_error, "before_retry": before_retry, "stop_event": stop_event}
+
+def _retry_hooks_async(owner: Any, estimated_tokens: int, stop_event: Optional[threading.Event]) -> Dict[str, Any]:
+    """_retry_hooks の非同期版。別のキーの利用枠はイベントループを止めずに待つ。"""
+    hooks = _retry_hooks(owner, estimated_tokens, stop_event)
+
+    async def before_retry(error: Exception):
+        connector = await owner.connector.replacement_async(estimated_tokens, stop_event)
+        if connector is None:
+            raise RetryInterrupted("別のAPIキーの利用枠を待っている間に中断されました。")
+        owner.connector = connector
+
+    hooks["before_retry"] = before_retry
+    return hooks
+
 class Generator:
     """
     APIと通信し、テキストや音声などの生のデータを生成する責務を持つクラス。
     """
-    def __init__(self, api_conn: GeminiApiClient, scene_config: SceneConfig):
+    def __init__(self, api_conn: GeminiApiClient, scene_config: SceneConfig, stop_event: Optional[threading.Event] = None):
         if not isinstance(scene_config, SceneConfig):
             raise TypeError("scene_configはSceneConfigのサブクラスである必要があります。")
         
         self.connector = api_conn
         self.scene_config = scene_config
+        # セットされたら、リトライの待機を打ち切る
+        self.stop_event = stop_event
 
     def _prepare_contents(self, prompt: str) -> List[types.Content]:
         return [
@@ -50,14 +100,52 @@ class Generator:
         try:
             config = self.scene_config.get_text_config()
             contents = self._prepare_contents(prompt)
-            
-            stream = self.connector.client.models.generate_content_stream(
-                model=self.connector.model_name,
-                contents=contents,
-                config=config, # ★★★ 修正点: 'generation_config' から 'config' へ ★★★
+
+            def stream_once() -> str:
+                stream = self.connector.client.models.generate_content_stream(
+                    model=self.connector.model_name,
+                    contents=contents,
+                    config=config, # ★★★ 修正点: 'generation_config' から 'config' へ ★★★
+                )
+                return "".join(chunk.text for chunk in stream if chunk.text)
+
+            # 429 / 5xx などの一時的なエラーはリトライ方針に従って再試行する
+            full_response = call_with_retry(
+                stream_once,
+                self.connector.retry_policy,
+                description="テキスト生成",
+                **_retry_hooks(self, estimate_tokens(prompt), self.stop_event)
             )
+            self.connector.report_success()
+            return full_response.strip()
+
+        except Exception as e:
+            print(f"テキスト生成中にエラーが発生しました: {e}")
+            return None
+
+    async def generate_text_async(self, prompt: str) -> Optional[str]:
+        """
+        generate_text の非同期版。SDKの非同期ストリーミング (client.aio) を使い、応答を待つ間もイベントループを止めない。
+        """
+        try:
+            config = self.scene_config.get_text_config()
+            contents = self._prepare_contents(prompt)
 
-            full_response = "".join(chunk.text for chunk in stream if chunk.text)
+            async def stream_once() -> str:
+                stream = await self.connector.client.aio.models.generate_content_stream(
+                    model=self.connector.model_name,
+                    contents=contents,
+                    config=config,
+                )
+                return "".join([chunk.text async for chunk in stream if chunk.text])
+
+            full_response = await call_with_retry_async(
+                stream_once,
+                self.connector.retry_policy,
+                description="テキスト生成",
+                **_retry_hooks_async(self, estimate_tokens(prompt), self.stop_event)
+            )
+            self.connector.report_success()
             return full_response.strip()
 
         except Exception as e:
@@ -72,26 +160,86 @@ class Generator:
             config = self.scene_config.get_speech_config()
             contents = self._prepare_contents(prompt)
 
-            stream = self.connector.client.models.generate_content_stream(
-                model=self.connector.model_name,
-                contents=contents,
-                config=config, # ★★★ 修正点: 'generation_config' から 'config' へ ★★★
+            def stream_once():
+                stream = self.connector.client.models.generate_content_stream(
+                    model=self.connector.model_name,
+                    contents=contents,
+                    config=config, # ★★★ 修正点: 'generation_config' から 'config' へ ★★★
+                )
+
+                # 途中で失敗した場合は最初からやり直すため、バッファは試行ごとに作る
+                audio_data = bytearray()
+                mime_type = None
+
+                for chunk in stream:
+                    if (
+                        chunk.candidates
+                        and chunk.candidates[0].content
+                        and chunk.candidates[0].content.parts
+                        and chunk.candidates[0].content.parts[0].inline_data
+                    ):
+                        inline_data = chunk.candidates[0].content.parts[0].inline_data
+                        audio_data.extend(inline_data.data)
+                        mime_type = inline_data.mime_type
+                return audio_data, mime_type
+
+            full_audio_data, final_mime_type = call_with_retry(
+                stream_once,
+                self.connector.retry_policy,
+                description="音声生成",
+                **_retry_hooks(self, estimate_tokens(prompt), self.stop_event)
             )
+            self.connector.report_success()
 
-            full_audio_data = bytearray()
-            final_mime_type = None
+            if not full_audio_data or not final_mime_type:
+                print("警告: APIから音声データが返されませんでした。")
+                return None
+
+            return {"audio_data": bytes(full_audio_data), "mime_type": final_mime_type}
+
+        except Exception as e:
+            print(f"音声生成中にエラーが発生しました: {e}")
+            return None
+
+    async def generate_audio_async(self, prompt: str) -> Optional[Dict[str, Union[bytes, str]]]:
+        """
+        generate_audio の非同期版。音声チャンクは届いた順にバッファへ追加する。
+        """
+        try:
+            config = self.scene_config.get_speech_config()
+            contents = self._prepare_contents(prompt)
+
+            async def stream_once():
+                stream = await self.connector.client.aio.models.generate_content_stream(
+                    model=self.connector.model_name,
+                    contents=contents,
+                    config=config,
+                )
+
+                # 途中で失敗した場合は最初からやり直すため、バッファは試行ごとに作る
+                audio_data = bytearray()
+                mime_type = None
+
+                async for chunk in stream:
+                    if (
+                        chunk.candidates
+                        and chunk.candidates[0].content
+                        and chunk.candidates[0].content.parts
+                        and chunk.candidates[0].content.parts[0].inline_data
+                    ):
+                        inline_data = chunk.candidates[0].content.parts[0].inline_data
+                        audio_data.extend(inline_data.data)
+                        mime_type = inline_data.mime_type
+                return audio_data, mime_type
+
+            full_audio_data, final_mime_type = await call_with_retry_async(
+                stream_once,
+                self.connector.retry_policy,
+                description="音声生成",
+                **_retry_hooks_async(self, estimate_tokens(prompt), self.stop_event)
+            )
+            self.connector.report_success()
 
-            for chunk in stream:
-                if (
-                    chunk.candidates
-                    and chunk.candidates[0].content
-                    and chunk.candidates[0].content.parts
-                    and chunk.candidates[0].content.parts[0].inline_data
-                ):
-                    inline_data = chunk.candidates[0].content.parts[0].inline_data
-                    full_audio_data.extend(inline_data.data)
-                    final_mime_type = inline_data.mime_type
-            
             if not full_audio_data or not final_mime_type:
                 print("警告: APIから音声データが返されませんでした。")
                 return None
@@ -154,16 +302,42 @@ class AudioProcessor:
 class TextGenerator:
     def __init__(
             self, 
-            api_conn: GeminiApiClient, 
+            api_conn: Optional[GeminiApiClient], 
             write_config: WriteConfig, 
             prompt: str=None, 
             parent=None, 
-            basename=None):
+            basename=None,
+            response_cache: Optional[ResponseCache] = None,
+            client_provider: Optional[Callable[[int, Optional[str]], Optional[GeminiApiClient]]] = None,
+            model_name: Optional[str] = None,
+            async_client_provider: Optional[Callable[[int, Optional[str]], Awaitable[Optional[GeminiApiClient]]]] = None,
+            stop_event: Optional[threading.Event] = None):
+        """
+        Args:
+            api_conn (GeminiApiClient): テキスト用APIクライアント。client_provider を使う場合は None でよい。
+            response_cache (ResponseCache): 応答キャッシュ。指定した場合、同じモデル・パラメータ・プロンプトの応答を再利用する。
+            client_provider (Callable): (推定トークン数, モデル名) を受け取り、そのモデルの利用枠を確保したクライアントを返す関数。
+                キャッシュに無かった場合だけ呼ばれる。モデル名が None の場合は既定のテキストモデルを使う。中断時は None を返す。
+            model_name (str): テキストモデル名。キャッシュの照合と生成に使う。省略した場合は api_conn のモデル。
+                api_conn のモデルと異なる場合は、同じキーでこのモデルのクライアントに取り替えて使う。
+            async_client_provider (Callable): client_provider の非同期版。generate_async で使う。
+            stop_event (threading.Event): セットされたら、リトライの待機を打ち切る。
+        """
         self.connector = api_conn
+        self.prompt = prompt
         self.content = self._set_content(prompt)
         self.content_config = write_config.model_config
+        self.write_params = write_config.to_dict()
         self.parent = parent
         self.basename = basename
+        self.response_cache = response_cache
+        self.client_provider = client_provider
+        self.async_client_provider = async_client_provider
+        self.model_name = model_name or (api_conn.model_name if api_conn is not None else None)
+        if api_conn is not None:
+            # 生成プロファイルでモデルが指定されている場合も、リトライ時のキーの取り替えがそのモデルの利用枠で行われるようにする
+            self.connector = api_conn.for_model(self.model_name)
+        self.stop_event = stop_event
     
     def _set_content(self, prompt):
         return [
@@ -175,26 +349,109 @@ class TextGenerator:
             ),
         ]
     
-    def generate(self):
+    def generate(self) -> Optional[str]:
         """
         ストリーミングレスポンスの全チャンクを結合して、完全なテキストを返す。
+        応答キャッシュに一致するものがあれば、APIを呼ばずにそれを返す。
+        client_provider から利用枠を確保している間に中断された場合は None を返す。
         """
-        full_response = "" # 全てのテキストを結合するための空の文字列を準備
-        
-        # ストリーミングAPIを呼び出し、全チャンクをループ処理する
-        stream = self.connector.client.models.generate_content_stream(
-            model=self.connector.model_name,
-            contents=self.content,
-            config=self.content_config,
-        )
+        cache_key, cached_response = self._load_cached()
+        if cached_response is not None:
+            return cached_response
+
+        if self.connector is None:
+            # キャッシュに無かった場合だけ、APIの利用枠を確保する
+            # 生成プロファイルでモデルが指定されている場合は、そのモデルの利用枠を確保する
+            self.connector = self.client_provider(estimate_tokens(self.prompt), self.model_name) if self.client_provider else None
+            if self.connector is None:
+                return None
+
+        # 生成プロファイルでモデルが指定されている場合は、クライアントのモデルではなくそちらを使う
+        model_name = self.model_name or self.connector.model_name
+
+        def stream_once() -> str:
+            full_response = "" # 全てのテキストを結合するための空の文字列を準備
+
+            # ストリーミングAPIを呼び出し、全チャンクをループ処理する
+            stream = self.connector.client.models.generate_content_stream(
+                model=model_name,
+                contents=self.content,
+                config=self.content_config,
+            )
 
-        for chunk in stream:
-            # chunk.textがNoneでないことを確認してから結合
-            if chunk.text:
-                full_response += chunk.text
+            for chunk in stream:
+                # chunk.textがNoneでないことを確認してから結合
+                if chunk.text:
+                    full_response += chunk.text
+            return full_response
+
+        # 一時的なエラーはリトライし、利用枠超過や認証エラーのキーは ApiKeyManager 側で隔離される
+        # (隔離された場合は、次の試行の前に別のキーのクライアントへ取り替える)
+        full_response = call_with_retry(
+            stream_once,
+            self.connector.retry_policy,
+            description=f"テキスト生成 ({model_name})",
+            **_retry_hooks(self, estimate_tokens(self.prompt), self.stop_event)
+        )
+        self.connector.report_success()
         
         # 全てのループが終わった後で、結合した完全なテキストを返す
-        return full_response.strip()
+        return self._save_cached(cache_key, full_response)
+
+    async def generate_async(self) -> Optional[str]:
+        """
+        generate の非同期版。SDKの非同期ストリーミング (client.aio) を使い、応答や利用枠を待つ間もイベントループを止めない。
+        利用枠は async_client_provider から確保する。無い場合は client_provider をループの外のスレッドで呼ぶ。
+        """
+        cache_key, cached_response = self._load_cached()
+        if cached_response is not None:
+            return cached_response
+
+        if self.connector is None:
+            estimated_tokens = estimate_tokens(self.prompt)
+            if self.async_client_provider is not None:
+                self.connector = await self.async_client_provider(estimated_tokens, self.model_name)
+            elif self.client_provider is not None:
+                self.connector = await asyncio.to_thread(self.client_provider, estimated_tokens, self.model_name)
+            if self.connector is None:
+                return None
+
+        model_name = self.model_name or self.connector.model_name
+
+        async def stream_once() -> str:
+            stream = await self.connector.client.aio.models.generate_content_stream(
+                model=model_name,
+                contents=self.content,
+                config=self.content_config,
+            )
+            # 途中で失敗した場合は最初からやり直すため、結果は試行ごとに組み立てる
+            return "".join([chunk.text async for chunk in stream if chunk.text])
+
+        full_response = await call_with_retry_async(
+            stream_once,
+            self.connector.retry_policy,
+            description=f"テキスト生成 ({model_name})",
+            **_retry_hooks_async(self, estimate_tokens(self.prompt), self.stop_event)
+        )
+        self.connector.report_success()
+        return self._save_cached(cache_key, full_response)
+
+    def _load_cached(self) -> Tuple[Optional[str], Optional[str]]:
+        """(キャッシュのキー, キャッシュ済みの応答) を返す。キャッシュを使わない場合や無かった場合、応答は None。"""
+        if self.response_cache is None or not self.model_name:
+            return None, None
+        cache_key = ResponseCache.make_key(self.model_name, self.write_params, self.prompt)
+        cached_response = self.response_cache.load(cache_key)
+        if cached_response is not None:
+            print("INFO: キャッシュ済みの応答を再利用します (APIは呼び出しません)。")
+        return cache_key, cached_response
+
+    def _save_cached(self, cache_key: Optional[str], full_response: str) -> str:
+        """応答の前後の空白を取り除き、キャッシュに保存して返す。"""
+        response = full_response.strip()
+        if cache_key is not None and response:
+            self.response_cache.save(cache_key, response)
+        return response
 
 class SpeechGenerator:
     def __init__(
@@ -203,14 +460,23 @@ class SpeechGenerator:
             speech_config: SpeechConfig, 
             ssml_dialog: str, 
             parent:Path, 
-            basename: str):
+            basename: str,
+            audio_format: Optional[str] = "mp3",
+            stop_event: Optional[threading.Event] = None):
         self.connector = api_conn
         self.content = self._set_content(ssml_dialog)
+        # 別のキーのクライアントに取り替えるときに確保する利用枠の見積もり
+        self.estimated_tokens = estimate_tokens(ssml_dialog)
+        # セットされたら、リトライの待機を打ち切る
+        self.stop_event = stop_event
         self.content_config = speech_config.model_config
         self.parent = parent
         self.basename = basename
+        # WAVと同時に作る圧縮ファイルの形式 ("mp3" / "opus")。None の場合はWAVのみ
+        self.audio_format = audio_format
         self._wav_file = None
         self._mp3_file = None
+        self._encoded_file = None
     
     def _set_content(self, ssml):
         return [
@@ -316,60 +582,175 @@ class SpeechGenerator:
             f.write(data)
         print(f"File saved to: {file_name}")
 
+    def _stream_audio(self, on_chunk: Callable[[bytes, str], None]):
+        """
+        音声生成のストリームを1回読み切り、音声チャンクが届くたびに on_chunk(データ, MIMEタイプ) を呼ぶ。
+        """
+        for chunk in self.connector.client.models.generate_content_stream(
+            model=self.connector.model_name,
+            contents=self.content,
+            config=self.content_config,
+        ):
+            if (
+                chunk.candidates
+                and chunk.candidates[0].content
+                and chunk.candidates[0].content.parts
+                and chunk.candidates[0].content.parts[0].inline_data
+                and chunk.candidates[0].content.parts[0].inline_data.data
+            ):
+                inline_data = chunk.candidates[0].content.parts[0].inline_data
+                on_chunk(inline_data.data, inline_data.mime_type)
+
+            elif chunk.text:
+                print(f"Text chunk: {chunk.text}")
+
+    def synthesize(self) -> Tuple[bytes, Optional[str]]:
+        """
+        音声を生成し、ファイルには保存せずに (生の音声データ, MIMEタイプ) を返す。
+        429 / 5xx などの一時的なエラーはリトライし、失敗した場合は例外を送出する。
+        """
+        full_audio_data = bytearray()
+        final_mime_type = None
+
+        def collect_chunk(data: bytes, mime_type: str):
+            nonlocal final_mime_type
+            # データをバッファに追加
+            full_audio_data.extend(data)
+            # 最後のMIMEタイプを保持
+            final_mime_type = mime_type
+
+        def stream_once():
+            nonlocal final_mime_type
+            # 途中で失敗した場合は最初からやり直すため、試行ごとにバッファを空にする
+            full_audio_data.clear()
+            final_mime_type = None
+            self._stream_audio(collect_chunk)
+
+        call_with_retry(
+            stream_once,
+            self.connector.retry_policy,
+            description=f"音声生成 ({self.basename})",
+            **_retry_hooks(self, self.estimated_tokens, self.stop_event)
+        )
+        self.connector.report_success()
+        return bytes(full_audio_data), final_mime_type
+
+    async def _stream_audio_async(self, on_chunk: Callable[[bytes, str], None]):
+        """_stream_audio の非同期版。SDKの非同期ストリーミング (client.aio) を使う。"""
+        stream = await self.connector.client.aio.models.generate_content_stream(
+            model=self.connector.model_name,
+            contents=self.content,
+            config=self.content_config,
+        )
+        async for chunk in stream:
+            if (
+                chunk.candidates
+                and chunk.candidates[0].content
+                and chunk.candidates[0].content.parts
+                and chunk.candidates[0].content.parts[0].inline_data
+                and chunk.candidates[0].content.parts[0].inline_data.data
+            ):
+                inline_data = chunk.candidates[0].content.parts[0].inline_data
+                on_chunk(inline_data.data, inline_data.mime_type)
+
+            elif chunk.text:
+                print(f"Text chunk: {chunk.text}")
+
+    async def synthesize_async(self) -> Tuple[bytes, Optional[str]]:
+        """
+        synthesize の非同期版。応答を待つ間もイベントループを止めないため、多数の音声を1つのループで並行に生成できる。
+        """
+        full_audio_data = bytearray()
+        final_mime_type = None
+
+        def collect_chunk(data: bytes, mime_type: str):
+            nonlocal final_mime_type
+            full_audio_data.extend(data)
+            final_mime_type = mime_type
+
+        async def stream_once():
+            nonlocal final_mime_type
+            # 途中で失敗した場合は最初からやり直すため、試行ごとにバッファを空にする
+            full_audio_data.clear()
+            final_mime_type = None
+            await self._stream_audio_async(collect_chunk)
+
+        await call_with_retry_async(
+            stream_once,
+            self.connector.retry_policy,
+            description=f"音声生成 ({self.basename})",
+            **_retry_hooks_async(self, self.estimated_tokens, self.stop_event)
+        )
+        self.connector.report_success()
+        return bytes(full_audio_data), final_mime_type
+
     def generate(self):
         # Generate audio content from the dialog
         print(f"Generating audio content for dialog.")
 
         wav_file = Path(self.parent / f"{self.basename}.wav")
-        full_audio_data = bytearray()
-        final_mime_type = None
+        # チャンクをメモリに溜めずにファイルへ書き込み、同時に ffmpeg で圧縮する。
+        # 形式は最初のチャンクのMIMEタイプで決める
+        writer: Optional[EncodingWavWriter] = None
+
+        def write_chunk(data: bytes, mime_type: str):
+            nonlocal writer
+            if writer is None:
+                parameters = parse_audio_mime_type(mime_type)
+                # 拡張子の推測できる形式 (WAVなど) はそのまま保存し、生のPCMにはWAVヘッダを付ける
+                is_container = mimetypes.guess_extension(mime_type) is not None
+                if not is_container:
+                    print(f"Warning: Could not guess extension for MIME type {mime_type}. Assuming .wav and converting.")
+                writer = EncodingWavWriter(
+                    wav_file,
+                    sample_rate=parameters["rate"],
+                    bits_per_sample=parameters["bits_per_sample"],
+                    write_header=not is_container,
+                    audio_format=self.audio_format
+                )
+            writer.write(data)
+
+        def stream_once():
+            # 途中で失敗した場合は最初からやり直すため、試行ごとに書き込み済みの音声を破棄する
+            if writer is not None:
+                writer.reset()
+            self._stream_audio(write_chunk)
 
         try:
-            # ここで音声を生成する。
-            for chunk in self.connector.client.models.generate_content_stream(
-                model=self.connector.model_name,
-                contents=self.content,
-                config=self.content_config,
-            ):
-                if (
-                    chunk.candidates
-                    and chunk.candidates[0].content
-                    and chunk.candidates[0].content.parts
-                    and chunk.candidates[0].content.parts[0].inline_data
-                    and chunk.candidates[0].content.parts[0].inline_data.data
-                ):
-                    inline_data = chunk.candidates[0].content.parts[0].inline_data
-                    
-                    # データをバッファに追加
-                    full_audio_data.extend(inline_data.data)
-
-                    # 最後のMIMEタイプを保持
-                    final_mime_type = inline_data.mime_type
-                
-                elif chunk.text:
-                    print(f"Text chunk: {chunk.text}")
+            # ここで音声を生成する。429 / 5xx などの一時的なエラーはリトライする
+            call_with_retry(
+                stream_once,
+                self.connector.retry_policy,
+                description=f"音声生成 ({self.basename})",
+                **_retry_hooks(self, self.estimated_tokens, self.stop_event)
+            )
         except Exception as e:
             print(f"An error occurred during audio generation: {e}")
+            if writer is not None:
+                writer.abort()
             raise e
-        
-        if full_audio_data and final_mime_type:
-            file_extension = mimetypes.guess_extension(final_mime_type)
-            if file_extension is None:
-                print(f"Warning: Could not guess extension for MIME type {final_mime_type}. Assuming .wav and converting.")
-                try:
-                    # WAVに変換して保存する。
-                    wav_data = self._convert_to_wav(bytes(full_audio_data), final_mime_type)
-                    self._save_binary_file(wav_file, wav_data)
-                    self._convert_to_mp3(wav_file)
-
-                except Exception as e:
-                    print(f"Error converting or saving data with MIME {final_mime_type} to WAV: {e}")
-                    return None
-            else:
-                 # その他の形式の場合（通常は発生しないが念のため）
-                 self._save_binary_file(wav_file, bytes(full_audio_data))
-        else:
+
+        self.connector.report_success()
+
+        if writer is None or writer.data_size == 0:
+            if writer is not None:
+                writer.abort()
             print("No audio data was generated.")
             return None
-        
-        self._wav_file = wav_file
\ No newline at end of file
+
+        try:
+            writer.close()
+            print(f"File saved to: {wav_file}")
+        except Exception as e:
+            writer.abort()
+            print(f"Error saving audio data to WAV: {e}")
+            return None
+
+        if writer.encoded_path is not None:
+            print(f"Successfully encoded to: {writer.encoded_path}")
+            self._encoded_file = writer.encoded_path
+            if writer.encoded_path.suffix == ".mp3":
+                self._mp3_file = writer.encoded_path
+
+        self._wav_file = wav_file
+        return self._encoded_file or self._wav_file
@@ -0,0 +1,241 @@
+# AiRadioDramaCreator/core/manifest.py
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional
+)
+
+from .cache import hash_key
+from .models import (
+    Project,
+    PROFILE_QUALITY,
+    PROFILE_STAGE_DIALOG,
+    PROFILE_STAGE_INTERJECTION
+)
+
+# プロジェクトのルート直下に置くマニフェストのファイル名
+MANIFEST_FILE_NAME = ".build_manifest.json"
+MANIFEST_VERSION = 1
+
+# ステージ名 (出力先のフォルダ名と同じ)
+STAGE_DIALOG = "dialog"
+STAGE_SSML = "ssml"
+STAGE_AUDIO = "audio"
+STAGES = (STAGE_DIALOG, STAGE_SSML, STAGE_AUDIO)
+
+# 成果物の状態
+ARTIFACT_FRESH = "FRESH"      # 入力・設定が前回の生成時と同じ
+ARTIFACT_STALE = "STALE"      # 入力か設定が変わったため、生成し直す必要がある
+ARTIFACT_MISSING = "MISSING"  # まだ生成されていない
+
+# ステージごとの (入力フォルダ, 入力ファイルのパターン)
+_STAGE_INPUTS = {
+    STAGE_DIALOG: ("script", "*.txt"),
+    STAGE_SSML: ("dialog", "*.txt"),
+    STAGE_AUDIO: ("ssml", "*.ssml"),
+}
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class BuildManifest:
+    """
+    各成果物 (dialog/*.txt, ssml/*.ssml, audio/*) が、どの入力ファイルとどの設定から作られたかを記録するマニフェスト。
+    入力ファイルの内容と生成設定のハッシュ (フィンガープリント) を比べることで、
+    make のように、作り直しが必要な成果物だけを見つけられる。
+    """
+    # 同じマニフェストを複数のワーカーから更新するため、ファイルごとにロックを共有する
+    _locks: Dict[Path, threading.Lock] = {}
+    _locks_guard = threading.Lock()
+
+    def __init__(self, project: Project):
+        self.project = project
+        self.root_path = Path(project.root_path)
+        self.path = self.root_path / MANIFEST_FILE_NAME
+        with self._locks_guard:
+            self._lock = self._locks.setdefault(self.path.resolve(), threading.Lock())
+
+    @classmethod
+    def for_project(cls, project: Optional[Project]) -> Optional["BuildManifest"]:
+        if project is None or project.root_path is None:
+            return None
+        return cls(project)
+
+    # --- 入力と出力の対応 ---
+
+    def input_dir(self, stage: str) -> Path:
+        return self.root_path / _STAGE_INPUTS[stage][0]
+
+    def output_dir(self, stage: str) -> Path:
+        return self.root_path / stage
+
+    def list_inputs(self, stage: str) -> List[Path]:
+        dir_name, pattern = _STAGE_INPUTS[stage]
+        input_dir = self.root_path / dir_name
+        return sorted(f for f in input_dir.glob(pattern) if f.is_file()) if input_dir.is_dir() else []
+
+    def _audio_suffixes(self) -> List[str]:
+        # 圧縮に失敗した場合はWAVだけが残るため、WAVも成果物として扱う
+        preferred = f".{self.project.audio_format or 'wav'}"
+        return [preferred] if preferred == ".wav" else [preferred, ".wav"]
+
+    def output_for(self, stage: str, source: Path) -> Path:
+        """入力ファイルに対応する成果物のパスを返す (音声は実在するファイルを優先する)。"""
+        if stage == STAGE_DIALOG:
+            return self.output_dir(stage) / source.name
+        if stage == STAGE_SSML:
+            return self.output_dir(stage) / source.with_suffix(".ssml").name
+        candidates = [self.output_dir(stage) / f"{source.stem}{suffix}" for suffix in self._audio_suffixes()]
+        return next((path for path in candidates if path.exists()), candidates[0])
+
+    def source_for(self, stage: str, output: Path) -> Path:
+        """成果物に対応する入力ファイルのパスを返す。"""
+        dir_name, pattern = _STAGE_INPUTS[stage]
+        return self.root_path / dir_name / f"{Path(output).stem}{pattern[1:]}"
+
+    # --- フィンガープリント ---
+
+    def settings_for(self, stage: str) -> Dict[str, Any]:
+        """ステージの生成結果に影響する設定を返す。ここが変わると、そのステージの成果物はすべて作り直しになる。"""
+        voices = {char.name: char.voice.api_name for char in self.project.characters}
+        if stage == STAGE_DIALOG:
+            profiles = self.project.profile_chain(PROFILE_STAGE_DIALOG)
+            settings = {
+                "model": profiles[0].model or self.project.text_model,
+                "characters": [char.get_character_prompt() for char in self.project.characters],
+                "params": profiles[0].write_config().to_dict(),
+            }
+            profile_names = [profile.name for profile in profiles]
+            if profile_names != [PROFILE_QUALITY]:
+                # 生成し直すプロファイルがある場合は、どこまで上げるかによって台本が変わる
+                settings["profiles"] = profile_names
+            if self.project.dialog_chunk_chars > 0:
+                # シナリオを分けて生成する場合は、分け方によって台本が変わる
+                settings["chunk_chars"] = self.project.dialog_chunk_chars
+            if not self.project.dialog_slim_prompt:
+                settings["slim_prompt"] = False
+            if self.project.dialog_profile_max_tokens > 0:
+                settings["profile_max_tokens"] = self.project.dialog_profile_max_tokens
+            return settings
+        if stage == STAGE_SSML:
+            settings = {"voices": voices}
+            if self.project.interjection_mode != "off":
+                # 相槌を挿入する場合は、テキストモデルとキャラクター設定も結果に影響する
+                settings["interjections"] = {
+                    "mode": self.project.interjection_mode,
+                    "model": self.project.text_model,
+                    "characters": [char.get_character_prompt() for char in self.project.characters],
+                    "profiles": [
+                        {"name": profile.name, **profile.to_dict()}
+                        for profile in self.project.profile_chain(PROFILE_STAGE_INTERJECTION)
+                    ],
+                }
+            return settings
+        return {
+            "model": self.project.speech_model,
+            "voices": voices,
+            "audio_format": self.project.audio_format,
+            "segmented_audio": self.project.segmented_audio,
+        }
+
+    def fingerprint(self, stage: str, source: Path) -> Optional[str]:
+        """入力ファイルの内容と生成設定のハッシュを返す。入力ファイルが無ければ None。"""
+        try:
+            input_digest = _file_digest(source)
+        except OSError:
+            return None
+        return hash_key({"stage": stage, "input": input_digest, "settings": self.settings_for(stage)})
+
+    # --- 読み書き ---
+
+    def _relative(self, path: Path) -> str:
+        path = Path(path)
+        try:
+            return path.resolve().relative_to(self.root_path.resolve()).as_posix()
+        except ValueError:
+            return path.as_posix()
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """{成果物の相対パス: 記録} を返す。マニフェストが無い・壊れている場合は空。"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"警告: ビルドマニフェストを読み込めませんでした ({self.path}): {e}")
+            return {}
+        return data.get("artifacts", {}) if isinstance(data, dict) else {}
+
+    def _save(self, artifacts: Dict[str, Dict[str, Any]]):
+        tmp_path = self.path.parent / f".{self.path.name}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": MANIFEST_VERSION, "artifacts": artifacts}, f, indent=2, ensure_ascii=False, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"警告: ビルドマニフェストを保存できませんでした ({self.path}): {e}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+
+    def record(self, stage: str, source: Path, output: Path, fingerprint: Optional[str]):
+        """
+        成果物を生成したことを記録する。
+        fingerprint は生成を始める前に計算した値を渡す (生成中に入力が編集された場合に古い成果物を最新と誤らないため)。
+        """
+        if fingerprint is None:
+            return
+        entry = {
+            "stage": stage,
+            "source": self._relative(source),
+            "fingerprint": fingerprint,
+            "built_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        with self._lock:
+            artifacts = self.load()
+            artifacts[self._relative(output)] = entry
+            self._save(artifacts)
+
+    # --- 状態の判定 ---
+
+    def status(self, stage: str, output: Path, artifacts: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+        """成果物が最新 (FRESH)・要再生成 (STALE)・未生成 (MISSING) のどれかを返す。"""
+        output = Path(output)
+        if not output.exists():
+            return ARTIFACT_MISSING
+
+        source = self.source_for(stage, output)
+        if not source.exists():
+            # 入力が削除された成果物は、作り直しようがないため最新として扱う
+            return ARTIFACT_FRESH
+
+        artifacts = artifacts if artifacts is not None else self.load()
+        entry = artifacts.get(self._relative(output))
+        if entry is None:
+            # マニフェスト導入前の成果物は、make と同じく更新日時で判定する
+            return ARTIFACT_FRESH if output.stat().st_mtime >= source.stat().st_mtime else ARTIFACT_STALE
+
+        return ARTIFACT_FRESH if entry.get("fingerprint") == self.fingerprint(stage, source) else ARTIFACT_STALE
+
+    def stale_inputs(self, stage: str) -> List[Path]:
+        """成果物が未生成か古くなっている入力ファイルの一覧を返す。"""
+        artifacts = self.load()
+        return [
+            source for source in self.list_inputs(stage)
+            if self.status(stage, self.output_for(stage, source), artifacts) != ARTIFACT_FRESH
+        ]
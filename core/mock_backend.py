@@ -0,0 +1,389 @@
+# AiRadioDramaCreator/core/mock_backend.py
+
+import asyncio
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple
+)
+
+from .api_client import set_client_factory
+
+# スケジュールに書けるイベント。1リクエストに1つずつ順に割り当てる
+EVENT_OK = "ok"             # 正常に応答する
+EVENT_QUOTA = "429"         # 利用枠の超過 (RESOURCE_EXHAUSTED)
+EVENT_SERVER = "500"        # サーバー内部のエラー
+EVENT_UNAVAILABLE = "503"   # サーバーが一時的に使えない
+EVENT_STALL = "stall"       # 応答の途中で stall_seconds 止まり、その後は正常に続ける
+EVENT_TIMEOUT = "timeout"   # 応答の途中で stall_seconds 止まり、通信のタイムアウトとして失敗する
+MOCK_EVENTS = (EVENT_OK, EVENT_QUOTA, EVENT_SERVER, EVENT_UNAVAILABLE, EVENT_STALL, EVENT_TIMEOUT)
+
+# 生成する音声の形式 (実際のTTSモデルと同じ 16bit モノラルのPCM)
+MOCK_AUDIO_BITS_PER_SAMPLE = 16
+
+@dataclass
+class MockBackendConfig:
+    """
+    モックバックエンドの応答の速さと、失敗の起こし方の設定。時間の単位はすべて秒。
+    time_scale はすべての待ち時間に掛ける倍率で、0 にすると待たずに応答する。
+    """
+    seed: int = 0
+    time_scale: float = 1.0
+    # テキスト: 最初のチャンクまでの時間と、その後の出力の速さ
+    text_first_byte_seconds: float = 0.5
+    text_chars_per_second: float = 2000.0
+    text_chunk_chars: int = 200
+    # 台本: シナリオの何文字ごとに1行の台詞を返すか
+    dialog_chars_per_line: int = 60
+    # 音声: 最初のチャンクまでの時間、チャンクの大きさ、実時間に対する生成時間の比 (0.1 なら再生時間の1/10で返す)
+    audio_first_byte_seconds: float = 1.0
+    audio_sample_rate: int = 24000
+    audio_chunk_bytes: int = 32768
+    audio_real_time_factor: float = 0.1
+    audio_seconds_per_char: float = 0.12
+    # 失敗: schedule はリクエストの順に割り当てるイベントのリスト (最後まで使ったら先頭に戻る)。
+    # schedule が空の場合は、各 *_rate の確率でイベントを起こす
+    schedule: List[str] = field(default_factory=list)
+    quota_error_rate: float = 0.0
+    server_error_rate: float = 0.0
+    stall_rate: float = 0.0
+    stall_seconds: float = 5.0
+    # 429 に付けるサーバー指定の待機秒数 (RetryInfo)。None の場合は付けない
+    retry_after_seconds: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MockBackendConfig":
+        default = cls()
+        unknown = set(data) - set(default.__dict__)
+        if unknown:
+            raise ValueError(f"モックバックエンドの設定に不明な項目があります: {sorted(unknown)}")
+        config = cls(**{**default.__dict__, **data})
+        invalid = [event for event in config.schedule if event not in MOCK_EVENTS]
+        if invalid:
+            raise ValueError(f"モックバックエンドのスケジュールに不明なイベントがあります: {invalid} (使えるもの: {list(MOCK_EVENTS)})")
+        return config
+
+    @classmethod
+    def from_file(cls, path: Path) -> "MockBackendConfig":
+        with open(path, "r", encoding="utf-8-sig") as f:
+            return cls.from_dict(json.load(f))
+
+class MockApiError(Exception):
+    """
+    モックバックエンドが起こすAPIエラー。SDKの例外と同じく code / status / details を持つため、
+    classify_api_error や get_retry_after からは本物のエラーと同じように見える。
+    """
+    def __init__(self, code: int, status: str, message: str, details: Optional[Dict[str, Any]] = None):
+        super().__init__(f"{code} {status}. {message}")
+        self.code = code
+        self.status = status
+        self.details = details
+
+# --- SDKの応答チャンクと同じ形のオブジェクト ---
+
+@dataclass
+class _MockInlineData:
+    data: bytes
+    mime_type: str
+
+@dataclass
+class _MockPart:
+    text: Optional[str] = None
+    inline_data: Optional[_MockInlineData] = None
+
+@dataclass
+class _MockContent:
+    parts: List[_MockPart]
+
+@dataclass
+class _MockCandidate:
+    content: _MockContent
+
+@dataclass
+class _MockChunk:
+    text: Optional[str]
+    candidates: List[_MockCandidate]
+
+    @classmethod
+    def of_text(cls, text: str) -> "_MockChunk":
+        return cls(text=text, candidates=[_MockCandidate(_MockContent([_MockPart(text=text)]))])
+
+    @classmethod
+    def of_audio(cls, data: bytes, mime_type: str) -> "_MockChunk":
+        return cls(text=None, candidates=[_MockCandidate(_MockContent([_MockPart(inline_data=_MockInlineData(data, mime_type))]))])
+
+# 応答の1手順。("sleep", 秒数) / ("chunk", チャンク) / ("raise", 例外)
+_Step = Tuple[str, Any]
+
+# --- 応答の中身 ---
+
+_TAG_PATTERN = re.compile(r"<[^>]+>")
+_HEADING_PATTERN = re.compile(r"^\s*###\s*(.+?)\s*$", re.MULTILINE)
+_OUTPUT_HEADING_PATTERN = re.compile(r"^\s*### 出力", re.MULTILINE)
+_MOCK_LINES = (
+    "今日はいい天気ですね。",
+    "そうですね、散歩にでも行きましょうか。",
+    "それは名案です。",
+    "では、準備をしてきます。",
+)
+
+def _prompt_text(contents: Any) -> str:
+    """generate_content_stream に渡された contents からプロンプトの文字列を取り出す。"""
+    if isinstance(contents, str):
+        return contents
+    texts = []
+    for content in contents if isinstance(contents, list) else [contents]:
+        for part in getattr(content, "parts", None) or []:
+            text = getattr(part, "text", None)
+            if text:
+                texts.append(text)
+    return "\n".join(texts)
+
+_SEPARATOR_PATTERN = re.compile(r"^\s*---\s*$", re.MULTILINE)
+
+def _section(prompt: str, heading: str, end_pattern: re.Pattern = _SEPARATOR_PATTERN) -> str:
+    """プロンプトの "### heading" の次の行から、end_pattern に一致する行 (既定は区切り線) の手前までを返す。"""
+    start = prompt.find(f"### {heading}")
+    if start < 0:
+        return ""
+    start = prompt.find("\n", start)
+    if start < 0:
+        return ""
+    end = end_pattern.search(prompt, start + 1)
+    return prompt[start + 1:end.start() if end else len(prompt)]
+
+def _is_speech_request(model: str, config: Any) -> bool:
+    modalities = getattr(config, "response_modalities", None) or []
+    return any(str(modality).lower() == "audio" for modality in modalities) or "tts" in (model or "").lower()
+
+def synthetic_text_response(prompt: str, config: Any, dialog_chars_per_line: int = 60) -> str:
+    """
+    プロンプトの種類 (台本・相槌の一括生成・相槌) に合わせて、検証を通る形の応答を作る。
+    台本は登場人物紹介の "### 名前" から話者を取り、シナリオの長さに比例した行数の「名前: セリフ」を返す。
+    相槌の挿入位置ができるよう、4行に1回は直前と同じ話者が続けて話す。
+    """
+    if "### 相槌リスト" in prompt:
+        try:
+            requests = json.loads(_section(prompt, "相槌リスト", _OUTPUT_HEADING_PATTERN).strip() or "[]")
+        except ValueError:
+            requests = []
+        return json.dumps(
+            [{"id": request.get("id"), "interjection": "なるほど"} for request in requests if isinstance(request, dict)],
+            ensure_ascii=False
+        )
+    if "### あなたの相槌" in prompt:
+        return "なるほど"
+    if "### 生成する台本" in prompt:
+        names = _HEADING_PATTERN.findall(_section(prompt, "登場人物紹介")) or ["語り手"]
+        scenario = _section(prompt, "シナリオの要約").strip()
+        line_count = max(2, math.ceil(len(scenario) / max(1, dialog_chars_per_line)))
+        return "\n\n".join(
+            f"{names[(i - i // 4) % len(names)]}: {_MOCK_LINES[i % len(_MOCK_LINES)]}" for i in range(line_count)
+        )
+    return "これはモックバックエンドの応答です。" * 4
+
+_tone_cache: Dict[int, bytes] = {}
+_tone_lock = threading.Lock()
+
+def _tone(sample_rate: int) -> bytes:
+    """1秒分の小さな音量の正弦波 (16bit PCM)。音声データはこれを繰り返して作る。"""
+    with _tone_lock:
+        tone = _tone_cache.get(sample_rate)
+        if tone is None:
+            samples = (int(1000 * math.sin(2 * math.pi * 440 * i / sample_rate)) for i in range(sample_rate))
+            tone = struct.pack(f"<{sample_rate}h", *samples)
+            _tone_cache[sample_rate] = tone
+        return tone
+
+class MockGeminiBackend:
+    """
+    genai.Client の models.generate_content_stream (と aio.models の同名メソッド) の代わりになる、ローカルの疑似バックエンド。
+    テキストは検証を通る形の合成文、音声は合成したPCMを、設定した速さとチャンクの大きさで少しずつ返す。
+    設定したスケジュールか確率に従って、429 / 5xx / 応答の停止を起こす。
+    すべてのAPIキー・モデルのクライアントで1つのバックエンドを共有し、リクエストの順番と統計を数える。
+    """
+    def __init__(self, config: Optional[MockBackendConfig] = None):
+        self.config = config if config is not None else MockBackendConfig()
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._request_count = 0
+        self._stats: Dict[str, float] = {
+            "requests": 0,
+            "text_requests": 0,
+            "speech_requests": 0,
+            "audio_seconds": 0.0,
+            **{f"event_{event}": 0 for event in MOCK_EVENTS},
+        }
+
+    def stats(self) -> Dict[str, float]:
+        """これまでのリクエスト数・起こしたイベントの数・返した音声の秒数を返す。"""
+        with self._lock:
+            return dict(self._stats)
+
+    def _next_event(self) -> str:
+        with self._lock:
+            index = self._request_count
+            self._request_count += 1
+            if self.config.schedule:
+                event = self.config.schedule[index % len(self.config.schedule)]
+            else:
+                roll = self._random.random()
+                event = EVENT_OK
+                for candidate, rate in (
+                        (EVENT_QUOTA, self.config.quota_error_rate),
+                        (EVENT_UNAVAILABLE, self.config.server_error_rate),
+                        (EVENT_STALL, self.config.stall_rate)):
+                    if roll < rate:
+                        event = candidate
+                        break
+                    roll -= rate
+            self._stats[f"event_{event}"] += 1
+            return event
+
+    def _error_for(self, event: str) -> MockApiError:
+        if event == EVENT_QUOTA:
+            details = None
+            if self.config.retry_after_seconds is not None:
+                details = {"error": {"details": [{
+                    "@type": "type.googleapis.com/google.rpc.RetryInfo",
+                    "retryDelay": f"{self.config.retry_after_seconds}s",
+                }]}}
+            return MockApiError(429, "RESOURCE_EXHAUSTED", "モックバックエンド: 利用枠を超過しました。", details)
+        if event == EVENT_SERVER:
+            return MockApiError(500, "INTERNAL", "モックバックエンド: サーバー内部のエラーです。")
+        return MockApiError(503, "UNAVAILABLE", "モックバックエンド: サーバーが一時的に使えません。")
+
+    def plan(self, model: str, contents: Any, config: Any) -> List[_Step]:
+        """1リクエスト分の応答を、待ち時間とチャンクの並びにする。同期・非同期のストリームはこれを順に実行する。"""
+        cfg = self.config
+        event = self._next_event()
+        prompt = _prompt_text(contents)
+        speech = _is_speech_request(model, config)
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["speech_requests" if speech else "text_requests"] += 1
+
+        if event in (EVENT_QUOTA, EVENT_SERVER, EVENT_UNAVAILABLE):
+            # エラーは最初のチャンクの前に、少し待ってから返す
+            return [("sleep", cfg.text_first_byte_seconds * 0.2), ("raise", self._error_for(event))]
+
+        steps: List[_Step] = []
+        if speech:
+            steps.append(("sleep", cfg.audio_first_byte_seconds))
+            text = _TAG_PATTERN.sub("", prompt)
+            duration = max(0.5, len(text.strip()) * cfg.audio_seconds_per_char)
+            bytes_per_second = cfg.audio_sample_rate * MOCK_AUDIO_BITS_PER_SAMPLE // 8
+            total_bytes = int(duration * bytes_per_second) // 2 * 2
+            chunk_bytes = max(2, cfg.audio_chunk_bytes // 2 * 2)
+            mime_type = f"audio/L{MOCK_AUDIO_BITS_PER_SAMPLE};codec=pcm;rate={cfg.audio_sample_rate}"
+            tone = _tone(cfg.audio_sample_rate)
+            for offset in range(0, total_bytes, chunk_bytes):
+                size = min(chunk_bytes, total_bytes - offset)
+                start = offset % len(tone)
+                data = (tone[start:] + tone)[:size] if start + size > len(tone) else tone[start:start + size]
+                steps.append(("chunk", _MockChunk.of_audio(data, mime_type)))
+                steps.append(("sleep", size / bytes_per_second * cfg.audio_real_time_factor))
+            with self._lock:
+                self._stats["audio_seconds"] += total_bytes / bytes_per_second
+        else:
+            steps.append(("sleep", cfg.text_first_byte_seconds))
+            text = synthetic_text_response(prompt, config, cfg.dialog_chars_per_line)
+            chunk_chars = max(1, cfg.text_chunk_chars)
+            for offset in range(0, len(text), chunk_chars):
+                piece = text[offset:offset + chunk_chars]
+                steps.append(("chunk", _MockChunk.of_text(piece)))
+                steps.append(("sleep", len(piece) / max(cfg.text_chars_per_second, 1e-6)))
+
+        if event in (EVENT_STALL, EVENT_TIMEOUT):
+            # 応答の途中 (最初のチャンクの後) で止める
+            position = min(2, len(steps))
+            steps.insert(position, ("sleep", cfg.stall_seconds))
+            if event == EVENT_TIMEOUT:
+                del steps[position + 1:]
+                steps.append(("raise", TimeoutError("モックバックエンド: 応答が止まったままタイムアウトしました。")))
+        return steps
+
+    def stream(self, model: str, contents: Any, config: Any) -> Iterator[_MockChunk]:
+        """models.generate_content_stream の代わり。"""
+        scale = self.config.time_scale
+        for kind, value in self.plan(model, contents, config):
+            if kind == "sleep":
+                if value > 0 and scale > 0:
+                    time.sleep(value * scale)
+            elif kind == "chunk":
+                yield value
+            else:
+                raise value
+
+    async def stream_async(self, model: str, contents: Any, config: Any) -> AsyncIterator[_MockChunk]:
+        """aio.models.generate_content_stream の代わり。待ち時間はイベントループを止めない。"""
+        scale = self.config.time_scale
+        for kind, value in self.plan(model, contents, config):
+            if kind == "sleep":
+                if value > 0 and scale > 0:
+                    await asyncio.sleep(value * scale)
+            elif kind == "chunk":
+                yield value
+            else:
+                raise value
+
+class _MockModels:
+    def __init__(self, backend: MockGeminiBackend):
+        self._backend = backend
+
+    def generate_content_stream(self, model: str, contents: Any, config: Any = None) -> Iterator[_MockChunk]:
+        return self._backend.stream(model, contents, config)
+
+class _MockAsyncModels:
+    def __init__(self, backend: MockGeminiBackend):
+        self._backend = backend
+
+    async def generate_content_stream(self, model: str, contents: Any, config: Any = None) -> AsyncIterator[_MockChunk]:
+        return self._backend.stream_async(model, contents, config)
+
+class _MockAsyncClient:
+    def __init__(self, backend: MockGeminiBackend):
+        self.models = _MockAsyncModels(backend)
+
+    async def aclose(self):
+        pass
+
+class MockGenaiClient:
+    """genai.Client の代わりに GeminiApiClient が持つクライアント。"""
+    def __init__(self, api_key: str, backend: MockGeminiBackend):
+        self.api_key = api_key
+        self.models = _MockModels(backend)
+        self.aio = _MockAsyncClient(backend)
+
+    def close(self):
+        pass
+
+def install_mock_backend(config: Optional[MockBackendConfig] = None) -> MockGeminiBackend:
+    """
+    以降に作られる GeminiApiClient が、APIの代わりにモックバックエンドを使うようにする。
+    既に作られたクライアントは変わらないため、APIクライアントを作る前に呼ぶこと。
+    """
+    backend = MockGeminiBackend(config)
+    set_client_factory(lambda api_key: MockGenaiClient(api_key, backend))
+    print(f"INFO: モックバックエンドを使います (APIは呼び出しません): {backend.config.to_dict()}")
+    return backend
+
+def uninstall_mock_backend():
+    """install_mock_backend を取り消し、以降のクライアントは本物のAPIを使う。"""
+    set_client_factory(None)
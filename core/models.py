@@ -1,6 +1,7 @@
 # AiRadioDramaCreator/core/models.py
 from google.genai import types
 
+import re
 from abc import ABC, abstractmethod
 from pathlib import Path
 from datetime import datetime
@@ -11,7 +12,8 @@ from typing import (
     Dict, 
     Union, 
     Any, 
-    Optional
+    Optional,
+    Tuple
 )
 
 @dataclass
@@ -27,14 +29,81 @@ class SpeechParams:
     temperature: float = 1.0
     # 今後、音声生成に関する共通パラメータが増えたらここに追加する
 
+@dataclass
+class RateLimit:
+    """
+    APIキー1つ・モデル1つあたりの利用上限。
+    None の項目は制限しないことを意味する。
+    """
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+
+    @classmethod
+    def from_wait_seconds(cls, wait_seconds: float) -> "RateLimit":
+        """従来の wait_seconds（ファイル間の待機秒数）を、同等のRPM制限に換算する。"""
+        if not isinstance(wait_seconds, (int, float)) or wait_seconds <= 0:
+            return cls()
+        return cls(requests_per_minute=60.0 / wait_seconds)
+
+    def to_dict(self) -> Dict[str, Optional[float]]:
+        return {"rpm": self.requests_per_minute, "tpm": self.tokens_per_minute}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RateLimit":
+        return cls(
+            requests_per_minute=data.get("rpm"),
+            tokens_per_minute=data.get("tpm")
+        )
+
+@dataclass
+class RetryPolicy:
+    """
+    API呼び出しのリトライ方針。
+    待機時間は base_delay から指数的に増やし (上限 max_delay)、ランダムな揺らぎを加える。
+    サーバーが待機時間を指定してきた場合はそちらを優先する。
+    """
+    max_attempts: int = 5
+    base_delay: float = 2.0
+    max_delay: float = 60.0
+    max_total_seconds: float = 600.0
+    jitter: float = 0.5
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "max_attempts": self.max_attempts,
+            "base_delay": self.base_delay,
+            "max_delay": self.max_delay,
+            "max_total_seconds": self.max_total_seconds,
+            "jitter": self.jitter,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RetryPolicy":
+        default = cls()
+        return cls(
+            max_attempts=data.get("max_attempts", default.max_attempts),
+            base_delay=data.get("base_delay", default.base_delay),
+            max_delay=data.get("max_delay", default.max_delay),
+            max_total_seconds=data.get("max_total_seconds", default.max_total_seconds),
+            jitter=data.get("jitter", default.jitter)
+        )
+
 @dataclass
 class Script:
+    """
+    台本の1発話 ("話者: 台詞" の1行)。
+    voice は話者名 (SSMLの解析結果ではボイス名)、speaker_index はその話者の ParsedDialog.speakers 内の番号。
+    line_number は元のテキストでの行番号 (0始まり)、span は台詞の元のテキスト内での位置 (開始, 終了)。
+    """
     order: int
     voice: str
     text : str
+    speaker_index: int = -1
+    line_number: int = -1
+    span: Tuple[int, int] = (0, 0)
 
     def get_line(self):
-        return "{self.voice}: {text}\n\n"
+        return f"{self.voice}: {self.text}\n\n"
 
 class Voice(Enum):
     """
@@ -141,6 +210,95 @@ class Character:
         # 各行を改行で結合し、最後にキャラクター間の区切りとして空行を2つ追加する
         return "\n".join(prompt_parts) + "\n\n"
 
+class CharacterNameIndex:
+    """
+    名前からキャラクターを引く索引。テキストに登場するキャラクターを1回の走査で見つける。
+    フルネームに加えて、空白や「・」で区切られた姓・名 (2文字以上) でも見つける。
+    """
+    def __init__(self, characters: List[Character]):
+        self.characters = list(characters)
+        self._aliases: Dict[str, List[int]] = {}
+        for i, char in enumerate(self.characters):
+            names = {char.name.strip()}
+            names.update(part for part in re.split(r'[\s・･]+', char.name) if len(part) >= 2)
+            for name in names:
+                if name:
+                    self._aliases.setdefault(name, []).append(i)
+        # 長い名前から順に照合し、フルネームの一部だけが別のキャラクターとして拾われないようにする
+        aliases = sorted(self._aliases, key=len, reverse=True)
+        self._pattern = re.compile("|".join(re.escape(name) for name in aliases)) if aliases else None
+
+    def find(self, text: str) -> List[Character]:
+        """text に名前が出てくるキャラクターを、登録順に返す。"""
+        if self._pattern is None:
+            return []
+        found = set()
+        for match in self._pattern.finditer(text):
+            found.update(self._aliases[match.group(0)])
+            if len(found) == len(self.characters):
+                break
+        return [char for i, char in enumerate(self.characters) if i in found]
+
+# 生成プロファイルの名前。後ろのものほど遅いが、出力の質が高い
+PROFILE_FAST = "fast"
+PROFILE_BALANCED = "balanced"
+PROFILE_QUALITY = "quality"
+PROFILE_ORDER = (PROFILE_FAST, PROFILE_BALANCED, PROFILE_QUALITY)
+
+# 生成プロファイルを選ぶ処理 (project.json の generation_settings.stages のキー)
+PROFILE_STAGE_DIALOG = "dialog"
+PROFILE_STAGE_INTERJECTION = "interjection"
+
+@dataclass
+class GenerationProfile:
+    """
+    テキスト生成の速さと質の兼ね合いを決める設定。
+    thinking_budget は思考に使うトークン数 (0 で思考しない、-1 でモデルに任せる)、
+    max_output_tokens は出力の上限、model は使うモデル (None の場合はプロジェクトの text_model)。
+    """
+    name: str
+    thinking_budget: int = -1
+    max_output_tokens: int = 65536
+    model: Optional[str] = None
+
+    def write_config(self, response_mime_type: Optional[str] = None) -> "WriteConfig":
+        return WriteConfig(
+            max_output_tokens=self.max_output_tokens,
+            thinking_budget=self.thinking_budget,
+            response_mime_type=response_mime_type
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "thinking_budget": self.thinking_budget,
+            "max_output_tokens": self.max_output_tokens,
+            "model": self.model,
+        }
+
+    @classmethod
+    def from_dict(cls, name: str, data: Dict[str, Any], default: Optional["GenerationProfile"] = None) -> "GenerationProfile":
+        default = default or cls(name)
+        return cls(
+            name=name,
+            thinking_budget=data.get("thinking_budget", default.thinking_budget),
+            max_output_tokens=data.get("max_output_tokens", default.max_output_tokens),
+            model=data.get("model", default.model)
+        )
+
+def default_generation_profiles() -> Dict[str, GenerationProfile]:
+    """組み込みの生成プロファイルを返す。quality は従来の WriteConfig() の既定値と同じ。"""
+    return {
+        PROFILE_FAST: GenerationProfile(PROFILE_FAST, thinking_budget=0, max_output_tokens=8192),
+        PROFILE_BALANCED: GenerationProfile(PROFILE_BALANCED, thinking_budget=1024, max_output_tokens=16384),
+        PROFILE_QUALITY: GenerationProfile(PROFILE_QUALITY, thinking_budget=-1, max_output_tokens=65536),
+    }
+
+# 処理ごとの既定のプロファイル。台本は従来どおり quality、相槌は fast から始める
+DEFAULT_STAGE_PROFILES = {
+    PROFILE_STAGE_DIALOG: PROFILE_QUALITY,
+    PROFILE_STAGE_INTERJECTION: PROFILE_FAST,
+}
+
 class SceneConfig(ABC):
     """
     あらゆる生成タスクの設定を構築するための汎用的な抽象基底クラス。
@@ -534,7 +692,28 @@ class Project:
         updated_date: Optional[str] = None,
         root_path: Optional[str] = None,
         characters: Optional[List[Character]] = None,
-        wait_time: int = 30
+        wait_time: int = 30,
+        max_workers: int = 2,
+        rate_limits: Optional[Dict[str, RateLimit]] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        audio_cache_max_mb: int = 2048,
+        segmented_audio: bool = False,
+        audio_format: str = "mp3",
+        pipeline_queue_size: int = 2,
+        response_cache_enabled: bool = True,
+        response_cache_max_mb: int = 256,
+        interjection_mode: str = "off",
+        interjection_max_workers: int = 4,
+        interjection_memo_enabled: bool = True,
+        interjection_memo_variants: int = 3,
+        interjection_memo_max_mb: int = 64,
+        dialog_chunk_chars: int = 0,
+        dialog_chunk_workers: int = 4,
+        dialog_slim_prompt: bool = True,
+        dialog_profile_max_tokens: int = 0,
+        generation_profiles: Optional[Dict[str, GenerationProfile]] = None,
+        stage_profiles: Optional[Dict[str, str]] = None,
+        profile_escalation: bool = True
     ):
         self.project_name = project_name
         self.project_description = project_description
@@ -567,6 +746,69 @@ class Project:
         self.characters = characters if characters is not None else []
         
         self.wait_time = wait_time
+        # 音声生成を同時に実行するファイル数の上限
+        self.max_workers = max_workers
+        # モデル名をキーにした、APIキー1つあたりのRPM/TPM制限
+        self.rate_limits = rate_limits if rate_limits is not None else {}
+        # API呼び出しが一時的なエラーで失敗した場合のリトライ方針
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        # 生成済み音声キャッシュ (.cache/audio) の容量上限 (MB)
+        self.audio_cache_max_mb = audio_cache_max_mb
+        # True の場合、音声を発話単位で生成・キャッシュし、編集した発話だけを生成し直す
+        self.segmented_audio = segmented_audio
+        # WAVと同時に作る圧縮ファイルの形式 ("mp3" / "opus" / "wav" は圧縮なし)
+        self.audio_format = audio_format
+        # 一括実行 (台本 → SSML → 音声) で、ステージ間に溜めておけるファイル数の上限
+        self.pipeline_queue_size = pipeline_queue_size
+        # テキスト生成の応答キャッシュ (.cache/responses) を使うかどうかと、その容量上限 (MB)
+        self.response_cache_enabled = response_cache_enabled
+        self.response_cache_max_mb = response_cache_max_mb
+        # SSML生成時にAIの相槌を挿入するかどうかと、その生成方法 ("off" / "batch" / "per_spot")
+        self.interjection_mode = interjection_mode
+        # 相槌を1箇所ずつ生成する場合に、同時に実行するリクエスト数の上限
+        self.interjection_max_workers = interjection_max_workers
+        # 生成した相槌を (キャラクター, 直前のセリフ) ごとに覚えておく相槌メモ (.cache/interjections) を使うかどうかと、
+        # 1つのキーに覚えるパターン数 (この数がたまるまでは新しく生成する)、容量上限 (MB。応答キャッシュとは別枠)
+        self.interjection_memo_enabled = interjection_memo_enabled
+        self.interjection_memo_variants = interjection_memo_variants
+        self.interjection_memo_max_mb = interjection_memo_max_mb
+        # 長いシナリオを場面の境目で分けて台本を並行生成する場合の、1チャンクの最大文字数 (0 の場合は分けない) と並列数
+        self.dialog_chunk_chars = dialog_chunk_chars
+        self.dialog_chunk_workers = dialog_chunk_workers
+        # 台本生成のプロンプトに、シナリオに登場するキャラクターの紹介だけを入れるかどうかと、
+        # 1人分の紹介のトークン数の上限 (0 の場合は制限しない)
+        self.dialog_slim_prompt = dialog_slim_prompt
+        self.dialog_profile_max_tokens = dialog_profile_max_tokens
+        # 生成プロファイル (fast / balanced / quality) と、処理ごとに使うプロファイル名。
+        # profile_escalation が True の場合、出力が検証を通らなければ、より上のプロファイルで生成し直す
+        self.generation_profiles = generation_profiles if generation_profiles is not None else default_generation_profiles()
+        self.stage_profiles = {**DEFAULT_STAGE_PROFILES, **(stage_profiles or {})}
+        self.profile_escalation = profile_escalation
+        self._name_index: Optional[CharacterNameIndex] = None
+        self._name_index_key = None
+
+    def profile_chain(self, stage: str) -> List[GenerationProfile]:
+        """
+        処理 (PROFILE_STAGE_*) で使う生成プロファイルを、試す順に返す。
+        先頭は設定されたプロファイルで、profile_escalation が有効なら、それより上のプロファイルが続く。
+        """
+        name = self.stage_profiles.get(stage, PROFILE_QUALITY)
+        if name not in self.generation_profiles:
+            print(f"警告: 生成プロファイル '{name}' が見つかりません。'{PROFILE_QUALITY}' を使います。")
+            name = PROFILE_QUALITY
+        names = [name]
+        if self.profile_escalation and name in PROFILE_ORDER:
+            names += [later for later in PROFILE_ORDER[PROFILE_ORDER.index(name) + 1:] if later in self.generation_profiles]
+        return [self.generation_profiles[n] for n in names]
+
+    @property
+    def character_name_index(self) -> CharacterNameIndex:
+        """キャラクター名の索引。キャラクターの追加・削除や名前の変更があれば作り直す。"""
+        key = tuple((id(char), char.name) for char in self.characters)
+        if self._name_index is None or self._name_index_key != key:
+            self._name_index = CharacterNameIndex(self.characters)
+            self._name_index_key = key
+        return self._name_index
 
 class SpeechConfig:
     def __init__(self, temperature=1.0, modalities=["audio"], speakers: Dict=None):
@@ -651,11 +893,13 @@ class SpeechConfig:
             self.get_simple_config()
 
 class WriteConfig:
-    def __init__(self, temperature=1.0, top_p=0.95, max_output_tokens=65536, thinking_budget=-1):
+    def __init__(self, temperature=1.0, top_p=0.95, max_output_tokens=65536, thinking_budget=-1, response_mime_type=None):
         self.temperature = temperature
         self.top_p = top_p
         self.max_output_tokens = max_output_tokens
         self.thinking_budget = thinking_budget
+        # "application/json" を指定すると、応答をJSONとして出力させる
+        self.response_mime_type = response_mime_type
         self.model_config = self._create_content_config()
 
     def _create_content_config(self):
@@ -666,4 +910,18 @@ class WriteConfig:
             thinking_config = types.ThinkingConfig(
                 thinking_budget = self.thinking_budget,
             ),
+            response_mime_type=self.response_mime_type,
         )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """生成結果に影響するパラメータを返す。キャッシュやマニフェストの照合に使う。"""
+        params = {
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "max_output_tokens": self.max_output_tokens,
+            "thinking_budget": self.thinking_budget,
+        }
+        # 未指定の場合は含めない (指定が無かった頃のキャッシュのキーを変えないため)
+        if self.response_mime_type is not None:
+            params["response_mime_type"] = self.response_mime_type
+        return params
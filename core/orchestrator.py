@@ -1,33 +1,83 @@
-import time
 from pathlib import Path
+from contextlib import nullcontext
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import traceback
 import sys
-from typing import Dict, List
+from typing import Awaitable, Callable, Dict, List, Optional
 
 
 try:
     from .models import (
         SpeechConfig, 
-        Character
+        Character,
+        CharacterNameIndex,
+        GenerationProfile,
+        Project
     )
     from .generators import SpeechGenerator
-    from .api_client import ApiKeyManager
-    from utils.ssml_utils import convert_dialog_to_ssml
+    from .cache import AudioCache, InterjectionMemo, ResponseCache, SegmentCache
+    from .audio_io import (
+        EncodingWavWriter,
+        parse_audio_mime_type
+    )
+    from .api_client import (
+        ApiKeyManager,
+        GeminiApiClient,
+        GeminiApiClientPool,
+        estimate_tokens
+    )
+    from utils.ssml_utils import (
+        SsmlSegment,
+        build_ssml,
+        build_ssml_from_segments,
+        compile_ssml_file,
+        group_segments_by_speakers,
+        split_ssml_segments
+    )
     from utils.text_processing import (
+        DEFAULT_DIALOG_CHUNK_WORKERS,
+        DEFAULT_INTERJECTION_WORKERS,
+        INTERJECTION_MODE_OFF,
         create_dialog, 
         get_ordered_characters, 
         add_ai_interjections
     )
+    from utils.dialog_parser import (
+        load_parsed_dialog,
+        parse_dialog,
+        parse_dialog_file,
+        save_parsed_dialog
+    )
 except ImportError as e:
     print(f"モジュールのインポートエラー: {e}")
 
+# 音声APIの複数話者設定で1リクエストに指定できる話者数の上限
+MAX_SPEAKERS_PER_REQUEST = 2
+
 def generate_dialog_from_script(
         txt_file: Path, 
         dialog_output_dir: Path, 
         characters: List[Character], 
-        text_client: 'GeminiApiClient') -> Path | None:
+        text_client: Optional['GeminiApiClient'] = None,
+        response_cache: Optional[ResponseCache] = None,
+        client_provider: Optional[Callable[[int, Optional[str]], Optional['GeminiApiClient']]] = None,
+        model_name: Optional[str] = None,
+        chunk_chars: int = 0,
+        chunk_workers: int = DEFAULT_DIALOG_CHUNK_WORKERS,
+        name_index: Optional[CharacterNameIndex] = None,
+        profile_max_tokens: int = 0,
+        profiles: Optional[List[GenerationProfile]] = None,
+        stop_event: Optional[threading.Event] = None) -> Path | None:
     """
     シナリオファイルから台本を生成し、ファイルに保存する。
+    response_cache を指定すると、シナリオ・キャラクター・モデル・パラメータが同じ場合はAPIを呼ばずに前回の台本を使う。
+    text_client の代わりに client_provider を渡した場合、キャッシュに無いときだけ、使う生成プロファイルのモデルの利用枠を確保する。
+    chunk_chars を指定すると、それより長いシナリオは場面の境目で分けて、最大 chunk_workers 件ずつ並行に生成する。
+    name_index (Project.character_name_index) を指定すると、シナリオに登場するキャラクターの紹介だけをプロンプトに入れ、
+    profile_max_tokens を指定すると1人分の紹介をその推定トークン数までに切り詰める。
+    profiles (Project.profile_chain) には試す順に生成プロファイルを渡す。台本が「名前: セリフ」形式でなければ次のプロファイルで生成し直す。
+    stop_event がセットされると、APIのリトライの待機を打ち切る。
     """
     print(f"INFO: Converting script '{txt_file.name}' to dialog...")
 
@@ -39,7 +89,18 @@ def generate_dialog_from_script(
         return None
     
     # create_dialog関数を呼び出し、text_clientを渡す
-    script_dialog = create_dialog(original_text, characters, text_client)
+    script_dialog = create_dialog(
+        original_text, characters, text_client,
+        response_cache=response_cache,
+        client_provider=client_provider,
+        model_name=model_name,
+        chunk_chars=chunk_chars,
+        chunk_workers=chunk_workers,
+        name_index=name_index,
+        profile_max_tokens=profile_max_tokens,
+        profiles=profiles,
+        stop_event=stop_event
+    )
     
     # 生成された内容が空でないかチェック
     if not script_dialog:
@@ -67,10 +128,28 @@ def generate_dialog_from_script(
         print(f"ERROR: Error saving Dialog file: {e}")
         return None
 
-def generate_ssml_from_text(txt_file: Path, ssml_output_dir: Path, characters: List[Character], text_client) -> Path | None:
+def generate_ssml_from_text(
+        txt_file: Path,
+        ssml_output_dir: Path,
+        characters: List[Character],
+        text_client: Optional['GeminiApiClient'] = None,
+        interjection_mode: str = INTERJECTION_MODE_OFF,
+        interjection_max_workers: int = DEFAULT_INTERJECTION_WORKERS,
+        interjection_memo: Optional[InterjectionMemo] = None,
+        interjection_profiles: Optional[List[GenerationProfile]] = None,
+        client_provider: Optional[Callable[[int, Optional[str]], Optional['GeminiApiClient']]] = None,
+        async_client_provider: Optional[Callable[[int, Optional[str]], Awaitable[Optional['GeminiApiClient']]]] = None,
+        stop_event: Optional[threading.Event] = None) -> Path | None:
     """
     台本ファイルからSSMLを生成し、ファイルに保存する。
     Characterオブジェクトのリストを扱うように修正されています。
+    interjection_mode が "off" の場合は、台本を1行ずつ読みながらSSMLファイルへ直接書き出す (compile_ssml_file)。
+    "batch" / "per_spot" の場合は、同じ話者が続く箇所にAIの相槌を挿入してから変換する
+    (1箇所ずつの生成は最大 interjection_max_workers 件を並行に実行し、interjection_memo に覚えた相槌を再利用する)。
+    相槌は interjection_profiles の先頭の生成プロファイルで生成し、使えない応答だった箇所は次のプロファイルで生成し直す。
+    text_client の代わりに client_provider / async_client_provider を渡すと、相槌のリクエストごとに利用枠を確保する
+    ("off" の場合や、相槌メモだけで済んだ場合は確保しない)。
+    stop_event がセットされると相槌の生成を打ち切り、SSMLを保存せずに None を返す。
     成功した場合はSSMLファイルのPathオブジェクトを、失敗した場合は None を返す。
     """
 
@@ -83,6 +162,18 @@ def generate_ssml_from_text(txt_file: Path, ssml_output_dir: Path, characters: L
         print("  キャラクターリストが空またはNoneです。")
     print("="*50 + "\n")
 
+    ssml_output_path = ssml_output_dir / txt_file.with_suffix(".ssml").name
+
+    if interjection_mode == INTERJECTION_MODE_OFF:
+        # 相槌を挿入しない場合は、台本を1行ずつ読みながらSSMLファイルへ直接書き出す
+        print("台本をSSMLに変換しています...")
+        utterance_count = compile_ssml_file(txt_file, ssml_output_path, characters)
+        if utterance_count is None:
+            print(f"SSMLの生成結果が空です ({txt_file.name})。")
+            return None
+        print(f"SSMLをファイルに保存しました: {ssml_output_path} ({utterance_count}発話)")
+        return ssml_output_path
+
     try:
         with open(txt_file, 'r', encoding='utf-8-sig') as f:
             original_dialog = f.read()
@@ -90,121 +181,627 @@ def generate_ssml_from_text(txt_file: Path, ssml_output_dir: Path, characters: L
         print(f"File read error: {e}")
         return None
 
-    # --- 依存するヘルパー関数の呼び出しを、新しい形式に統一 ---
+    # 相槌の挿入位置を探すため、台本全体を1度だけ解析する。
+    # 結果は台本ファイルの横に保存しておく (内容が変わっていなければ次回はそれを使う)
+    parsed_dialog = parse_dialog_file(txt_file, original_dialog)
 
-    # # 注意: add_ai_interjections 関数も List[Character] を受け取れるように修正が必要です
-    # print("相槌・間を挿入しています...")
-    # dialog_with_interjections = add_ai_interjections(original_dialog, characters, text_client)
-    # print("\n--- 相槌挿入後の台本 ---\n" + dialog_with_interjections + "\n---------------------------------\n")
-
-    dialog_with_interjections = original_dialog
+    print("相槌・間を挿入しています...")
+    dialog_with_interjections = add_ai_interjections(
+        original_dialog, characters, text_client,
+        mode=interjection_mode,
+        max_workers=interjection_max_workers,
+        memo=interjection_memo,
+        parsed=parsed_dialog,
+        profiles=interjection_profiles,
+        client_provider=client_provider,
+        async_client_provider=async_client_provider,
+        stop_event=stop_event
+    )
+    if stop_event is not None and stop_event.is_set():
+        # 相槌が途中までしか入っていない台本からSSMLを作らない
+        print(f"相槌の生成が中断されました ({txt_file.name})。")
+        return None
+    original_count = len(parsed_dialog.utterances)
+    parsed_dialog = parse_dialog(dialog_with_interjections)
+    print(f"相槌を{len(parsed_dialog.utterances) - original_count}行挿入しました ({txt_file.name})。")
 
-    # 以前修正した get_ordered_characters を使用
     print("話者の登場順を特定しています...")
-    ordered_characters = get_ordered_characters(dialog_with_interjections, characters)
+    ordered_characters = parsed_dialog.ordered_characters(characters)
     if not ordered_characters:
         print("テキストから既知のキャラクターが見つかりませんでした。処理を中断します。")
         return None
     
-    # 注意: convert_dialog_to_ssml 関数も List[Character] を受け取れるように修正が必要です
     print("台本をSSMLに変換しています...")
-    ssml_dialog = convert_dialog_to_ssml(dialog_with_interjections, ordered_characters)
-    print(ssml_dialog)
+    ssml_dialog, parsed_ssml = build_ssml(parsed_dialog, ordered_characters)
 
-    if not ssml_dialog or not ssml_dialog.strip('<speak></speak>\n '):
+    if not parsed_ssml.utterances:
         print(f"SSMLの生成結果が空です ({txt_file.name})。")
         return None
 
-    # --- SSMLをファイルに保存するロジック (この部分は変更不要) ---
     try:
-        ssml_output_path = ssml_output_dir / txt_file.with_suffix(".ssml").name
         ssml_output_dir.mkdir(parents=True, exist_ok=True)
         
         with open(ssml_output_path, 'w', encoding='utf-8') as f:
             f.write(ssml_dialog)
+        # 音声生成でSSMLを解析し直さずに話者を特定できるよう、SSMLの解析結果も横に保存する
+        save_parsed_dialog(ssml_output_path, ssml_dialog, parsed_ssml)
         
-        print(f"SSMLをファイルに保存しました: {ssml_output_path}")
+        print(f"SSMLをファイルに保存しました: {ssml_output_path} ({len(parsed_ssml.utterances)}発話)")
         return ssml_output_path
 
     except Exception as e:
         print(f"エラー: SSMLファイルの保存に失敗しました: {e}")
         return None
 
+def _audio_cache_key(
+        ssml_dialog_content: str,
+        speakers_for_audio: Dict[str, str],
+        model_name: str,
+        speech_config: SpeechConfig,
+        audio_format: Optional[str]) -> str:
+    """音声キャッシュのキー (SSML・話者とボイスの対応・モデル名・temperature・圧縮形式のハッシュ) を返す。"""
+    return AudioCache.make_key(ssml_dialog_content, speakers_for_audio, model_name, speech_config.temperature, audio_format)
+
 def generate_audio_from_ssml(
     ssml_file_path: Path,
     audio_output_dir: Path,
     characters: List[Character], # ★引数を speakers_dict から characters に変更
-    speech_client
+    speech_client=None,
+    audio_cache: Optional[AudioCache] = None,
+    client_provider: Optional[Callable[[int], Optional[GeminiApiClient]]] = None,
+    model_name: Optional[str] = None,
+    max_parallel_runs: int = 2,
+    audio_format: Optional[str] = "mp3",
+    stop_event: Optional[threading.Event] = None,
+    speech_slots: Optional[threading.Semaphore] = None
     ):
     """
     SSMLファイルから音声ファイルを生成する。
     Characterオブジェクトのリストを扱うように修正されています。
+    audio_cache を渡した場合、SSML・話者設定・モデル・temperature が前回と同じなら
+    APIを呼ばずにキャッシュ済みの音声をコピーする。
+    音声APIの複数話者設定は2人までのため、3人以上が登場する場合は話者が2人以下の連続した区間に分け、
+    区間ごとに最大 max_parallel_runs 件を並行に生成してつなげる。
+    WAVと同時に、生成中のPCMを ffmpeg に流して audio_format ("mp3" / "opus") の圧縮ファイルを作る。
+
+    speech_client の代わりに client_provider (推定トークン数を受け取り、利用枠を確保したクライアントを返す関数) を
+    渡すと、API呼び出しごとに利用枠を確保する。中断時に None を返すと生成を打ち切る。
+    stop_event がセットされると、APIのリトライの待機を打ち切る。
+    speech_slots (AudioRenderEngine が共有するセマフォ) を渡すと、音声APIの呼び出しごとに1枠を確保する。
+    区間に分けて並行に生成する場合も、複数ファイルの生成と合わせた同時呼び出し数がエンジンの上限を超えない。
+    成功した場合は生成した音声ファイルのPathオブジェクトを、失敗した場合は None を返す。
     """
     print(f"DEBUG: Entering generate_audio_from_ssml for {ssml_file_path.name}")
+
+    if client_provider is None:
+        if speech_client is None:
+            raise ValueError("speech_client か client_provider のどちらかを指定してください。")
+        client_provider = lambda estimated_tokens: speech_client
+    if model_name is None and speech_client is not None:
+        model_name = speech_client.model_name
     
     try:
         with open(ssml_file_path, 'r', encoding='utf-8') as f:
             ssml_dialog_content = f.read()
     except Exception as e:
         print(f"エラー: SSMLファイル '{ssml_file_path}' の読み込みに失敗しました: {e}")
-        return
+        return None
 
-    # ★変更点: SSMLの内容から「Characterオブジェクト」の登場順リストを再生成
-    ordered_characters_for_audio = get_ordered_characters(ssml_dialog_content, characters)
+    # SSMLの生成時に保存した解析結果があれば、そこから「Characterオブジェクト」の登場順リストを得る。
+    # 手で編集したSSMLなど、解析結果が内容と一致しない場合だけSSMLを解析し直す
+    parsed_ssml = load_parsed_dialog(ssml_file_path, ssml_dialog_content)
+    if parsed_ssml is not None:
+        ordered_characters_for_audio = parsed_ssml.ordered_characters(characters, by_voice=True)
+    else:
+        ordered_characters_for_audio = get_ordered_characters(ssml_dialog_content, characters)
     
     if not ordered_characters_for_audio:
         print("SSMLから既知のキャラクターが見つかりませんでした。音声生成を中断します。")
-        return
+        return None
     
     speakers_for_audio = {char.name: char.voice.api_name for char in ordered_characters_for_audio}
     print(speakers_for_audio)
     speech_config = SpeechConfig(speakers=speakers_for_audio)
 
-    # SpeechGeneratorの呼び出し
-    dialog_generator = SpeechGenerator(
-        api_conn=speech_client, 
-        speech_config=speech_config,
-        ssml_dialog=ssml_dialog_content,
-        parent=audio_output_dir, 
-        basename=ssml_file_path.stem
-    )
+    cache_key = None
+    if audio_cache is not None and model_name:
+        cache_key = _audio_cache_key(ssml_dialog_content, speakers_for_audio, model_name, speech_config, audio_format)
+        cached_path = audio_cache.restore(cache_key, audio_output_dir, ssml_file_path.stem, audio_format)
+        if cached_path:
+            print(f"キャッシュ済みの音声を使用しました (APIは呼び出していません): {cached_path.name}")
+            return cached_path
+
+    if len(ordered_characters_for_audio) > MAX_SPEAKERS_PER_REQUEST:
+        output_path = _generate_audio_in_speaker_runs(
+            ssml_file_path, ssml_dialog_content, audio_output_dir, characters,
+            client_provider, max_parallel_runs, audio_format, stop_event, speech_slots
+        )
+    else:
+        with speech_slots or nullcontext():
+            speech_client = client_provider(estimate_tokens(ssml_dialog_content))
+            if speech_client is None:
+                return None
+
+            # SpeechGeneratorの呼び出し
+            dialog_generator = SpeechGenerator(
+                api_conn=speech_client, 
+                speech_config=speech_config,
+                ssml_dialog=ssml_dialog_content,
+                parent=audio_output_dir, 
+                basename=ssml_file_path.stem,
+                audio_format=audio_format,
+                stop_event=stop_event
+            )
+
+            print("音声を生成しています...")
+            output_path = dialog_generator.generate()
+
+    if not output_path:
+        print(f"エラー: 音声ファイルの生成に失敗しました: {ssml_file_path.name}")
+        return None
+
+    print(f"音声ファイルの生成が完了しました: {output_path.name}")
+
+    if cache_key is not None:
+        # 今回書き出したWAVと圧縮ファイル (output_path) だけを登録する。
+        # 出力先に残っている前回の別形式のファイルは、古いSSMLから作ったものかもしれないため登録しない
+        written = {audio_output_dir / f"{ssml_file_path.stem}.wav", output_path}
+        audio_cache.store(cache_key, sorted(written))
+
+    return output_path
+
+def _generate_audio_in_speaker_runs(
+    ssml_file_path: Path,
+    ssml_dialog_content: str,
+    audio_output_dir: Path,
+    characters: List[Character],
+    client_provider: Callable[[int], Optional[GeminiApiClient]],
+    max_parallel_runs: int,
+    audio_format: Optional[str],
+    stop_event: Optional[threading.Event] = None,
+    speech_slots: Optional[threading.Semaphore] = None
+    ) -> Optional[Path]:
+    """
+    話者が2人以下の連続した区間ごとに、その区間の話者だけの複数話者設定で音声を並行に生成し、
+    元の順番でPCMをつなげて1つの音声ファイルにする。
+    各区間のAPI呼び出しは speech_slots の枠を確保してから行う。
+    1区間でも失敗した場合は、まだ始まっていない区間をキャンセルし、実行中の区間の完了を待たずに None を返す。
+    """
+    voice_to_char_map = {char.voice.api_name: char for char in characters}
+    runs = group_segments_by_speakers(split_ssml_segments(ssml_dialog_content), MAX_SPEAKERS_PER_REQUEST)
+    if not runs:
+        print(f"SSMLに <p><voice> 形式の発話が見つかりませんでした: {ssml_file_path.name}")
+        return None
+
+    print(f"話者が{MAX_SPEAKERS_PER_REQUEST}人を超えるため、{len(runs)}区間に分けて最大{max_parallel_runs}並列で生成します。")
+
+    # 他の区間が失敗した後は、枠の空きを待っていた区間もAPIを呼ばずに終える
+    aborted = threading.Event()
 
-    print("音声を生成しています...")
-    dialog_generator.generate()
-    print(f"音声ファイルの生成が完了しました: {ssml_file_path.stem}.mp3")
+    def synthesize_run(run_index: int, run: List[SsmlSegment]):
+        speakers = {}
+        for segment in run:
+            character = voice_to_char_map.get(segment.voice_name)
+            if character is not None:
+                speakers[character.name] = segment.voice_name
+        run_ssml = build_ssml_from_segments(run)
 
-def run_project_processing(config: dict, key_manager: ApiKeyManager):
-    """プロジェクト全体を処理するCLIのメインフロー"""
-    project_name = config.get("project_settings", {}).get("project_name", "Untitled Project")
-    print(f"\nプロジェクト '{project_name}' の処理を開始します。")
+        with speech_slots or nullcontext():
+            if aborted.is_set():
+                return None
+            speech_client = client_provider(estimate_tokens(run_ssml))
+            if speech_client is None:
+                return None
 
+            generator = SpeechGenerator(
+                api_conn=speech_client,
+                speech_config=SpeechConfig(speakers=speakers),
+                ssml_dialog=run_ssml,
+                parent=audio_output_dir,
+                basename=f"{ssml_file_path.stem} 区間{run_index + 1}/{len(runs)}",
+                stop_event=stop_event
+            )
+            pcm, mime_type = generator.synthesize()
+        if not pcm or not mime_type:
+            raise RuntimeError(f"区間 {run_index + 1} の音声データが返されませんでした。")
+        parameters = parse_audio_mime_type(mime_type)
+        return pcm, parameters["rate"], parameters["bits_per_sample"]
+
+    wav_file = audio_output_dir / f"{ssml_file_path.stem}.wav"
+    writer: Optional[EncodingWavWriter] = None
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_parallel_runs, len(runs))), thread_name_prefix="speaker-run")
+    futures = [executor.submit(synthesize_run, i, run) for i, run in enumerate(runs)]
     try:
-        file_paths = config["file_paths"]
-        root_path = Path(file_paths["root"])
-        dialog_path = (root_path / file_paths.get("dialog", "../dialog")).resolve()
-        audio_path = (root_path / file_paths.get("audio", "../audio")).resolve()
-        
-        print(f"Project Root: {root_path}")
-        print(f"Dialogs from: {dialog_path}")
-        print(f"Audio output to: {audio_path}")
-        
-        dialog_path.mkdir(parents=True, exist_ok=True)
-        audio_path.mkdir(parents=True, exist_ok=True)
+        # 前の区間から順に、生成が終わったものをすぐにファイル (とエンコーダー) へ流す
+        for i, future in enumerate(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"エラー: 区間 {i + 1} の音声生成に失敗しました ({ssml_file_path.name}): {e}")
+                return None
+            if result is None:
+                return None
+
+            pcm, sample_rate, bits_per_sample = result
+            if writer is None:
+                writer = EncodingWavWriter(wav_file, sample_rate, bits_per_sample, audio_format=audio_format)
+            elif (writer.sample_rate, writer.bits_per_sample) != (sample_rate, bits_per_sample):
+                print(f"エラー: 区間 {i + 1} の音声形式 {sample_rate}Hz/{bits_per_sample}bit が他の区間と異なるため連結できません。")
+                return None
+            writer.write(pcm)
+
+        if writer is None:
+            return None
+        writer.close()
+    finally:
+        # 失敗した場合は残りの区間を打ち切る。実行中のAPI呼び出しの完了は待たない
+        aborted.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        # 途中で終わった場合は書きかけの一時ファイルを消す (close() 済みなら何もしない)
+        if writer is not None:
+            writer.abort()
+
+    return writer.encoded_path or wav_file
+
+def generate_segmented_audio_from_ssml(
+    ssml_file_path: Path,
+    audio_output_dir: Path,
+    characters: List[Character],
+    model_name: str,
+    client_provider: Callable[[int], Optional[GeminiApiClient]],
+    segment_cache: Optional[SegmentCache] = None,
+    stop_event: Optional[threading.Event] = None,
+    audio_format: Optional[str] = "mp3"
+    ) -> Optional[Path]:
+    """
+    SSMLファイルを発話 (<p><voice>) 単位に分けて音声を生成し、つなげて1つの音声ファイルにする。
+    segment_cache にある発話はAPIを呼ばずに再利用するため、台詞を一部だけ直した場合は
+    変更のあった発話だけが生成し直される。
+
+    Args:
+        model_name (str): 音声モデル名。キャッシュの照合に使う。
+        client_provider (Callable): 推定トークン数を受け取り、利用枠を確保したAPIクライアントを返す関数。
+            キャッシュに無い発話ごとに呼ばれる。中断時は None を返す。
+        stop_event (threading.Event): セットされたら、次の発話に進まずに中断する。
+        audio_format (str): WAVと同時に作る圧縮ファイルの形式 ("mp3" / "opus")。None の場合はWAVのみ。
+
+    Returns:
+        生成した音声ファイルのPath。失敗または中断した場合は None。
+    """
+    try:
+        ssml_dialog_content = ssml_file_path.read_text(encoding='utf-8')
     except Exception as e:
-        print(f"エラー: プロジェクトのパス解決中に問題が発生しました。: {e}")
+        print(f"エラー: SSMLファイル '{ssml_file_path}' の読み込みに失敗しました: {e}")
+        return None
+
+    segments = split_ssml_segments(ssml_dialog_content)
+    if not segments:
+        print(f"SSMLに <p><voice> 形式の発話が見つかりませんでした: {ssml_file_path.name}")
+        return None
+
+    voice_to_char_map = {char.voice.api_name: char for char in characters}
+    speech_configs: Dict[str, SpeechConfig] = {}
+    wav_file = audio_output_dir / f"{ssml_file_path.stem}.wav"
+    # 発話の音声は届いた順にファイルへ追記し、ファイル全体をメモリに持たない
+    writer: Optional[EncodingWavWriter] = None
+    reused = 0
+
+    try:
+        for segment in segments:
+            if stop_event is not None and stop_event.is_set():
+                print(f"中断しました: {ssml_file_path.name} ({segment.index}/{len(segments)} 発話まで処理済み)")
+                return None
+
+            character = voice_to_char_map.get(segment.voice_name)
+            if character is None:
+                print(f"警告: ボイス名 '{segment.voice_name}' に対応するキャラクターが見つかりません。発話 {segment.index + 1} をスキップします。")
+                continue
+
+            # 1発話は1人の話者なので、単一話者の設定で生成する
+            if character.name not in speech_configs:
+                speech_configs[character.name] = SpeechConfig(speakers={character.name: segment.voice_name})
+            speech_config = speech_configs[character.name]
+
+            segment_ssml = segment.to_ssml()
+            cache_key = SegmentCache.make_key(
+                segment_ssml, character.name, segment.voice_name, model_name, speech_config.temperature
+            )
+            cached = segment_cache.load(cache_key) if segment_cache is not None else None
+
+            if cached is not None:
+                pcm, sample_rate, bits_per_sample = cached
+                reused += 1
+            else:
+                speech_client = client_provider(estimate_tokens(segment_ssml))
+                if speech_client is None:
+                    return None
+
+                generator = SpeechGenerator(
+                    api_conn=speech_client,
+                    speech_config=speech_config,
+                    ssml_dialog=segment_ssml,
+                    parent=audio_output_dir,
+                    basename=f"{ssml_file_path.stem} #{segment.index + 1}",
+                    stop_event=stop_event
+                )
+                pcm, mime_type = generator.synthesize()
+                if not pcm or not mime_type:
+                    print(f"エラー: 発話 {segment.index + 1} の音声データが返されませんでした ({ssml_file_path.name})。")
+                    return None
+
+                parameters = parse_audio_mime_type(mime_type)
+                sample_rate, bits_per_sample = parameters["rate"], parameters["bits_per_sample"]
+                if segment_cache is not None:
+                    segment_cache.save(cache_key, pcm, sample_rate, bits_per_sample)
+
+            # 発話ごとに形式が異なると単純には連結できないため、最初の発話の形式に揃っているか確認する
+            if writer is None:
+                writer = EncodingWavWriter(wav_file, sample_rate, bits_per_sample, audio_format=audio_format)
+            elif (writer.sample_rate, writer.bits_per_sample) != (sample_rate, bits_per_sample):
+                print(f"エラー: 発話 {segment.index + 1} の音声形式 {sample_rate}Hz/{bits_per_sample}bit が他の発話と異なるため連結できません。")
+                return None
+            writer.write(pcm)
+
+        if writer is None:
+            print(f"エラー: 音声を生成できる発話がありませんでした: {ssml_file_path.name}")
+            return None
+
+        writer.close()
+    finally:
+        # 途中で終わった場合は書きかけの一時ファイルを消す (close() 済みなら何もしない)
+        if writer is not None:
+            writer.abort()
+
+    print(f"{len(segments)}件中 {reused}件の発話をキャッシュから再利用しました ({ssml_file_path.name})")
+
+    output_path = writer.encoded_path or wav_file
+    print(f"音声ファイルの生成が完了しました: {output_path.name}")
+    return output_path
+
+def make_client_provider(
+        project: Project,
+        key_manager: ApiKeyManager,
+        model_name: str,
+        client_pool: Optional[GeminiApiClientPool] = None) -> Callable[[int, Optional[threading.Event], Optional[str]], Optional[GeminiApiClient]]:
+    """
+    (推定トークン数, 中断イベント, モデル名) を受け取り、利用枠を確保したAPIキーでクライアントを返す関数を生成する。
+    モデル名には生成プロファイルのモデルを渡す。省略した場合 (None) は model_name の利用枠を確保する。
+    client_pool を指定した場合は、キーごとに作り置いたクライアントを使い回す。
+    中断された場合は None を返す。
+    """
+    def provide_client(
+            estimated_tokens: int,
+            stop_event: Optional[threading.Event] = None,
+            model: Optional[str] = None) -> Optional[GeminiApiClient]:
+        model = model or model_name
+        if client_pool is not None:
+            return client_pool.acquire(model, estimated_tokens, stop_event)
+        api_key = key_manager.acquire_key(model, estimated_tokens, stop_event)
+        if api_key is None:
+            return None
+        return GeminiApiClient(
+            api_key,
+            model,
+            key_manager=key_manager,
+            retry_policy=project.retry_policy
+        )
+    return provide_client
+
+def make_async_client_provider(
+        project: Project,
+        key_manager: ApiKeyManager,
+        model_name: str,
+        client_pool: Optional[GeminiApiClientPool] = None) -> Callable[[int, Optional[threading.Event], Optional[str]], Awaitable[Optional[GeminiApiClient]]]:
+    """
+    make_client_provider の非同期版。利用枠は ApiKeyManager.acquire_key_async で待つため、
+    相槌のように1つのイベントループ上で並行に生成するリクエストが、それぞれ別に利用枠を確保できる。
+    """
+    async def provide_client(
+            estimated_tokens: int,
+            stop_event: Optional[threading.Event] = None,
+            model: Optional[str] = None) -> Optional[GeminiApiClient]:
+        model = model or model_name
+        if client_pool is not None:
+            return await client_pool.acquire_async(model, estimated_tokens, stop_event)
+        api_key = await key_manager.acquire_key_async(model, estimated_tokens, stop_event)
+        if api_key is None:
+            return None
+        return GeminiApiClient(
+            api_key,
+            model,
+            key_manager=key_manager,
+            retry_policy=project.retry_policy
+        )
+    return provide_client
+
+def run_project_processing(project: Project, key_manager: ApiKeyManager, client_pool: Optional[GeminiApiClientPool] = None):
+    """
+    プロジェクト全体を処理するCLIのメインフロー。
+    ssml フォルダ内のSSMLファイルを AudioRenderEngine で並行に音声化する。
+    """
+    # 循環参照を避けるため、ここでインポートする
+    from .render_engine import AudioRenderEngine
+
+    print(f"\nプロジェクト '{project.project_name}' の処理を開始します。")
+
+    if project.root_path is None:
+        print("エラー: プロジェクトのルートパスが設定されていません。")
         return
 
-    text_files = list(dialog_path.glob("*.txt"))
-    if not text_files:
-        print(f"エラー: 入力フォルダ '{dialog_path}' が空です。台本(.txt)ファイルを配置してください。")
+    ssml_path = (project.root_path / "ssml").resolve()
+    audio_path = (project.root_path / "audio").resolve()
+    print(f"Project Root: {project.root_path}")
+    print(f"SSML from: {ssml_path}")
+    print(f"Audio output to: {audio_path}")
+    audio_path.mkdir(parents=True, exist_ok=True)
+
+    ssml_files = sorted(ssml_path.glob("*.ssml"))
+    if not ssml_files:
+        print(f"エラー: 入力フォルダ '{ssml_path}' が空です。SSML(.ssml)ファイルを配置してください。")
         return
 
-    for txt_file in text_files:
-        current_api_key = key_manager.get_next_key()
-        process_drama_file(txt_file, audio_path, config, current_api_key)
-        
-        wait_seconds = config.get("processing_settings", {}).get("wait_seconds", 30)
-        print(f"\nWaiting {wait_seconds} seconds before processing next file...")
-        time.sleep(wait_seconds)
-    
-    print(f"\nプロジェクト '{project_name}' の処理が完了しました。")
\ No newline at end of file
+    engine = AudioRenderEngine.for_project(
+        project,
+        # 固定の待機時間ではなく、APIキーごとのRPM/TPM枠が空き次第リクエストを出す
+        client_provider=make_client_provider(project, key_manager, project.speech_model, client_pool),
+        on_status=lambda name, status: print(f"[{status}] {name}")
+    )
+
+    try:
+        results = engine.render(ssml_files)
+    except KeyboardInterrupt:
+        engine.stop()
+        print("\n中断しました。")
+        return
+
+    succeeded = sum(1 for status in results.values() if status == "SUCCESS")
+    print(f"\nプロジェクト '{project.project_name}' の処理が完了しました。({succeeded}/{len(ssml_files)} 件成功)")
+
+def run_project_pipeline(
+        project: Project,
+        key_manager: ApiKeyManager,
+        queue_size: Optional[int] = None,
+        regenerate: bool = False,
+        client_pool: Optional[GeminiApiClientPool] = None):
+    """
+    script フォルダ内のシナリオを、台本 → SSML → 音声 まで一括で処理するCLIのフロー。
+    各ステージは上限付きのキューでつながり、台本ができたものから順に音声まで流れる。
+    regenerate=True の場合は台本の応答キャッシュを使わずに生成し直す。
+    """
+    # 循環参照を避けるため、ここでインポートする
+    from .pipeline import ProductionPipeline
+
+    print(f"\nプロジェクト '{project.project_name}' の一括処理を開始します。")
+
+    if project.root_path is None:
+        print("エラー: プロジェクトのルートパスが設定されていません。")
+        return
+
+    script_path = (project.root_path / "script").resolve()
+    script_files = sorted(script_path.glob("*.txt"))
+    if not script_files:
+        print(f"エラー: 入力フォルダ '{script_path}' が空です。シナリオ(.txt)ファイルを配置してください。")
+        return
+
+    pipeline = ProductionPipeline(
+        project,
+        text_client_provider=make_client_provider(project, key_manager, project.text_model, client_pool),
+        speech_client_provider=make_client_provider(project, key_manager, project.speech_model, client_pool),
+        async_text_client_provider=make_async_client_provider(project, key_manager, project.text_model, client_pool),
+        queue_size=queue_size,
+        on_status=lambda name, status: print(f"[{status}] {name}"),
+        regenerate=regenerate
+    )
+
+    try:
+        results = pipeline.run(script_files)
+    except KeyboardInterrupt:
+        print("\n中断しました。")
+        return
+
+    succeeded = sum(1 for status in results.values() if status == "SUCCESS")
+    print(f"\nプロジェクト '{project.project_name}' の一括処理が完了しました。({succeeded}/{len(script_files)} 件成功)")
+
+def run_stale_build(
+        project: Project,
+        key_manager: ApiKeyManager,
+        regenerate: bool = False,
+        client_pool: Optional[GeminiApiClientPool] = None):
+    """
+    ビルドマニフェストと照らし合わせ、未生成か古くなった 台本・SSML・音声 だけを作り直すCLIのフロー。
+    入力ファイルと生成設定 (キャラクター・モデル・パラメータ) が前回と同じ成果物はスキップする。
+    regenerate=True の場合は台本の応答キャッシュを使わずに生成し直す。
+    """
+    # 循環参照を避けるため、ここでインポートする
+    from .pipeline import StaleBuilder
+
+    print(f"\nプロジェクト '{project.project_name}' の差分ビルドを開始します。")
+
+    if project.root_path is None:
+        print("エラー: プロジェクトのルートパスが設定されていません。")
+        return
+
+    builder = StaleBuilder(
+        project,
+        text_client_provider=make_client_provider(project, key_manager, project.text_model, client_pool),
+        speech_client_provider=make_client_provider(project, key_manager, project.speech_model, client_pool),
+        async_text_client_provider=make_async_client_provider(project, key_manager, project.text_model, client_pool),
+        on_status=lambda stage, name, status: print(f"[{stage}][{status}] {name}"),
+        regenerate=regenerate
+    )
+
+    try:
+        results = builder.run()
+    except KeyboardInterrupt:
+        builder.stop()
+        print("\n中断しました。")
+        return
+
+    built = sum(len(stage_results) for stage_results in results.values())
+    succeeded = sum(
+        1 for stage_results in results.values() for status in stage_results.values() if status == "SUCCESS"
+    )
+    if built == 0:
+        print(f"\nプロジェクト '{project.project_name}' の成果物はすべて最新です。")
+    else:
+        print(f"\nプロジェクト '{project.project_name}' の差分ビルドが完了しました。({succeeded}/{built} 件成功)")
+
+def compile_ssml_directory(project: Project, max_workers: Optional[int] = None) -> Dict[str, bool]:
+    """
+    dialog フォルダ内のすべての台本を、プロセスプールで並行にSSMLへ変換するCLIのフロー。
+    APIは呼ばないため、相槌の挿入は行わない。{台本ファイル名: 成功したか} を返す。
+    max_workers を省略した場合は、CPUのコア数だけプロセスを使う。
+    """
+    # 循環参照を避けるため、ここでインポートする
+    from .manifest import BuildManifest, STAGE_SSML
+
+    results: Dict[str, bool] = {}
+    if project.root_path is None:
+        print("エラー: プロジェクトのルートパスが設定されていません。")
+        return results
+
+    dialog_path = (project.root_path / "dialog").resolve()
+    ssml_path = (project.root_path / "ssml").resolve()
+    dialog_files = sorted(dialog_path.glob("*.txt"))
+    if not dialog_files:
+        print(f"エラー: 入力フォルダ '{dialog_path}' が空です。台本(.txt)ファイルを配置してください。")
+        return results
+
+    manifest = BuildManifest.for_project(project)
+    if project.interjection_mode != INTERJECTION_MODE_OFF:
+        # 相槌ありの設定で作ったSSMLとは内容が異なるため、ビルドマニフェストには記録しない
+        print("注意: このコマンドでは相槌を挿入しません。相槌を挿入する場合は build-stale か run-all を使ってください。")
+        manifest = None
+
+    print(f"--- {len(dialog_files)}件の台本をSSMLに変換します ({dialog_path} -> {ssml_path}) ---")
+    ssml_path.mkdir(parents=True, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for dialog_file in dialog_files:
+            # 変換中に台本が編集されても古いSSMLを最新と記録しないよう、先に計算しておく
+            fingerprint = manifest.fingerprint(STAGE_SSML, dialog_file) if manifest else None
+            output_file = ssml_path / dialog_file.with_suffix(".ssml").name
+            future = executor.submit(compile_ssml_file, dialog_file, output_file, project.characters)
+            futures[future] = (dialog_file, output_file, fingerprint)
+
+        for future in as_completed(futures):
+            dialog_file, output_file, fingerprint = futures[future]
+            try:
+                utterance_count = future.result()
+            except Exception as e:
+                print(f"エラー: SSMLへの変換に失敗しました ({dialog_file.name}): {e}")
+                utterance_count = None
+
+            results[dialog_file.name] = utterance_count is not None
+            if utterance_count is None:
+                print(f"[ERROR] {dialog_file.name}")
+                continue
+            if manifest is not None:
+                manifest.record(STAGE_SSML, dialog_file, output_file, fingerprint)
+            print(f"[SUCCESS] {dialog_file.name} -> {output_file.name} ({utterance_count}発話)")
+
+    succeeded = sum(1 for ok in results.values() if ok)
+    print(f"\nSSMLへの変換が完了しました。({succeeded}/{len(dialog_files)} 件成功)")
+    return results
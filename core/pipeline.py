@@ -0,0 +1,440 @@
+# AiRadioDramaCreator/core/pipeline.py
+
+import itertools
+import queue
+import threading
+import traceback
+from pathlib import Path
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional
+)
+
+from .api_client import GeminiApiClient
+from .cache import InterjectionMemo, ResponseCache
+from .manifest import (
+    BuildManifest,
+    STAGE_DIALOG,
+    STAGE_SSML,
+    STAGE_AUDIO
+)
+from .models import (
+    Project,
+    PROFILE_STAGE_DIALOG,
+    PROFILE_STAGE_INTERJECTION
+)
+from .render_engine import (
+    AudioRenderEngine,
+    STATUS_WAITING,
+    STATUS_PROCESSING,
+    STATUS_SUCCESS,
+    STATUS_ERROR,
+    STATUS_INTERRUPTED
+)
+
+# キューの受け渡しで、中断されていないかを確認する間隔 (秒)
+_POLL_SECONDS = 0.5
+
+ClientProvider = Callable[[int, threading.Event], Optional[GeminiApiClient]]
+# テキスト用は3つ目の引数で生成プロファイルのモデル名を受け取り、そのモデルの利用枠を確保する (None の場合は既定のモデル)
+TextClientProvider = Callable[[int, threading.Event, Optional[str]], Optional[GeminiApiClient]]
+AsyncClientProvider = Callable[[int, threading.Event, Optional[str]], Awaitable[Optional[GeminiApiClient]]]
+
+class _Interrupted(Exception):
+    """APIの利用枠を待っている間に中断されたことを表す。"""
+
+class _StageRunner:
+    """ProductionPipeline と StaleBuilder に共通する、台本・SSMLの生成とマニフェストへの記録。"""
+    def __init__(
+            self,
+            project: Project,
+            text_client_provider: TextClientProvider,
+            speech_client_provider: ClientProvider,
+            on_progress: Optional[Callable[[str], None]] = None,
+            on_stage_complete: Optional[Callable[[str, Path], None]] = None,
+            regenerate: bool = False,
+            async_text_client_provider: Optional[AsyncClientProvider] = None):
+        self.project = project
+        self.text_client_provider = text_client_provider
+        self.async_text_client_provider = async_text_client_provider
+        self.on_progress = on_progress
+        self.on_stage_complete = on_stage_complete
+
+        self.dialog_output_dir = (project.root_path / "dialog").resolve()
+        self.ssml_output_dir = (project.root_path / "ssml").resolve()
+        self.manifest = BuildManifest.for_project(project)
+        # regenerate=True の場合は台本の応答キャッシュを読まずに生成し直す (撮り直し)
+        self.response_cache = ResponseCache.for_project(project, refresh=regenerate)
+        self.interjection_memo = InterjectionMemo.for_project(project)
+        self.engine = AudioRenderEngine.for_project(project, speech_client_provider, on_progress=on_progress)
+
+        self._stop_event = threading.Event()
+
+    @property
+    def is_running(self) -> bool:
+        return not self._stop_event.is_set()
+
+    def _log(self, message: str):
+        if self.on_progress:
+            self.on_progress(message)
+        else:
+            print(message, end="")
+
+    def _stage_complete(self, stage: str, output_path: Path):
+        if self.on_stage_complete:
+            self.on_stage_complete(stage, output_path)
+
+    def _fingerprint(self, stage: str, source: Path) -> Optional[str]:
+        return self.manifest.fingerprint(stage, source) if self.manifest else None
+
+    def _record(self, stage: str, source: Path, output: Path, fingerprint: Optional[str]):
+        if self.manifest is not None:
+            self.manifest.record(stage, source, output, fingerprint)
+
+    def _generate_dialog(self, script_file: Path) -> Optional[Path]:
+        """
+        シナリオから台本を生成し、そのパスを返す。失敗した場合は None。
+        利用枠を待っている間に中断された場合は _Interrupted を送出する。
+        """
+        # 循環参照を避けるため、ここでインポートする
+        from .orchestrator import generate_dialog_from_script
+
+        fingerprint = self._fingerprint(STAGE_DIALOG, script_file)
+        try:
+            # 応答キャッシュに一致する台本があれば、利用枠を確保せずに済ませる
+            dialog_path = generate_dialog_from_script(
+                script_file, self.dialog_output_dir, self.project.characters,
+                response_cache=self.response_cache,
+                client_provider=lambda tokens, model: self.text_client_provider(tokens, self._stop_event, model),
+                model_name=self.project.text_model,
+                chunk_chars=self.project.dialog_chunk_chars,
+                chunk_workers=self.project.dialog_chunk_workers,
+                name_index=self.project.character_name_index if self.project.dialog_slim_prompt else None,
+                profile_max_tokens=self.project.dialog_profile_max_tokens,
+                profiles=self.project.profile_chain(PROFILE_STAGE_DIALOG),
+                stop_event=self._stop_event
+            )
+        except Exception as e:
+            self._log(f"台本生成中に予期せぬエラーが発生 ({script_file.name}): {e}\n{traceback.format_exc()}\n")
+            return None
+
+        if not dialog_path and self._stop_event.is_set():
+            raise _Interrupted()
+
+        if dialog_path:
+            self._record(STAGE_DIALOG, script_file, dialog_path, fingerprint)
+        return dialog_path
+
+    def _generate_ssml(self, dialog_path: Path) -> Optional[Path]:
+        """台本からSSMLを生成し、そのパスを返す。失敗した場合は None、中断された場合は _Interrupted。"""
+        # 循環参照を避けるため、ここでインポートする
+        from .orchestrator import generate_ssml_from_text
+
+        fingerprint = self._fingerprint(STAGE_SSML, dialog_path)
+        async_provider = self.async_text_client_provider
+        try:
+            # 相槌を生成するリクエストごとに利用枠を確保する (相槌を挿入しない場合は確保しない)
+            ssml_path = generate_ssml_from_text(
+                dialog_path, self.ssml_output_dir, self.project.characters,
+                interjection_mode=self.project.interjection_mode,
+                interjection_max_workers=self.project.interjection_max_workers,
+                interjection_memo=self.interjection_memo,
+                interjection_profiles=self.project.profile_chain(PROFILE_STAGE_INTERJECTION),
+                client_provider=lambda tokens, model: self.text_client_provider(tokens, self._stop_event, model),
+                async_client_provider=(lambda tokens, model: async_provider(tokens, self._stop_event, model)) if async_provider else None,
+                stop_event=self._stop_event
+            )
+        except Exception as e:
+            self._log(f"SSML生成中に予期せぬエラーが発生 ({dialog_path.name}): {e}\n{traceback.format_exc()}\n")
+            return None
+
+        if not ssml_path and self._stop_event.is_set():
+            raise _Interrupted()
+
+        if ssml_path:
+            self._record(STAGE_SSML, dialog_path, ssml_path, fingerprint)
+        return ssml_path
+
+    def stop(self):
+        """
+        処理の中断を要求する。
+        実行中のAPI呼び出しは完了を待ち、次のファイルには進まない。
+        """
+        self._stop_event.set()
+        self.engine.stop()
+
+class ProductionPipeline(_StageRunner):
+    """
+    シナリオ → 台本 → SSML → 音声 の各ステージを、上限付きのキューでつないで同時に動かすクラス。
+    台本ができたファイルから順にSSML・音声へ流れるため、テキストと音声のAPI枠を並行して使える。
+    下流のキューが一杯になると上流のステージは待たされ (バックプレッシャー)、
+    台本生成だけが音声生成より大きく先行することはない。
+    """
+    def __init__(
+            self,
+            project: Project,
+            text_client_provider: TextClientProvider,
+            speech_client_provider: ClientProvider,
+            queue_size: Optional[int] = None,
+            on_status: Optional[Callable[[str, str], None]] = None,
+            on_progress: Optional[Callable[[str], None]] = None,
+            on_stage_complete: Optional[Callable[[str, Path], None]] = None,
+            regenerate: bool = False,
+            async_text_client_provider: Optional[AsyncClientProvider] = None):
+        """
+        Args:
+            project (Project): 対象のプロジェクト。
+            text_client_provider (Callable): (推定トークン数, 中断イベント, モデル名) を受け取り、テキスト用APIクライアントを返す関数。
+                モデル名は生成プロファイルのモデル (None の場合はプロジェクトのテキストモデル) で、その利用枠を確保する。
+            speech_client_provider (Callable): (推定トークン数, 中断イベント) を受け取り、音声用APIクライアントを返す関数。
+            queue_size (int): ステージ間のキューに溜められるファイル数。省略時はプロジェクト設定の値。
+            on_status (Callable): (シナリオファイル名, ステータス) を受け取るコールバック。
+            on_progress (Callable): ログ文字列を受け取るコールバック。
+            on_stage_complete (Callable): (ステージ名, 生成した台本/SSML。音声ステージでは元のSSML) を受け取るコールバック。
+            regenerate (bool): True の場合、台本の応答キャッシュを使わずに生成し直す (新しい台本でキャッシュを上書きする)。
+            async_text_client_provider (Callable): text_client_provider の非同期版。並行に生成する相槌の利用枠の確保に使う
+                (省略した場合は text_client_provider を別スレッドで呼ぶ)。
+        """
+        super().__init__(
+            project, text_client_provider, speech_client_provider, on_progress, on_stage_complete, regenerate,
+            async_text_client_provider
+        )
+        self.queue_size = max(1, int(queue_size if queue_size is not None else project.pipeline_queue_size))
+        self.on_status = on_status
+
+        self._results: Dict[str, str] = {}
+        self._results_lock = threading.Lock()
+        self._audio_counter = itertools.count(1)
+
+    def _set_status(self, name: str, status: str):
+        with self._results_lock:
+            self._results[name] = status
+        if self.on_status:
+            self.on_status(name, status)
+
+    def _put(self, target: queue.Queue, item: Any) -> bool:
+        """キューに空きができるまで待って item を入れる。中断された場合は False を返す。"""
+        while not self._stop_event.is_set():
+            try:
+                target.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source: queue.Queue) -> Any:
+        """キューから1件取り出す。中断された場合は None (終了の合図と同じ) を返す。"""
+        while not self._stop_event.is_set():
+            try:
+                return source.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return None
+
+    def _dialog_stage(self, script_files: List[Path], dialog_queue: queue.Queue):
+        try:
+            for i, script_file in enumerate(script_files):
+                if self._stop_event.is_set():
+                    break
+
+                self._set_status(script_file.name, STATUS_PROCESSING)
+                self._log(f"\n[台本 {i + 1}/{len(script_files)}] {script_file.name}\n")
+                try:
+                    dialog_path = self._generate_dialog(script_file)
+                except _Interrupted:
+                    break
+
+                if not dialog_path:
+                    self._set_status(script_file.name, STATUS_ERROR)
+                    continue
+
+                self._stage_complete(STAGE_DIALOG, dialog_path)
+                # SSMLステージが追いつくまで、ここで待たされる
+                if not self._put(dialog_queue, (script_file, dialog_path)):
+                    break
+        finally:
+            self._put(dialog_queue, None)
+
+    def _ssml_stage(self, dialog_queue: queue.Queue, ssml_queue: queue.Queue, audio_workers: int):
+        try:
+            while True:
+                item = self._get(dialog_queue)
+                if item is None:
+                    break
+                script_file, dialog_path = item
+
+                self._log(f"\n[SSML] {dialog_path.name}\n")
+                try:
+                    ssml_path = self._generate_ssml(dialog_path)
+                except _Interrupted:
+                    break
+
+                if not ssml_path:
+                    self._set_status(script_file.name, STATUS_ERROR)
+                    continue
+
+                self._stage_complete(STAGE_SSML, ssml_path)
+                # 音声ステージが追いつくまで、ここで待たされる
+                if not self._put(ssml_queue, (script_file, ssml_path)):
+                    break
+        finally:
+            # 音声ステージのワーカーそれぞれに終了を知らせる
+            for _ in range(audio_workers):
+                self._put(ssml_queue, None)
+
+    def _audio_stage(self, ssml_queue: queue.Queue, total: int):
+        while True:
+            item = self._get(ssml_queue)
+            if item is None:
+                break
+            script_file, ssml_path = item
+
+            status = self.engine.render_file(ssml_path, next(self._audio_counter), total)
+            self._set_status(script_file.name, status)
+            if status == STATUS_SUCCESS:
+                self._stage_complete(STAGE_AUDIO, ssml_path)
+
+    def run(self, script_files: List[Path]) -> Dict[str, str]:
+        """
+        シナリオファイルのリストを音声まで一括で処理し、{シナリオファイル名: 最終ステータス} を返す。
+        stop() が呼ばれた場合、完了していないファイルは INTERRUPTED となる。
+        """
+        total = len(script_files)
+        if total == 0:
+            return {}
+
+        for script_file in script_files:
+            self._set_status(script_file.name, STATUS_WAITING)
+
+        audio_workers = self.engine.max_workers
+        dialog_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        ssml_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+
+        self._log(
+            f"--- {total}件のシナリオを 台本 → SSML → 音声 の順に一括処理します "
+            f"(キュー上限 {self.queue_size}件, 音声 最大{audio_workers}並列) ---\n"
+        )
+
+        threads = [
+            threading.Thread(target=self._dialog_stage, args=(script_files, dialog_queue), name="pipeline-dialog", daemon=True),
+            threading.Thread(target=self._ssml_stage, args=(dialog_queue, ssml_queue, audio_workers), name="pipeline-ssml", daemon=True),
+        ] + [
+            threading.Thread(target=self._audio_stage, args=(ssml_queue, total), name=f"pipeline-audio-{i + 1}", daemon=True)
+            for i in range(audio_workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                # join をタイムアウト付きで繰り返し、CLI での Ctrl+C を受け付けられるようにする
+                while thread.is_alive():
+                    thread.join(timeout=_POLL_SECONDS)
+        except KeyboardInterrupt:
+            self.stop()
+            for thread in threads:
+                thread.join()
+            raise
+
+        with self._results_lock:
+            unfinished = [
+                name for name, status in self._results.items()
+                if status not in (STATUS_SUCCESS, STATUS_ERROR)
+            ]
+        for name in unfinished:
+            self._set_status(name, STATUS_INTERRUPTED)
+
+        with self._results_lock:
+            return dict(self._results)
+
+class StaleBuilder(_StageRunner):
+    """
+    ビルドマニフェストと照らし合わせ、未生成か古くなった成果物だけを 台本 → SSML → 音声 の順に作り直すクラス。
+    make と同じく、入力と設定が前回から変わっていない成果物はスキップする。
+    前のステージで作り直した台本・SSMLは、次のステージで自動的に古いと判定される。
+    """
+    def __init__(
+            self,
+            project: Project,
+            text_client_provider: TextClientProvider,
+            speech_client_provider: ClientProvider,
+            on_status: Optional[Callable[[str, str, str], None]] = None,
+            on_progress: Optional[Callable[[str], None]] = None,
+            on_stage_complete: Optional[Callable[[str, Path], None]] = None,
+            regenerate: bool = False,
+            async_text_client_provider: Optional[AsyncClientProvider] = None):
+        """
+        Args:
+            on_status (Callable): (ステージ名, 入力ファイル名, ステータス) を受け取るコールバック。
+            その他の引数は ProductionPipeline と同じ。
+        """
+        super().__init__(
+            project, text_client_provider, speech_client_provider, on_progress, on_stage_complete, regenerate,
+            async_text_client_provider
+        )
+        self.on_status = on_status
+        self.engine.on_status = lambda name, status: self._set_status(STAGE_AUDIO, name, status)
+
+        self._results: Dict[str, Dict[str, str]] = {STAGE_DIALOG: {}, STAGE_SSML: {}, STAGE_AUDIO: {}}
+
+    def _set_status(self, stage: str, name: str, status: str):
+        self._results[stage][name] = status
+        if self.on_status:
+            self.on_status(stage, name, status)
+
+    def _stale_inputs(self, stage: str, label: str) -> List[Path]:
+        sources = self.manifest.stale_inputs(stage)
+        skipped = len(self.manifest.list_inputs(stage)) - len(sources)
+        self._log(f"\n--- {label}: {len(sources)}件を生成します (最新の{skipped}件はスキップ) ---\n")
+        return sources
+
+    def _build_text_stage(self, stage: str, label: str, build_one: Callable[[Path], Optional[Path]]):
+        sources = self._stale_inputs(stage, label)
+        for source in sources:
+            self._set_status(stage, source.name, STATUS_WAITING)
+
+        for i, source in enumerate(sources):
+            if self._stop_event.is_set():
+                break
+
+            self._set_status(stage, source.name, STATUS_PROCESSING)
+            self._log(f"\n[{label} {i + 1}/{len(sources)}] {source.name}\n")
+            try:
+                output_path = build_one(source)
+            except _Interrupted:
+                break
+
+            if output_path:
+                self._set_status(stage, source.name, STATUS_SUCCESS)
+                self._stage_complete(stage, output_path)
+            else:
+                self._set_status(stage, source.name, STATUS_ERROR)
+
+        unfinished = [name for name, status in self._results[stage].items() if status == STATUS_WAITING]
+        for name in unfinished:
+            self._set_status(stage, name, STATUS_INTERRUPTED)
+
+    def run(self) -> Dict[str, Dict[str, str]]:
+        """
+        古い成果物を作り直し、{ステージ名: {入力ファイル名: 最終ステータス}} を返す。
+        すべて最新であれば、APIを一度も呼ばずに空の結果を返す。
+        """
+        if self.manifest is None:
+            return self._results
+
+        self._build_text_stage(STAGE_DIALOG, "台本", self._generate_dialog)
+        if not self._stop_event.is_set():
+            self._build_text_stage(STAGE_SSML, "SSML", self._generate_ssml)
+        if not self._stop_event.is_set():
+            ssml_files = self._stale_inputs(STAGE_AUDIO, "音声")
+            for ssml_file in ssml_files:
+                self._set_status(STAGE_AUDIO, ssml_file.name, STATUS_WAITING)
+            for ssml_file, status in self.engine.render(ssml_files).items():
+                if status == STATUS_SUCCESS:
+                    self._stage_complete(STAGE_AUDIO, self.ssml_output_dir / ssml_file)
+
+        return self._results
@@ -0,0 +1,231 @@
+# AiRadioDramaCreator/core/render_engine.py
+
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Optional
+)
+
+from .api_client import GeminiApiClient
+from .cache import AudioCache, SegmentCache
+from .manifest import BuildManifest, STAGE_AUDIO
+from .models import Character, Project
+
+# ステータス名は GUI の STATUS_COLOR のキーと揃えておく
+STATUS_WAITING = "WAITING"
+STATUS_PROCESSING = "PROCESSING"
+STATUS_SUCCESS = "SUCCESS"
+STATUS_ERROR = "ERROR"
+STATUS_INTERRUPTED = "INTERRUPTED"
+
+class AudioRenderEngine:
+    """
+    複数のSSMLファイルの音声生成を、ワーカープールで並行に実行するクラス。
+    同時に処理するファイル数は max_workers で制限する。
+    """
+    def __init__(
+            self,
+            audio_output_dir: Path,
+            characters: List[Character],
+            client_provider: Callable[[int, threading.Event], Optional[GeminiApiClient]],
+            max_workers: int = 2,
+            audio_cache: Optional[AudioCache] = None,
+            segment_cache: Optional[SegmentCache] = None,
+            model_name: Optional[str] = None,
+            audio_format: Optional[str] = "mp3",
+            manifest: Optional[BuildManifest] = None,
+            on_status: Optional[Callable[[str, str], None]] = None,
+            on_progress: Optional[Callable[[str], None]] = None):
+        """
+        Args:
+            audio_output_dir (Path): 音声ファイルの出力先フォルダ。
+            characters (List[Character]): プロジェクトに登録されている全キャラクター。
+            client_provider (Callable): (推定トークン数, 中断イベント) を受け取り、
+                利用枠を確保した音声用APIクライアントを返す関数。中断時は None を返す。
+            max_workers (int): 同時に実行する音声生成の上限数 (区間に分けて生成するAPI呼び出しも含む)。
+            audio_cache (AudioCache): 生成済み音声のキャッシュ。None の場合は使用しない。
+            segment_cache (SegmentCache): 発話単位の音声キャッシュ。指定した場合は発話ごとに生成してつなげ、
+                変更のあった発話だけをAPIで生成し直す。
+            model_name (str): 音声モデル名。キャッシュの照合に使う。
+            audio_format (str): WAVと並行して ffmpeg で作る圧縮ファイルの形式 ("mp3" / "opus")。
+            manifest (BuildManifest): 生成した音声を記録するビルドマニフェスト。None の場合は記録しない。
+            on_status (Callable): (ファイル名, ステータス) を受け取るコールバック。
+            on_progress (Callable): ログ文字列を受け取るコールバック。
+        """
+        self.audio_output_dir = audio_output_dir
+        self.characters = characters
+        self.client_provider = client_provider
+        self.max_workers = max(1, int(max_workers))
+        self.audio_cache = audio_cache
+        self.segment_cache = segment_cache
+        self.model_name = model_name
+        self.audio_format = audio_format
+        self.manifest = manifest
+        self.on_status = on_status
+        self.on_progress = on_progress
+
+        self._stop_event = threading.Event()
+        # 音声APIの同時呼び出し数の上限。話者が3人以上のファイルを区間に分けて並行に生成する場合も、
+        # 区間ごとにこの枠を確保するため、ファイルの並列と区間の並列を合わせて max_workers を超えない
+        self._speech_slots = threading.BoundedSemaphore(self.max_workers)
+
+    @classmethod
+    def for_project(
+            cls,
+            project: Project,
+            client_provider: Callable[[int, threading.Event], Optional[GeminiApiClient]],
+            on_status: Optional[Callable[[str, str], None]] = None,
+            on_progress: Optional[Callable[[str], None]] = None) -> "AudioRenderEngine":
+        """プロジェクトの設定 (出力先・並列数・キャッシュ・圧縮形式) に従ってエンジンを生成する。"""
+        return cls(
+            audio_output_dir=(project.root_path / "audio").resolve(),
+            characters=project.characters,
+            client_provider=client_provider,
+            max_workers=project.max_workers,
+            audio_cache=AudioCache.for_project(project),
+            segment_cache=SegmentCache.for_project(project) if project.segmented_audio else None,
+            model_name=project.speech_model,
+            audio_format=project.audio_format,
+            manifest=BuildManifest.for_project(project),
+            on_status=on_status,
+            on_progress=on_progress
+        )
+
+    @property
+    def is_running(self) -> bool:
+        return not self._stop_event.is_set()
+
+    def _emit_status(self, name: str, status: str):
+        if self.on_status:
+            self.on_status(name, status)
+
+    def _log(self, message: str):
+        if self.on_progress:
+            self.on_progress(message)
+        else:
+            print(message, end="")
+
+    def _record(self, ssml_file: Path, output_path: Path, fingerprint: Optional[str]):
+        if self.manifest is not None:
+            self.manifest.record(STAGE_AUDIO, ssml_file, Path(output_path), fingerprint)
+
+    def _render_one(self, ssml_file: Path, index: int, total: int) -> str:
+        """1ファイル分の音声生成を実行し、最終ステータスを返す。"""
+        # キューで待っている間に中断された場合は、APIを呼ばずに終了する
+        if self._stop_event.is_set():
+            return STATUS_INTERRUPTED
+
+        # 循環参照を避けるため、ここでインポートする
+        from .orchestrator import (
+            generate_audio_from_ssml,
+            generate_segmented_audio_from_ssml
+        )
+
+        self._emit_status(ssml_file.name, STATUS_PROCESSING)
+        self._log(f"\n[{index}/{total}] 音声生成中: {ssml_file.name}\n")
+
+        # 生成中にSSMLが編集されても古い音声を最新と記録しないよう、先に計算しておく
+        fingerprint = self.manifest.fingerprint(STAGE_AUDIO, ssml_file) if self.manifest else None
+
+        try:
+            if self.segment_cache is not None:
+                # 発話単位で生成する。キャッシュに無い発話ごとに利用枠を確保する
+                output_path = generate_segmented_audio_from_ssml(
+                    ssml_file, self.audio_output_dir, self.characters, self.model_name,
+                    client_provider=lambda tokens: self.client_provider(tokens, self._stop_event),
+                    segment_cache=self.segment_cache,
+                    stop_event=self._stop_event,
+                    audio_format=self.audio_format
+                )
+                if output_path:
+                    self._record(ssml_file, output_path, fingerprint)
+                    return STATUS_SUCCESS
+                return STATUS_INTERRUPTED if self._stop_event.is_set() else STATUS_ERROR
+
+            # キャッシュに一致する音声があれば、APIの利用枠を確保せずに済ませる。
+            # 無ければSSMLの長さからトークン数を見積もり、利用枠が空くまで待ってからクライアントを受け取る
+            # (話者が3人以上のファイルは区間ごとに利用枠を確保する)
+            output_path = generate_audio_from_ssml(
+                ssml_file, self.audio_output_dir, self.characters,
+                audio_cache=self.audio_cache,
+                client_provider=lambda tokens: self.client_provider(tokens, self._stop_event),
+                model_name=self.model_name,
+                max_parallel_runs=self.max_workers,
+                audio_format=self.audio_format,
+                stop_event=self._stop_event,
+                speech_slots=self._speech_slots
+            )
+            if not output_path and self._stop_event.is_set():
+                return STATUS_INTERRUPTED
+            if output_path:
+                self._record(ssml_file, output_path, fingerprint)
+            status = STATUS_SUCCESS if output_path else STATUS_ERROR
+        except Exception as e:
+            if self._stop_event.is_set():
+                # リトライの待機中に中断された場合など
+                return STATUS_INTERRUPTED
+            self._log(f"音声生成中に予期せぬエラーが発生 ({ssml_file.name}): {e}\n{traceback.format_exc()}\n")
+            status = STATUS_ERROR
+
+        return status
+
+    def render_file(self, ssml_file: Path, index: int = 1, total: int = 1) -> str:
+        """
+        1ファイル分の音声生成を呼び出し元のスレッドで実行し、最終ステータスを返す。
+        パイプラインのように、ファイルが1つずつ届く場合に使う (最終ステータスは on_status に通知しない)。
+        """
+        try:
+            return self._render_one(ssml_file, index, total)
+        except Exception as e:
+            self._log(f"致命的なエラーが発生しました ({ssml_file.name}): {e}\n")
+            return STATUS_ERROR
+
+    def render(self, ssml_files: List[Path]) -> Dict[str, str]:
+        """
+        SSMLファイルのリストを並行に音声化し、{ファイル名: 最終ステータス} を返す。
+        stop() が呼ばれた場合、未着手のファイルは INTERRUPTED となる。
+        """
+        results: Dict[str, str] = {}
+        total = len(ssml_files)
+        if total == 0:
+            return results
+
+        self._log(f"--- {total}件の音声生成を最大{self.max_workers}並列で開始します ---\n")
+
+        # 中断時、未着手のジョブは _render_one の先頭で即座に INTERRUPTED を返すため、
+        # プールの終了を待つだけで安全に停止できる
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="audio-render") as executor:
+            future_to_file = {
+                executor.submit(self._render_one, ssml_file, i + 1, total): ssml_file
+                for i, ssml_file in enumerate(ssml_files)
+            }
+
+            try:
+                for future in as_completed(future_to_file):
+                    ssml_file = future_to_file[future]
+                    try:
+                        status = future.result()
+                    except Exception as e:
+                        self._log(f"致命的なエラーが発生しました ({ssml_file.name}): {e}\n")
+                        status = STATUS_ERROR
+
+                    results[ssml_file.name] = status
+                    self._emit_status(ssml_file.name, status)
+            except KeyboardInterrupt:
+                # CLIでの Ctrl+C。未着手のジョブを止めてから、実行中のジョブの終了を待つ
+                self.stop()
+                raise
+
+        return results
+
+    def stop(self):
+        """
+        処理の中断を要求する。
+        実行中のAPI呼び出しは完了を待ち、未着手のファイルは実行しない。
+        """
+        self._stop_event.set()
@@ -0,0 +1,231 @@
+# AiRadioDramaCreator/core/retry.py
+
+import asyncio
+import inspect
+import random
+import re
+import threading
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Optional,
+    TypeVar
+)
+
+from .api_client import (
+    classify_api_error,
+    ERROR_QUOTA,
+    ERROR_SERVER,
+    ERROR_NETWORK
+)
+from .models import RetryPolicy
+
+T = TypeVar("T")
+
+# 一時的なエラーとしてリトライする種別。認証エラーやリクエスト不備は即座に失敗とする
+RETRYABLE_ERRORS = (ERROR_QUOTA, ERROR_SERVER, ERROR_NETWORK)
+
+class RetryInterrupted(Exception):
+    """リトライの待機中 (またはクライアントの取り替え中) に中断されたことを表す。"""
+
+def _print_log(message: str):
+    print(message, end="")
+
+# リトライのログ出力先。GUIでは set_retry_logger でログ欄に流す
+_retry_logger: Callable[[str], None] = _print_log
+
+def set_retry_logger(logger: Optional[Callable[[str], None]]):
+    """リトライ状況のログ出力先を差し替える。None を渡すと標準出力に戻す。"""
+    global _retry_logger
+    _retry_logger = logger if logger is not None else _print_log
+
+def _parse_seconds(value: Any) -> Optional[float]:
+    """'31s' や '1.5' のような表記を秒数に変換する。"""
+    if value is None:
+        return None
+    match = re.match(r"^\s*([0-9]+(?:\.[0-9]+)?)\s*s?\s*$", str(value))
+    return float(match.group(1)) if match else None
+
+def _find_retry_delay(details: Any) -> Optional[float]:
+    """エラー詳細 (JSON) の中から RetryInfo の retryDelay を再帰的に探す。"""
+    if isinstance(details, dict):
+        if "retryDelay" in details:
+            return _parse_seconds(details["retryDelay"])
+        for value in details.values():
+            found = _find_retry_delay(value)
+            if found is not None:
+                return found
+    elif isinstance(details, list):
+        for value in details:
+            found = _find_retry_delay(value)
+            if found is not None:
+                return found
+    return None
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """
+    サーバーが提示した待機秒数を取り出す。
+    Retry-After ヘッダ、エラー詳細の RetryInfo、メッセージ内の "retry in XXs" の順に探す。
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        try:
+            seconds = _parse_seconds(headers.get("retry-after"))
+        except Exception:
+            seconds = None
+        if seconds is not None:
+            return seconds
+
+    seconds = _find_retry_delay(getattr(error, "details", None))
+    if seconds is not None:
+        return seconds
+
+    match = re.search(r"retry(?:Delay)?['\"]?\s*(?:in|:)\s*['\"]?([0-9]+(?:\.[0-9]+)?)\s*s", str(error), re.IGNORECASE)
+    if match:
+        return float(match.group(1))
+    return None
+
+def compute_backoff(policy: RetryPolicy, attempt: int) -> float:
+    """attempt 回目の失敗後の待機秒数 (指数バックオフ + ジッター) を返す。"""
+    delay = min(policy.max_delay, policy.base_delay * (2 ** (attempt - 1)))
+    if policy.jitter > 0:
+        delay *= 1 + random.uniform(-policy.jitter, policy.jitter)
+    return max(0.0, delay)
+
+def _next_retry_delay(
+        error: Exception,
+        attempt: int,
+        policy: RetryPolicy,
+        started_at: float,
+        description: str,
+        on_error: Optional[Callable[[Exception, Optional[float]], Any]]) -> Optional[float]:
+    """
+    attempt 回目の失敗について、次の試行までの待機秒数を返す。リトライしない場合は None。
+    call_with_retry と call_with_retry_async で共通の判定。
+    """
+    retry_after = get_retry_after(error)
+    if on_error is not None:
+        on_error(error, retry_after)
+
+    kind = classify_api_error(error)
+    if kind not in RETRYABLE_ERRORS:
+        return None
+
+    if attempt >= policy.max_attempts:
+        _retry_logger(f"{description}: {attempt}回試行しましたが失敗しました ({kind}: {error})\n")
+        return None
+
+    delay = retry_after if retry_after is not None else compute_backoff(policy, attempt)
+    elapsed = time.monotonic() - started_at
+    if elapsed + delay > policy.max_total_seconds:
+        _retry_logger(f"{description}: リトライの上限時間 ({policy.max_total_seconds:.0f}秒) を超えるため中止します ({kind}: {error})\n")
+        return None
+
+    source = "サーバー指定" if retry_after is not None else "バックオフ"
+    _retry_logger(f"{description}: {kind} エラーのため {delay:.1f}秒後に再試行します ({attempt}/{policy.max_attempts - 1}回目, {source}): {error}\n")
+    return delay
+
+def _wait_for_retry(delay: float, stop_event: Optional[threading.Event]):
+    """delay 秒待つ。stop_event がセットされた場合は待機を打ち切って RetryInterrupted を送出する。"""
+    if stop_event is None:
+        time.sleep(delay)
+    elif stop_event.wait(delay):
+        raise RetryInterrupted("リトライの待機中に中断されました。")
+
+async def _wait_for_retry_async(delay: float, stop_event: Optional[threading.Event]):
+    """_wait_for_retry の非同期版。中断要求に素早く反応できるよう、待機は短い間隔に区切る。"""
+    deadline = time.monotonic() + delay
+    while True:
+        if stop_event is not None and stop_event.is_set():
+            raise RetryInterrupted("リトライの待機中に中断されました。")
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        await asyncio.sleep(min(remaining, 0.2) if stop_event is not None else remaining)
+
+def call_with_retry(
+        operation: Callable[[], T],
+        policy: Optional[RetryPolicy] = None,
+        description: str = "API呼び出し",
+        on_error: Optional[Callable[[Exception, Optional[float]], Any]] = None,
+        before_retry: Optional[Callable[[Exception], Any]] = None,
+        stop_event: Optional[threading.Event] = None) -> T:
+    """
+    operation を実行し、一時的なエラーであればリトライ方針に従って再実行する。
+    ストリーミング呼び出しは、ストリームを開いてから読み切るまでを operation に含めること
+    (途中で失敗した場合は最初からやり直すため、operation 内で結果のバッファを初期化する)。
+
+    Args:
+        operation (Callable): 実行する処理。
+        policy (RetryPolicy): リトライ方針。None の場合は既定値を使う。
+        description (str): ログに表示する処理名。
+        on_error (Callable): 失敗のたびに (例外, サーバー指定の待機秒数) で呼ばれるコールバック。
+        before_retry (Callable): 待機の後、次の試行の直前に直前の例外を受け取って呼ばれるコールバック。
+            on_error で隔離されたAPIキーのクライアントを、別のキーのものに取り替えるのに使う。
+        stop_event (threading.Event): セットされたら待機を打ち切り、RetryInterrupted を送出する。
+
+    Returns:
+        operation の戻り値。リトライ不可能なエラーや上限到達時は最後の例外を送出する。
+    """
+    policy = policy if policy is not None else RetryPolicy()
+    started_at = time.monotonic()
+    total_wait = 0.0
+    attempt = 0
+
+    while True:
+        attempt += 1
+        try:
+            result = operation()
+        except Exception as e:
+            delay = _next_retry_delay(e, attempt, policy, started_at, description, on_error)
+            if delay is None:
+                raise
+            _wait_for_retry(delay, stop_event)
+            total_wait += delay
+            if before_retry is not None:
+                before_retry(e)
+            continue
+
+        if attempt > 1:
+            _retry_logger(f"{description}: {attempt - 1}回のリトライ後に成功しました (合計待機 {total_wait:.1f}秒)\n")
+        return result
+
+async def call_with_retry_async(
+        operation: Callable[[], Awaitable[T]],
+        policy: Optional[RetryPolicy] = None,
+        description: str = "API呼び出し",
+        on_error: Optional[Callable[[Exception, Optional[float]], Any]] = None,
+        before_retry: Optional[Callable[[Exception], Any]] = None,
+        stop_event: Optional[threading.Event] = None) -> T:
+    """
+    call_with_retry の非同期版。operation はコルーチンを返す関数で、待機中はイベントループを止めない。
+    before_retry はコルーチン関数でもよい。
+    キャンセルされた場合 (asyncio.CancelledError) はリトライせずにそのまま伝える。
+    """
+    policy = policy if policy is not None else RetryPolicy()
+    started_at = time.monotonic()
+    total_wait = 0.0
+    attempt = 0
+
+    while True:
+        attempt += 1
+        try:
+            result = await operation()
+        except Exception as e:
+            delay = _next_retry_delay(e, attempt, policy, started_at, description, on_error)
+            if delay is None:
+                raise
+            await _wait_for_retry_async(delay, stop_event)
+            total_wait += delay
+            if before_retry is not None:
+                result = before_retry(e)
+                if inspect.isawaitable(result):
+                    await result
+            continue
+
+        if attempt > 1:
+            _retry_logger(f"{description}: {attempt - 1}回のリトライ後に成功しました (合計待機 {total_wait:.1f}秒)\n")
+        return result
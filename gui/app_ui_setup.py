@@ -26,6 +26,7 @@ def setup_main_ui(main_window_instance):
     file_menu = menu_bar.addMenu("プロジェクト")
     import_menu = menu_bar.addMenu("インポート")
     settings_menu = menu_bar.addMenu("設定")
+    tools_menu = menu_bar.addMenu("ツール")
 
     
     # プロジェクトメニュー
@@ -52,6 +53,21 @@ def setup_main_ui(main_window_instance):
     settings_menu.addAction(settings_api_action)
     settings_menu.addAction(settings_speaker_action)
     settings_menu.addAction(update_views_action)
+
+    # ツールメニュー
+    audio_cache_info_action = QAction("キャッシュの情報...", main_window_instance)
+    audio_cache_prune_action = QAction("キャッシュの整理...", main_window_instance)
+    build_stale_action = QAction("更新が必要なファイルのみ生成", main_window_instance)
+    regenerate_dialog_action = QAction("台本を撮り直す (応答キャッシュを使わない)", main_window_instance)
+    regenerate_dialog_action.setCheckable(True)
+    interjection_memo_action = QAction("相槌メモの一覧...", main_window_instance)
+
+    tools_menu.addAction(build_stale_action)
+    tools_menu.addAction(regenerate_dialog_action)
+    tools_menu.addSeparator()
+    tools_menu.addAction(audio_cache_info_action)
+    tools_menu.addAction(audio_cache_prune_action)
+    tools_menu.addAction(interjection_memo_action)
     
     # メインウィジェットとレイアウトのセットアップ
     main_widget = QWidget()
@@ -89,6 +105,11 @@ def setup_main_ui(main_window_instance):
     dialog_action_layout.addWidget(main_window_instance.start_dialog_creation_btn)
     dialog_action_layout.addWidget(main_window_instance.stop_dialog_creation_btn)
     scenario_files_layout.addLayout(dialog_action_layout)
+
+    # 台本 → SSML → 音声 を一括で流すボタン
+    main_window_instance.start_pipeline_btn = QPushButton("選択したファイルを音声まで一括生成")
+    main_window_instance.start_pipeline_btn.setEnabled(False) # 初期状態では無効
+    scenario_files_layout.addWidget(main_window_instance.start_pipeline_btn)
     top_row_file_lists_layout.addLayout(scenario_files_layout)
 
     # 右上: 処理対象のダイヤログファイル一覧 (これがWorkerの主入力となる想定)
@@ -160,5 +181,10 @@ def setup_main_ui(main_window_instance):
         "import_config_action": import_config_action,
         "settings_api_action": settings_api_action,
         "settings_speaker_action": settings_speaker_action,
-        "update_views_action":update_views_action
+        "update_views_action":update_views_action,
+        "audio_cache_info_action": audio_cache_info_action,
+        "audio_cache_prune_action": audio_cache_prune_action,
+        "build_stale_action": build_stale_action,
+        "regenerate_dialog_action": regenerate_dialog_action,
+        "interjection_memo_action": interjection_memo_action
     }
\ No newline at end of file
@@ -1,13 +1,16 @@
 from PyQt6.QtWidgets import (
     QApplication, QDialog, QDialogButtonBox, QFormLayout, QLineEdit,
     QVBoxLayout, QHBoxLayout, QListWidget, QPushButton, QMessageBox,
-    QLabel, QComboBox, QInputDialog, QTextEdit, QListWidgetItem
+    QLabel, QComboBox, QInputDialog, QTextEdit, QListWidgetItem,
+    QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView
 )
 
 from PyQt6.QtCore import Qt # QHeaderView.ResizeMode.Stretch のために必要
 from PyQt6.QtGui import QFont # フォント変更のためにインポート
 from typing import List, Dict, Optional # 型ヒントのためにインポート
+from datetime import datetime
 from core.models import Voice, Character
+from core.cache import InterjectionMemo
 
 class CharacterEditDialog(QDialog):
     """
@@ -275,6 +278,90 @@ class SpeakerDialog(QDialog):
         """ダイアログの結果として、最終的なキャラクターリストを返す"""
         return self.characters
 
+class InterjectionMemoDialog(QDialog):
+    """
+    相槌メモ (キャラクター・直前のセリフごとに覚えた相槌) の一覧を表示し、削除するためのダイアログ。
+    """
+    def __init__(self, memo: InterjectionMemo, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("相槌メモ")
+        self.setMinimumSize(700, 450)
+        self.memo = memo
+
+        # --- UIウィジェットの初期化 ---
+        self.summary_label = QLabel()
+        self.table = QTableWidget(0, 4)
+        self.table.setHorizontalHeaderLabels(["キャラクター", "直前のセリフ", "相槌のパターン", "最終利用"])
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        self.table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+
+        self.remove_btn = QPushButton("選択した項目を削除")
+        self.clear_btn = QPushButton("すべて削除")
+
+        # --- レイアウトの設定 ---
+        main_layout = QVBoxLayout(self)
+        main_layout.addWidget(self.summary_label)
+        main_layout.addWidget(self.table)
+
+        btn_layout = QHBoxLayout()
+        btn_layout.addWidget(self.remove_btn)
+        btn_layout.addWidget(self.clear_btn)
+        btn_layout.addStretch()
+        main_layout.addLayout(btn_layout)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
+        main_layout.addWidget(button_box)
+
+        # --- 初期値の設定と接続 ---
+        self.populate_table()
+
+        self.remove_btn.clicked.connect(self.remove_selected)
+        self.clear_btn.clicked.connect(self.clear_all)
+        button_box.rejected.connect(self.reject)
+
+    def populate_table(self):
+        """相槌メモの内容でテーブルを更新する"""
+        entries = self.memo.entries()
+        self.table.setRowCount(len(entries))
+        for row, entry in enumerate(entries):
+            character_item = QTableWidgetItem(entry["character"])
+            # 削除のために、行とエントリのキーを対応付けておく
+            character_item.setData(Qt.ItemDataRole.UserRole, entry["key"])
+            self.table.setItem(row, 0, character_item)
+            self.table.setItem(row, 1, QTableWidgetItem(entry["previous_speech"]))
+            self.table.setItem(row, 2, QTableWidgetItem(" / ".join(entry["variants"])))
+            self.table.setItem(row, 3, QTableWidgetItem(datetime.fromtimestamp(entry["last_used"]).strftime("%Y-%m-%d %H:%M")))
+
+        self.summary_label.setText(
+            f"{len(entries)}件のセリフについて相槌を覚えています。"
+            f"パターンが{self.memo.max_variants}個たまったセリフには、APIを呼ばずにその中から相槌を選びます。"
+        )
+
+    def remove_selected(self):
+        """「選択した項目を削除」ボタンの処理"""
+        rows = sorted({index.row() for index in self.table.selectedIndexes()})
+        if not rows:
+            QMessageBox.information(self, "情報", "削除したい項目をリストから選択してください。")
+            return
+        for row in rows:
+            self.memo.remove(self.table.item(row, 0).data(Qt.ItemDataRole.UserRole))
+        self.populate_table()
+
+    def clear_all(self):
+        """「すべて削除」ボタンの処理"""
+        reply = QMessageBox.question(
+            self,
+            "削除の確認",
+            "覚えているすべての相槌を削除しますか？",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+            QMessageBox.StandardButton.No
+        )
+        if reply == QMessageBox.StandardButton.Yes:
+            self.memo.clear()
+            self.populate_table()
+
 class SettingsDialog(QDialog):
     """APIキーとモデル名を設定するためのダイアログ"""
     # ★変更: __init__ に default_index を追加
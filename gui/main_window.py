@@ -1,5 +1,6 @@
 import os, sys
 import time
+import threading
 import shutil
 from datetime import datetime
 import traceback
@@ -41,12 +42,15 @@ from PyQt6.QtGui import (
 )
 
 from .app_ui_setup import setup_main_ui
-from .dialogs import SettingsDialog, SpeakerDialog
+from .dialogs import InterjectionMemoDialog, SettingsDialog, SpeakerDialog
 
 try:
     from core.models import (
         Project, 
-        Character
+        Character,
+        RateLimit,
+        PROFILE_STAGE_DIALOG,
+        PROFILE_STAGE_INTERJECTION
     )
 
     from core.orchestrator import (
@@ -64,9 +68,28 @@ try:
 
     from core.api_client import (
         ApiKeyManager, 
-        GeminiApiClient
+        GeminiApiClient,
+        GeminiApiClientPool,
+        estimate_tokens
     )
 
+    from core.render_engine import AudioRenderEngine
+    from core.manifest import (
+        BuildManifest,
+        ARTIFACT_FRESH,
+        ARTIFACT_STALE
+    )
+    from core.pipeline import (
+        ProductionPipeline,
+        StaleBuilder,
+        STAGE_DIALOG,
+        STAGE_SSML,
+        STAGE_AUDIO
+    )
+    from core.cache import InterjectionMemo, ResponseCache, format_cache_stats, project_caches
+    from core.retry import set_retry_logger
+    from core.async_runner import shutdown_async_runner
+
 except ImportError as e:
     print(f"モジュールのインポートエラー: {e}")
     print("core/orchestrator.py, utils/project_loader.py, core/api_client.py がパス上に存在するか確認してください。")
@@ -77,15 +100,63 @@ STATUS_COLOR = {
     "SUCCESS": QColor("green"), 
     "ERROR": QColor("red"),
     "INTERRUPTED": QColor("gray"), 
+    "STALE": QColor("darkorange"),
     "DEFAULT": QColor("black")
 }
 
 project: Project = None
 project_file_path = None
 api_key_manager: ApiKeyManager = None 
+# (APIキー, モデル名) ごとのクライアント。プロジェクトを開いたときに作り、閉じるときに接続を閉じる
+api_client_pool: GeminiApiClientPool = None
 speech_client: GeminiApiClient = None
 text_client: GeminiApiClient = None
 
+def acquire_api_client(
+        model_name: str,
+        estimated_tokens: int = 0,
+        stop_event: Optional[threading.Event] = None) -> Optional[GeminiApiClient]:
+    """
+    ApiKeyManager のローテーションに従い、利用枠に余裕のあるAPIキーのクライアントを返す。
+    クライアントはプールからキーごとに使い回す。キーマネージャーが無い場合は None、中断された場合も None を返す。
+    """
+    global project, api_key_manager, api_client_pool
+    if api_key_manager is None:
+        return None
+    if api_client_pool is not None:
+        return api_client_pool.acquire(model_name, estimated_tokens, stop_event)
+
+    api_key = api_key_manager.acquire_key(model_name, estimated_tokens, stop_event)
+    if api_key is None:
+        return None
+    return GeminiApiClient(
+        api_key,
+        model_name,
+        key_manager=api_key_manager,
+        retry_policy=project.retry_policy if project else None
+    )
+
+async def acquire_api_client_async(
+        model_name: str,
+        estimated_tokens: int = 0,
+        stop_event: Optional[threading.Event] = None) -> Optional[GeminiApiClient]:
+    """acquire_api_client の非同期版。イベントループ上で並行に生成する相槌の利用枠の確保に使う。"""
+    global project, api_key_manager, api_client_pool
+    if api_key_manager is None:
+        return None
+    if api_client_pool is not None:
+        return await api_client_pool.acquire_async(model_name, estimated_tokens, stop_event)
+
+    api_key = await api_key_manager.acquire_key_async(model_name, estimated_tokens, stop_event)
+    if api_key is None:
+        return None
+    return GeminiApiClient(
+        api_key,
+        model_name,
+        key_manager=api_key_manager,
+        retry_policy=project.retry_policy if project else None
+    )
+
 class DialogCreationWorker(QObject):
     """シナリオファイルから台本ファイルを生成するためのWorkerクラス"""
     finished = pyqtSignal()
@@ -94,10 +165,12 @@ class DialogCreationWorker(QObject):
     file_status_update = pyqtSignal(str, str)
     dialog_list_updated = pyqtSignal()
 
-    def __init__(self, files_to_process: List[Path]):
+    def __init__(self, files_to_process: List[Path], regenerate: bool = False):
         super().__init__()
         self.files_to_process = files_to_process
+        self.regenerate = regenerate
         self.is_running = True
+        self.stop_event = threading.Event()
 
     def run(self):
         """台本生成処理を実行します。"""
@@ -108,6 +181,8 @@ class DialogCreationWorker(QObject):
                 return
 
             dialog_output_dir = (project.root_path / "dialog").resolve()
+            manifest = BuildManifest.for_project(project)
+            response_cache = ResponseCache.for_project(project, refresh=self.regenerate)
             self.progress.emit("--- 台本ファイルの生成を開始します ---\n")
 
             for i, script_file in enumerate(self.files_to_process):
@@ -119,15 +194,32 @@ class DialogCreationWorker(QObject):
                     self.progress.emit(f"\n[{i+1}/{len(self.files_to_process)}] 台本生成中: {script_file.name}\n")
                     self.file_status_update.emit(script_file.name, "PROCESSING")
 
-                    # インポートしたバックエンド関数を呼び出す
+                    # 生成中にシナリオが編集されても古い台本を最新と記録しないよう、先に計算しておく
+                    fingerprint = manifest.fingerprint(STAGE_DIALOG, script_file)
+
+                    # インポートしたバックエンド関数を呼び出す。
+                    # 応答キャッシュに無い場合だけ、ローテーション中のAPIキーからクライアントを受け取る
                     saved_dialog_path = generate_dialog_from_script(
                         script_file,
                         dialog_output_dir,
                         project.characters,
-                        text_client
+                        response_cache=response_cache,
+                        client_provider=lambda tokens, model: acquire_api_client(model or project.text_model, tokens, self.stop_event),
+                        model_name=project.text_model,
+                        chunk_chars=project.dialog_chunk_chars,
+                        chunk_workers=project.dialog_chunk_workers,
+                        name_index=project.character_name_index if project.dialog_slim_prompt else None,
+                        profile_max_tokens=project.dialog_profile_max_tokens,
+                        profiles=project.profile_chain(PROFILE_STAGE_DIALOG),
+                        stop_event=self.stop_event
                     )
 
+                    if not saved_dialog_path and self.stop_event.is_set():
+                        self.file_status_update.emit(script_file.name, "INTERRUPTED")
+                        break
+
                     if saved_dialog_path:
+                        manifest.record(STAGE_DIALOG, script_file, saved_dialog_path, fingerprint)
                         self.progress.emit(f"台本生成成功: {saved_dialog_path.name}\n")
                         self.file_status_update.emit(script_file.name, "SUCCESS")
                     else:
@@ -150,6 +242,7 @@ class DialogCreationWorker(QObject):
         """処理の中断を要求します。"""
         self.progress.emit("台本生成処理の中断命令を受け付けました。\n")
         self.is_running = False
+        self.stop_event.set()
 
 class SsmlCreationWorker(QObject):
     """ダイヤログファイルからSSMLファイルを生成するためのWorkerクラス"""
@@ -163,6 +256,7 @@ class SsmlCreationWorker(QObject):
         super().__init__()
         self.files_to_process = files_to_process
         self.is_running = True
+        self.stop_event = threading.Event()
 
     def run(self):
         """SSML生成処理を実行します。"""
@@ -173,6 +267,8 @@ class SsmlCreationWorker(QObject):
                 return
 
             ssml_output_dir = (project.root_path / "ssml").resolve()
+            manifest = BuildManifest.for_project(project)
+            interjection_memo = InterjectionMemo.for_project(project)
             self.progress.emit("\n--- SSMLファイルの生成を開始します ---\n")
 
             for i, txt_file in enumerate(self.files_to_process):
@@ -184,11 +280,26 @@ class SsmlCreationWorker(QObject):
                     self.progress.emit(f"\n[{i+1}/{len(self.files_to_process)}] SSML生成中: {txt_file.name}\n")
                     self.file_status_update.emit(txt_file.name, "PROCESSING")
 
+                    fingerprint = manifest.fingerprint(STAGE_SSML, txt_file)
+
+                    # 相槌を生成するリクエストごとに、ローテーション中のAPIキーからクライアントを受け取る
                     saved_ssml_path = generate_ssml_from_text(
-                        txt_file, ssml_output_dir, project.characters, text_client
+                        txt_file, ssml_output_dir, project.characters,
+                        interjection_mode=project.interjection_mode,
+                        interjection_max_workers=project.interjection_max_workers,
+                        interjection_memo=interjection_memo,
+                        interjection_profiles=project.profile_chain(PROFILE_STAGE_INTERJECTION),
+                        client_provider=lambda tokens, model: acquire_api_client(model or project.text_model, tokens, self.stop_event),
+                        async_client_provider=lambda tokens, model: acquire_api_client_async(model or project.text_model, tokens, self.stop_event),
+                        stop_event=self.stop_event
                     )
 
+                    if not saved_ssml_path and self.stop_event.is_set():
+                        self.file_status_update.emit(txt_file.name, "INTERRUPTED")
+                        break
+
                     if saved_ssml_path:
+                        manifest.record(STAGE_SSML, txt_file, saved_ssml_path, fingerprint)
                         self.progress.emit(f"SSML生成成功: {saved_ssml_path.name}\n")
                         self.file_status_update.emit(txt_file.name, "SUCCESS")
                     else:
@@ -210,6 +321,7 @@ class SsmlCreationWorker(QObject):
     def stop(self):
         """処理の中断を要求します。"""
         self.is_running = False
+        self.stop_event.set()
 
 class AudioCreationWorker(QObject):
     """SSMLファイルから音声ファイルを生成するためのWorkerクラス"""
@@ -223,6 +335,18 @@ class AudioCreationWorker(QObject):
         super().__init__()
         self.files_to_process = files_to_process
         self.is_running = True
+        self.engine: Optional[AudioRenderEngine] = None
+
+    def _provide_speech_client(self, estimated_tokens: int, stop_event) -> Optional[GeminiApiClient]:
+        """ApiKeyManager から利用枠のあるAPIキーを受け取り、対応する音声クライアントを返す。"""
+        global project
+        return acquire_api_client(project.speech_model, estimated_tokens, stop_event)
+
+    def _on_file_status(self, file_name: str, status: str):
+        """AudioRenderEngine からのステータス通知をシグナルに中継する。"""
+        self.file_status_update.emit(file_name, status)
+        if status in ("SUCCESS", "ERROR", "INTERRUPTED"):
+            self.audio_list_updated.emit()
 
     def run(self):
         """音声生成処理を実行します。"""
@@ -232,41 +356,20 @@ class AudioCreationWorker(QObject):
                 self.error.emit("エラー: プロジェクトまたは音声APIクライアントが初期化されていません。\n")
                 return
 
-            audio_output_dir = (project.root_path / "audio").resolve()
             self.progress.emit("\n--- 音声ファイルの生成を開始します ---\n")
 
-            for i, ssml_file in enumerate(self.files_to_process):
-                if not self.is_running:
-                    self.file_status_update.emit(ssml_file.name, "INTERRUPTED")
-                    break
-                
-                status = "ERROR"
-                try:
-                    self.progress.emit(f"\n[{i+1}/{len(self.files_to_process)}] 音声生成中: {ssml_file.name}\n")
-                    self.file_status_update.emit(ssml_file.name, "PROCESSING")
+            self.engine = AudioRenderEngine.for_project(
+                project,
+                client_provider=self._provide_speech_client,
+                on_status=self._on_file_status,
+                on_progress=self.progress.emit
+            )
 
-                    generate_audio_from_ssml(
-                        ssml_file, audio_output_dir, project.characters, speech_client
-                    )
-                    status = "SUCCESS"
-                except Exception as e:
-                    self.error.emit(f"音声生成中に予期せぬエラーが発生 ({ssml_file.name}): {e}\n{traceback.format_exc()}\n")
-                    status = "ERROR"
-                finally:
-                    if not self.is_running: status = "INTERRUPTED"
-                    self.file_status_update.emit(ssml_file.name, status)
-                    self.audio_list_updated.emit()
-
-                wait_seconds = project.wait_time
-                if not isinstance(wait_seconds, (int, float)):
-                    self.error.emit(f"警告: 'wait_seconds' の値が数値ではありません。デフォルト値 (30秒) を使用します。\n")
-                    wait_seconds = 30
-
-                if i < len(self.files_to_process) - 1 and self.is_running:
-                    self.progress.emit(f"{wait_seconds}秒待機します...\n")
-                    for _ in range(int(wait_seconds)):
-                        if not self.is_running: break
-                        time.sleep(1)
+            # stop() がエンジン生成前に呼ばれていた場合
+            if not self.is_running:
+                self.engine.stop()
+
+            self.engine.render(self.files_to_process)
 
             self.progress.emit("\n選択されたファイルの音声生成処理が完了しました。\n")
         except Exception as e:
@@ -277,8 +380,165 @@ class AudioCreationWorker(QObject):
     def stop(self):
         """処理の中断を要求します。"""
         self.is_running = False
+        if self.engine is not None:
+            self.engine.stop()
+
+class PipelineWorker(QObject):
+    """シナリオファイルから 台本 → SSML → 音声 までを一括で生成するためのWorkerクラス"""
+    finished = pyqtSignal()
+    progress = pyqtSignal(str)
+    error = pyqtSignal(str)
+    file_status_update = pyqtSignal(str, str) # シナリオファイル名とステータスを通知
+    dialog_list_updated = pyqtSignal()
+    ssml_list_updated = pyqtSignal()
+    audio_list_updated = pyqtSignal()
+
+    def __init__(self, files_to_process: List[Path], regenerate: bool = False):
+        super().__init__()
+        self.files_to_process = files_to_process
+        self.regenerate = regenerate
+        self.is_running = True
+        self.pipeline: Optional[ProductionPipeline] = None
+
+    def _provide_text_client(self, estimated_tokens: int, stop_event, model_name: Optional[str] = None) -> Optional[GeminiApiClient]:
+        global project
+        return acquire_api_client(model_name or project.text_model, estimated_tokens, stop_event)
+
+    async def _provide_text_client_async(self, estimated_tokens: int, stop_event, model_name: Optional[str] = None) -> Optional[GeminiApiClient]:
+        global project
+        return await acquire_api_client_async(model_name or project.text_model, estimated_tokens, stop_event)
+
+    def _provide_speech_client(self, estimated_tokens: int, stop_event) -> Optional[GeminiApiClient]:
+        global project
+        return acquire_api_client(project.speech_model, estimated_tokens, stop_event)
+
+    def _on_stage_complete(self, stage: str, output_path: Path):
+        """ProductionPipeline からのステージ完了通知を、リスト更新のシグナルに中継する。"""
+        {
+            STAGE_DIALOG: self.dialog_list_updated,
+            STAGE_SSML: self.ssml_list_updated,
+            STAGE_AUDIO: self.audio_list_updated,
+        }[stage].emit()
+
+    def run(self):
+        """一括生成処理を実行します。"""
+        global project, text_client, speech_client
+        try:
+            if project is None or text_client is None or speech_client is None:
+                self.error.emit("エラー: プロジェクトまたはAPIクライアントが初期化されていません。\n")
+                return
+
+            self.pipeline = ProductionPipeline(
+                project,
+                text_client_provider=self._provide_text_client,
+                speech_client_provider=self._provide_speech_client,
+                on_status=self.file_status_update.emit,
+                on_progress=self.progress.emit,
+                on_stage_complete=self._on_stage_complete,
+                regenerate=self.regenerate,
+                async_text_client_provider=self._provide_text_client_async
+            )
+
+            # stop() がパイプライン生成前に呼ばれていた場合
+            if not self.is_running:
+                self.pipeline.stop()
+
+            self.pipeline.run(self.files_to_process)
+
+            self.progress.emit("\n選択されたファイルの一括生成処理が完了しました。\n")
+        except Exception as e:
+            self.error.emit(f"致命的なエラーが発生しました: {e}\n{traceback.format_exc()}\n")
+        finally:
+            self.finished.emit()
+
+    def stop(self):
+        """処理の中断を要求します。"""
+        self.progress.emit("一括生成処理の中断命令を受け付けました。\n")
+        self.is_running = False
+        if self.pipeline is not None:
+            self.pipeline.stop()
+
+class StaleBuildWorker(QObject):
+    """入力や設定が変わった 台本・SSML・音声 だけを作り直すためのWorkerクラス"""
+    finished = pyqtSignal()
+    progress = pyqtSignal(str)
+    error = pyqtSignal(str)
+    stage_status_update = pyqtSignal(str, str, str) # ステージ名・入力ファイル名・ステータスを通知
+    dialog_list_updated = pyqtSignal()
+    ssml_list_updated = pyqtSignal()
+    audio_list_updated = pyqtSignal()
+
+    def __init__(self, regenerate: bool = False):
+        super().__init__()
+        self.regenerate = regenerate
+        self.is_running = True
+        self.builder: Optional[StaleBuilder] = None
+
+    def _provide_text_client(self, estimated_tokens: int, stop_event, model_name: Optional[str] = None) -> Optional[GeminiApiClient]:
+        global project
+        return acquire_api_client(model_name or project.text_model, estimated_tokens, stop_event)
+
+    async def _provide_text_client_async(self, estimated_tokens: int, stop_event, model_name: Optional[str] = None) -> Optional[GeminiApiClient]:
+        global project
+        return await acquire_api_client_async(model_name or project.text_model, estimated_tokens, stop_event)
+
+    def _provide_speech_client(self, estimated_tokens: int, stop_event) -> Optional[GeminiApiClient]:
+        global project
+        return acquire_api_client(project.speech_model, estimated_tokens, stop_event)
+
+    def _on_stage_complete(self, stage: str, output_path: Path):
+        """StaleBuilder からのステージ完了通知を、リスト更新のシグナルに中継する。"""
+        {
+            STAGE_DIALOG: self.dialog_list_updated,
+            STAGE_SSML: self.ssml_list_updated,
+            STAGE_AUDIO: self.audio_list_updated,
+        }[stage].emit()
+
+    def run(self):
+        """差分ビルドを実行します。"""
+        global project, text_client, speech_client
+        try:
+            if project is None or text_client is None or speech_client is None:
+                self.error.emit("エラー: プロジェクトまたはAPIクライアントが初期化されていません。\n")
+                return
+
+            self.builder = StaleBuilder(
+                project,
+                text_client_provider=self._provide_text_client,
+                speech_client_provider=self._provide_speech_client,
+                on_status=self.stage_status_update.emit,
+                on_progress=self.progress.emit,
+                on_stage_complete=self._on_stage_complete,
+                regenerate=self.regenerate,
+                async_text_client_provider=self._provide_text_client_async
+            )
+
+            # stop() がビルダー生成前に呼ばれていた場合
+            if not self.is_running:
+                self.builder.stop()
+
+            results = self.builder.run()
+
+            if any(results.values()):
+                self.progress.emit("\n更新が必要なファイルの生成処理が完了しました。\n")
+            else:
+                self.progress.emit("\nすべてのファイルが最新です。生成は行いませんでした。\n")
+        except Exception as e:
+            self.error.emit(f"致命的なエラーが発生しました: {e}\n{traceback.format_exc()}\n")
+        finally:
+            self.finished.emit()
+
+    def stop(self):
+        """処理の中断を要求します。"""
+        self.progress.emit("差分ビルドの中断命令を受け付けました。\n")
+        self.is_running = False
+        if self.builder is not None:
+            self.builder.stop()
 
 class AppGUI(QMainWindow):
+    # Workerスレッドから届くリトライ状況をログ欄に表示するためのシグナル
+    retry_log = pyqtSignal(str)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Ai Radio Drama Creator")
@@ -287,6 +547,10 @@ class AppGUI(QMainWindow):
         self.thread = None
         self.init_ui()
 
+        # API呼び出しのリトライ回数・待機時間をログ欄に流す
+        self.retry_log.connect(self.update_log)
+        set_retry_logger(self.retry_log.emit)
+
     def init_ui(self):
         """
         GUIの主要なUI要素を初期化し、イベントハンドラを接続します。
@@ -320,9 +584,15 @@ class AppGUI(QMainWindow):
         ui_elements_dict["import_md_scenario_action"].triggered.connect(self.import_md_scenario)
         ui_elements_dict["import_config_action"].triggered.connect(self.import_project_settings)
         ui_elements_dict["update_views_action"].triggered.connect(self.update_views)
+        ui_elements_dict["audio_cache_info_action"].triggered.connect(self.show_audio_cache_info)
+        ui_elements_dict["audio_cache_prune_action"].triggered.connect(self.prune_audio_cache)
+        ui_elements_dict["build_stale_action"].triggered.connect(self.start_stale_build)
+        self.regenerate_dialog_action = ui_elements_dict["regenerate_dialog_action"]
+        ui_elements_dict["interjection_memo_action"].triggered.connect(self.show_interjection_memo)
 
         # 各処理ステージのボタンにメソッドを接続
         self.start_dialog_creation_btn.clicked.connect(self.start_dialog_creation)
+        self.start_pipeline_btn.clicked.connect(self.start_pipeline)
         self.stop_dialog_creation_btn.clicked.connect(self.stop_processing)
 
         self.start_ssml_creation_btn.clicked.connect(self.start_ssml_creation)
@@ -404,11 +674,75 @@ class AppGUI(QMainWindow):
             self.save_project_config_to_file()
 
             self.update_log("デバッグ: 話者設定が更新されました。\n")
+
+            # キャラクターの変更で古くなった成果物の表示を更新する
+            self.update_dialog_list()
+            self.update_ssml_list()
+            self.update_audio_list()
             
             self.update_log(f"更新された話者: {project.characters}\n")
 
+    def show_audio_cache_info(self):
+        caches = project_caches(project)
+        if not caches:
+            QMessageBox.warning(self, "キャッシュ", "プロジェクトが読み込まれていません。")
+            return
+        QMessageBox.information(
+            self, "キャッシュの情報", "\n".join(format_cache_stats(cache.stats()) for cache in caches)
+        )
+
+    def prune_audio_cache(self):
+        caches = project_caches(project)
+        if not caches:
+            QMessageBox.warning(self, "キャッシュ", "プロジェクトが読み込まれていません。")
+            return
+
+        message_box = QMessageBox(self)
+        message_box.setWindowTitle("キャッシュの整理")
+        message_box.setText(
+            "\n".join(format_cache_stats(cache.stats()) for cache in caches)
+            + "\n「整理」は容量上限を超えた分を古い順に削除し、「すべて削除」はキャッシュを空にします。"
+        )
+        prune_button = message_box.addButton("整理", QMessageBox.ButtonRole.AcceptRole)
+        clear_button = message_box.addButton("すべて削除", QMessageBox.ButtonRole.DestructiveRole)
+        message_box.addButton(QMessageBox.StandardButton.Cancel)
+        message_box.exec()
+
+        clicked = message_box.clickedButton()
+        if clicked == prune_button:
+            results = [cache.prune() for cache in caches]
+        elif clicked == clear_button:
+            results = [cache.clear() for cache in caches]
+        else:
+            return
+        removed = sum(count for count, _ in results)
+        freed = sum(size for _, size in results)
+        self.update_log(f"キャッシュを整理しました: {removed}件削除 ({freed / (1024 * 1024):.1f} MB 解放)\n")
+
+    def show_interjection_memo(self):
+        if not project:
+            QMessageBox.warning(self, "相槌メモ", "プロジェクトが読み込まれていません。")
+            return
+        memo = InterjectionMemo.for_project(project)
+        if memo is None:
+            QMessageBox.information(self, "相槌メモ", "このプロジェクトでは相槌メモが無効になっています (interjection_settings.memo_enabled)。")
+            return
+        InterjectionMemoDialog(memo, self).exec()
+
+    def close_api_clients(self):
+        """使い回していたAPIクライアントの接続を閉じる。プロジェクトを切り替えるときと、アプリの終了時に呼ぶ。"""
+        global api_client_pool, speech_client, text_client
+        pool, api_client_pool = api_client_pool, None
+        speech_client = None
+        text_client = None
+        if pool is not None:
+            pool.close()
+
     def initialize_api_clients(self):
-        global project, api_key_manager, speech_client, text_client # グローバル変数を変更するためにglobal宣言
+        global project, api_key_manager, api_client_pool, speech_client, text_client # グローバル変数を変更するためにglobal宣言
+
+        # 前のプロジェクトのクライアントは使わないため、接続を閉じておく
+        self.close_api_clients()
 
         if project is None:
             self.update_log("エラー: Project設定が初期化されていません。APIクライアントを初期化できません。\n")
@@ -426,23 +760,39 @@ class AppGUI(QMainWindow):
                 return
 
             # ApiKeyManagerをインスタンス化（これによりdefault_api_keyが設定される）
-            api_key_manager = ApiKeyManager(api_keys_list, default_index)
+            wait_seconds = project.wait_time
+            if not isinstance(wait_seconds, (int, float)):
+                self.update_log(f"警告: 'wait_seconds' の値が数値ではありません。デフォルト値 (30秒) を使用します。\n")
+                wait_seconds = 30
+
+            api_key_manager = ApiKeyManager(
+                api_keys_list,
+                default_index,
+                rate_limits=project.rate_limits,
+                # 制限が未設定のモデルには、従来の wait_seconds 相当のRPMを適用する
+                default_rate_limit=RateLimit.from_wait_seconds(wait_seconds)
+            )
             
             # デフォルトAPIキーを取得
             default_api_key_str = api_key_manager.default_api_key
             self.update_log(f"デバッグ: initialize_api_clients: デフォルトAPIキー文字列: '{default_api_key_str[:5]}...' (隠蔽)\n")
 
-            # GeminiApiClientのインスタンスを生成し、グローバル変数に代入
-            speech_client = GeminiApiClient(default_api_key_str, speech_model_name)
-            text_client = GeminiApiClient(default_api_key_str, text_model_name)
+            # GeminiApiClientのインスタンスをプールから受け取り、グローバル変数に代入
+            # (各Workerは処理ごとに acquire_api_client で別のキーのクライアントを受け取る)
+            api_client_pool = GeminiApiClientPool(api_key_manager, project.retry_policy)
+            speech_client = api_client_pool.get(default_api_key_str, speech_model_name)
+            text_client = api_client_pool.get(default_api_key_str, text_model_name)
+
+            # 残りのキーのクライアントは、画面を止めないよう別スレッドで作っておく
+            profile_models = [profile.model for profile in project.generation_profiles.values() if profile.model]
+            api_client_pool.prewarm([text_model_name, speech_model_name, *profile_models])
 
             self.update_log(f"デバッグ: グローバルな speech_client (型: {type(speech_client)}) と text_client (型: {type(text_client)}) を初期化しました。\n")
         except Exception as e:
             self.update_log(f"エラー: グローバルAPIクライアントの初期化中に問題が発生しました: {e}\n")
             self.update_log(f"詳細エラー情報:\n{traceback.format_exc()}\n")
             # 初期化失敗時はNoneに戻す
-            speech_client = None
-            text_client = None        
+            self.close_api_clients()        
 
     def new_project(self):
         global project, project_file_path
@@ -661,6 +1011,7 @@ class AppGUI(QMainWindow):
         
         # ボタンの有効化
         self.start_dialog_creation_btn.setEnabled(True)
+        self.start_pipeline_btn.setEnabled(True)
         self.start_ssml_creation_btn.setEnabled(True)
         self.start_audio_creation_btn.setEnabled(True)
         
@@ -788,14 +1139,20 @@ class AppGUI(QMainWindow):
 
         if not project == None:
             self.update_file_list(project.root_path / "script", self.scenario_file_list_widget, file_type="text", label="シナリオ")
-            self.update_file_list(project.root_path / "dialog", self.dialog_file_list_widget, file_type="text", label="台本")
-            self.update_file_list(project.root_path / "ssml", self.ssml_file_list_widget, file_type="ssml", label="SSML")
-            self.update_file_list(project.root_path / "audio", self.audio_file_list_widget, file_type="audio", label="音声")
+            self.update_file_list(project.root_path / "dialog", self.dialog_file_list_widget, file_type="text", label="台本", stage=STAGE_DIALOG)
+            self.update_file_list(project.root_path / "ssml", self.ssml_file_list_widget, file_type="ssml", label="SSML", stage=STAGE_SSML)
+            self.update_file_list(project.root_path / "audio", self.audio_file_list_widget, file_type="audio", label="音声", stage=STAGE_AUDIO)
 
             self.update_log(f"デバッグ: プロジェクト '{project.project_name}' が再読込されました。\n")
 
-    def update_file_list(self, dir_path: Path, list_widget: QListWidget, file_type: str = "text", label: str = "ファイル"):
+    def update_file_list(self, dir_path: Path, list_widget: QListWidget, file_type: str = "text", label: str = "ファイル", stage: Optional[str] = None):
+        """
+        フォルダ内のファイルをリストに表示する。
+        stage を指定した場合は、ビルドマニフェストと照らし合わせて各ファイルが最新か要再生成かを表示する。
+        """
         list_widget.clear()
+        manifest = BuildManifest.for_project(project) if stage else None
+        artifacts = manifest.load() if manifest else None
         if dir_path.is_dir():
             if file_type == "text":
                 files = sorted([f for f in dir_path.glob("*.txt") if f.is_file()])
@@ -804,8 +1161,8 @@ class AppGUI(QMainWindow):
                 files = sorted([f for f in dir_path.glob("*.ssml") if f.is_file()])
                 suffix_label = f".ssml {label}"
             elif file_type == "audio":
-                files = sorted([f for f in dir_path.glob("*.mp3") if f.is_file()] + [f for f in dir_path.glob("*.wav") if f.is_file()])
-                suffix_label = f".mp3/.wav {label}"
+                files = sorted(f for pattern in ("*.mp3", "*.opus", "*.wav") for f in dir_path.glob(pattern) if f.is_file())
+                suffix_label = f".mp3/.opus/.wav {label}"
             else:
                 files = []
                 suffix_label = label
@@ -814,12 +1171,25 @@ class AppGUI(QMainWindow):
                 for f_path in files:
                     item = QListWidgetItem(f_path.name)
                     item.setData(Qt.ItemDataRole.UserRole, f_path)
+                    if manifest is not None:
+                        self._mark_artifact_status(item, manifest.status(stage, f_path, artifacts))
                     list_widget.addItem(item)
             else:
                 list_widget.addItem(f"（このフォルダに {suffix_label} はありません）")
         else:
             list_widget.addItem(f"（フォルダ '{dir_path.name}' が見つかりません）")
 
+    def _mark_artifact_status(self, item: QListWidgetItem, artifact_status: str):
+        """成果物が最新か、入力・設定の変更により再生成が必要かをアイテムに表示する"""
+        name = item.data(Qt.ItemDataRole.UserRole).name
+        if artifact_status == ARTIFACT_STALE:
+            item.setText(f"{name} [要再生成]")
+            item.setForeground(STATUS_COLOR["STALE"])
+            item.setToolTip("元のファイルか生成設定 (キャラクター・モデル・パラメータ) が変更されています。")
+        elif artifact_status == ARTIFACT_FRESH:
+            item.setText(f"{name} [最新]")
+            item.setToolTip("元のファイルと生成設定から作られた最新の成果物です。")
+
     def update_file_status(self, list_widget: QListWidget, file_path_name: str, status: str):
         """指定されたリストウィジェット内のアイテムの表示ステータスを更新する"""
         for i in range(list_widget.count()):
@@ -835,7 +1205,7 @@ class AppGUI(QMainWindow):
                 item.setForeground(STATUS_COLOR.get(status, STATUS_COLOR["DEFAULT"]))
                 break
 
-    def _start_worker_thread(self, worker_class, files_to_process, source_list_widget):
+    def _start_worker_thread(self, worker_class, files_to_process, source_list_widget, **worker_kwargs):
         """Workerスレッドを開始するための共通ロジック"""
         if not files_to_process:
             QMessageBox.warning(self, "選択エラー", "処理するファイルをリストから選択してください。")
@@ -853,7 +1223,7 @@ class AppGUI(QMainWindow):
             self.update_file_status(source_list_widget, file_path.name, "WAITING")
 
         self.thread = QThread()
-        self.worker = worker_class(files_to_process)
+        self.worker = worker_class(files_to_process, **worker_kwargs)
         self.worker.moveToThread(self.thread)
 
         # シグナルとスロットを接続
@@ -876,13 +1246,65 @@ class AppGUI(QMainWindow):
         elif isinstance(self.worker, AudioCreationWorker):
             # AudioCreationWorkerはファイルごとにリスト更新シグナルを出す
             self.worker.audio_list_updated.connect(self.update_audio_list)
+        elif isinstance(self.worker, PipelineWorker):
+            # 一括生成では、ステージが進むたびに該当するリストを更新する
+            self.worker.dialog_list_updated.connect(self.update_dialog_list)
+            self.worker.ssml_list_updated.connect(self.update_ssml_list)
+            self.worker.audio_list_updated.connect(self.update_audio_list)
 
         self.thread.start()
 
     def start_dialog_creation(self):
         selected_items = self.scenario_file_list_widget.selectedItems()
         files_to_process = [item.data(Qt.ItemDataRole.UserRole) for item in selected_items if item.data(Qt.ItemDataRole.UserRole)]
-        self._start_worker_thread(DialogCreationWorker, files_to_process, self.scenario_file_list_widget)
+        self._start_worker_thread(
+            DialogCreationWorker, files_to_process, self.scenario_file_list_widget,
+            regenerate=self.regenerate_dialog_action.isChecked()
+        )
+
+    def start_pipeline(self):
+        selected_items = self.scenario_file_list_widget.selectedItems()
+        files_to_process = [item.data(Qt.ItemDataRole.UserRole) for item in selected_items if item.data(Qt.ItemDataRole.UserRole)]
+        self._start_worker_thread(
+            PipelineWorker, files_to_process, self.scenario_file_list_widget,
+            regenerate=self.regenerate_dialog_action.isChecked()
+        )
+
+    def start_stale_build(self):
+        """入力や設定が変わった 台本・SSML・音声 だけを作り直す"""
+        if not project:
+            QMessageBox.critical(self, "エラー", "プロジェクトが読み込まれていません。")
+            return
+
+        self.log_box.clear()
+        self.set_processing_state(True) # すべての操作を無効化
+
+        # ステージごとに、入力ファイルが表示されているリストのステータスを更新する
+        source_list_widgets = {
+            STAGE_DIALOG: self.scenario_file_list_widget,
+            STAGE_SSML: self.dialog_file_list_widget,
+            STAGE_AUDIO: self.ssml_file_list_widget,
+        }
+
+        self.thread = QThread()
+        self.worker = StaleBuildWorker(regenerate=self.regenerate_dialog_action.isChecked())
+        self.worker.moveToThread(self.thread)
+
+        self.worker.stage_status_update.connect(
+            lambda stage, name, status: self.update_file_status(source_list_widgets[stage], name, status)
+        )
+        self.thread.started.connect(self.worker.run)
+        self.worker.finished.connect(self.thread.quit)
+        self.worker.finished.connect(self.worker.deleteLater)
+        self.thread.finished.connect(self.thread.deleteLater)
+        self.worker.progress.connect(self.update_log)
+        self.worker.error.connect(self.update_log)
+        self.thread.finished.connect(lambda: self.set_processing_state(False))
+        self.worker.dialog_list_updated.connect(self.update_dialog_list)
+        self.worker.ssml_list_updated.connect(self.update_ssml_list)
+        self.worker.audio_list_updated.connect(self.update_audio_list)
+
+        self.thread.start()
 
     def start_ssml_creation(self):
         selected_items = self.dialog_file_list_widget.selectedItems()
@@ -908,6 +1330,7 @@ class AppGUI(QMainWindow):
         enabled = not is_processing
         # すべての開始ボタンの状態を設定
         self.start_dialog_creation_btn.setEnabled(enabled)
+        self.start_pipeline_btn.setEnabled(enabled)
         self.start_ssml_creation_btn.setEnabled(enabled)
         self.start_audio_creation_btn.setEnabled(enabled)
         # すべての中断ボタンの状態を設定
@@ -928,21 +1351,21 @@ class AppGUI(QMainWindow):
         """台本ファイルリストを更新するスロット"""
         if project and project.root_path:
             dialog_path = project.root_path / "dialog"
-            self.update_file_list(dialog_path, self.dialog_file_list_widget, file_type="text", label="台本")
+            self.update_file_list(dialog_path, self.dialog_file_list_widget, file_type="text", label="台本", stage=STAGE_DIALOG)
             self.update_log("台本ファイルリストを更新しました。\n")
 
     def update_ssml_list(self):
         """SSMLファイルリストを更新するスロット"""
         if project and project.root_path:
             ssml_path = project.root_path / "ssml"
-            self.update_file_list(ssml_path, self.ssml_file_list_widget, file_type="ssml", label="SSML")
+            self.update_file_list(ssml_path, self.ssml_file_list_widget, file_type="ssml", label="SSML", stage=STAGE_SSML)
             self.update_log("SSMLファイルリストを更新しました。\n")
 
     def update_audio_list(self):
         """音声ファイルリストを更新するスロット"""
         if project and project.root_path:
             audio_path = project.root_path / "audio"
-            self.update_file_list(audio_path, self.audio_file_list_widget, file_type="audio", label="音声")
+            self.update_file_list(audio_path, self.audio_file_list_widget, file_type="audio", label="音声", stage=STAGE_AUDIO)
             self.update_log("音声ファイルリストを更新しました。\n")
 
     def update_log(self, text):
@@ -967,4 +1390,7 @@ class AppGUI(QMainWindow):
             self.stop_processing()
             self.thread.quit()
             self.thread.wait(2000)
+        # 使い回していたクライアントの接続を閉じてから、Workerが非同期のAPI呼び出しに使ったイベントループを止める
+        self.close_api_clients()
+        shutdown_async_runner()
         event.accept()
\ No newline at end of file
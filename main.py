@@ -1,12 +1,63 @@
+import argparse
 import sys
 from pathlib import Path
 
 # 新しいモジュールをインポート
-from core.orchestrator import run_project_processing
+from core.orchestrator import compile_ssml_directory, run_project_pipeline, run_project_processing, run_stale_build
 from utils.project_loader import load_project_from_file
-from core.api_client import ApiKeyManager
+from core.api_client import ApiKeyManager, GeminiApiClientPool
+from core.async_runner import shutdown_async_runner
+from core.mock_backend import MockBackendConfig, install_mock_backend
+from core.cache import format_cache_stats, project_caches
+from core.models import RateLimit
 from gui.run import run_gui
 
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="AIラジオドラマ作成ツール。引数なしで起動するとGUIモードになります。"
+    )
+    parser.add_argument("project_file", type=Path, help="プロジェクト設定ファイル (project.json)")
+    parser.add_argument(
+        "--mock-backend", type=Path, default=None, metavar="CONFIG_JSON",
+        help="APIを呼ばずに、ローカルのモックバックエンドで処理する (負荷試験用)。設定はJSONで指定する ({} で既定値)"
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    subparsers.add_parser("render", help="ssml/ 内のSSMLから音声を生成する (既定)")
+
+    run_all_parser = subparsers.add_parser("run-all", help="script/ 内のシナリオを 台本 → SSML → 音声 まで一括で処理する")
+    run_all_parser.add_argument("--queue-size", type=int, default=None, help="ステージ間に溜めておけるファイル数。省略時はプロジェクト設定の値")
+    run_all_parser.add_argument("--regenerate", action="store_true", help="台本の応答キャッシュを使わずに生成し直す (撮り直し)")
+
+    build_stale_parser = subparsers.add_parser("build-stale", help="入力や設定が変わった 台本・SSML・音声 だけを作り直す (最新のものはスキップ)")
+    build_stale_parser.add_argument("--regenerate", action="store_true", help="台本の応答キャッシュを使わずに生成し直す (撮り直し)")
+
+    compile_ssml_parser = subparsers.add_parser("compile-ssml", help="dialog/ 内のすべての台本をSSMLに変換する (APIは使わず、相槌は挿入しない)")
+    compile_ssml_parser.add_argument("--workers", type=int, default=None, help="変換に使うプロセス数。省略時はCPUのコア数")
+
+    cache_parser = subparsers.add_parser("cache", help="キャッシュ (音声・台本の応答) を管理する")
+    cache_parser.add_argument("action", choices=["info", "prune", "clear"], help="info: 状態の表示 / prune: 容量上限まで削除 / clear: 全削除")
+    cache_parser.add_argument("--max-mb", type=float, default=None, help="prune 時の容量上限 (MB)。省略時はプロジェクト設定の値")
+    return parser
+
+def run_cache_command(project, action: str, max_mb=None) -> int:
+    caches = project_caches(project)
+    if not caches:
+        print("エラー: プロジェクトのルートフォルダが特定できません。")
+        return 1
+
+    for cache in caches:
+        if action == "prune":
+            max_bytes = int(max_mb * 1024 * 1024) if max_mb is not None else None
+            removed, freed = cache.prune(max_bytes)
+            print(f"{removed}件のエントリを削除しました ({freed / (1024 * 1024):.1f} MB 解放)")
+        elif action == "clear":
+            removed, freed = cache.clear()
+            print(f"キャッシュを空にしました: {removed}件 ({freed / (1024 * 1024):.1f} MB)")
+
+        print(format_cache_stats(cache.stats()))
+    return 0
+
 def main():
     """
     アプリケーションのエントリーポイント。
@@ -14,22 +65,53 @@ def main():
     """
     if len(sys.argv) > 1:
         # --- CLI モード ---
-        project_file_path = Path(sys.argv[1])
-        config = load_project_config(project_file_path)
-        if not config:
+        args = build_arg_parser().parse_args()
+        project = load_project_from_file(args.project_file)
+        if not project:
             sys.exit(1) # 設定読み込み失敗
 
+        if args.command == "cache":
+            sys.exit(run_cache_command(project, args.action, args.max_mb))
+        if args.command == "compile-ssml":
+            results = compile_ssml_directory(project, args.workers)
+            sys.exit(0 if results and all(results.values()) else 1)
+
+        client_pool = None
         try:
-            api_settings = config["api_settings"]
-            default_index = api_settings.get("default_api_key_index", 1) - 1
-            key_manager = ApiKeyManager(api_settings["api_keys"], default_index)
-            
+            if args.mock_backend is not None:
+                # APIクライアントを作る前に差し替える
+                install_mock_backend(MockBackendConfig.from_file(args.mock_backend))
+
+            default_index = (project.api_index or 1) - 1
+            key_manager = ApiKeyManager(
+                project.api_keys,
+                default_index,
+                rate_limits=project.rate_limits,
+                # 制限が未設定のモデルには、従来の wait_seconds 相当のRPMを適用する
+                default_rate_limit=RateLimit.from_wait_seconds(project.wait_time)
+            )
+            # キーとモデルごとのクライアントを、処理の準備をしている間に作っておく
+            client_pool = GeminiApiClientPool(key_manager, project.retry_policy)
+            # (生成プロファイルでモデルを指定している場合は、そのモデルのクライアントも作る)
+            profile_models = [profile.model for profile in project.generation_profiles.values() if profile.model]
+            client_pool.prewarm([project.text_model, project.speech_model, *profile_models])
+
             # 処理の実行をオーケストレーターに委譲
-            run_project_processing(config, key_manager)
-            
+            if args.command == "run-all":
+                run_project_pipeline(project, key_manager, args.queue_size, args.regenerate, client_pool=client_pool)
+            elif args.command == "build-stale":
+                run_stale_build(project, key_manager, args.regenerate, client_pool=client_pool)
+            else:
+                run_project_processing(project, key_manager, client_pool=client_pool)
+
         except Exception as e:
             print(f"エラー: 処理の準備中に問題が発生しました。 {e}")
             sys.exit(1)
+        finally:
+            # 使い回していたクライアントの接続を閉じてから、非同期のAPI呼び出しに使ったイベントループを止める
+            if client_pool is not None:
+                client_pool.close()
+            shutdown_async_runner()
 
     else:
         # --- GUI モード ---
@@ -37,4 +119,4 @@ def main():
         run_gui()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,201 @@
+# AiRadioDramaCreator/utils/dialog_parser.py
+
+import hashlib
+import json
+import os
+import re
+import uuid
+from array import array
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple
+)
+
+from core.models import Character, Script
+
+# 解析結果は、元のファイルと同じフォルダに ".<ファイル名>.parsed.json" として保存する
+PARSED_SUFFIX = ".parsed.json"
+PARSED_DIALOG_VERSION = 2
+
+# 保存する発話1つ分の整数の数 (話者の番号, 行番号, 台詞の開始位置, 台詞の終了位置)
+FIELDS_PER_UTTERANCE = 4
+
+# "話者: 台詞" の1行。台本の解析はすべてこのパターンで行う
+DIALOG_LINE_PATTERN = re.compile(r'^\s*([^:]+):\s*(.*)$')
+
+@dataclass
+class ParsedDialog:
+    """
+    "話者: 台詞" 形式のテキストを1度だけ解析した結果。
+    speakers は登場順の話者名 (重複なし)、utterances は発話 (Script) のリスト、
+    invalid_lines は "話者: 台詞" 形式に一致しなかった空行以外の行の行番号 (0始まり)。
+    """
+    speakers: List[str] = field(default_factory=list)
+    utterances: List[Script] = field(default_factory=list)
+    invalid_lines: List[int] = field(default_factory=list)
+    source: str = field(default="", repr=False)
+
+    def line_text(self, line_number: int) -> str:
+        """元のテキストの line_number 行目を返す (警告の表示用)。"""
+        lines = self.source.split("\n")
+        return lines[line_number].strip() if 0 <= line_number < len(lines) else ""
+
+    def ordered_characters(self, all_characters: List[Character], by_voice: bool = False) -> List[Character]:
+        """
+        登場するキャラクターを登場順に返す。
+        by_voice を指定した場合は、話者をボイス名として照合する (SSMLの解析結果用)。
+        """
+        if by_voice:
+            lookup = {char.voice.api_name: char for char in all_characters}
+        else:
+            lookup = {char.name: char for char in all_characters}
+
+        found_characters: List[Character] = []
+        seen_names = set()
+        for speaker in self.speakers:
+            character = lookup.get(speaker)
+            if character is None:
+                if by_voice:
+                    print(f"警告: SSML内のボイス名 '{speaker}' に対応するキャラクターが見つかりません。")
+                continue
+            if character.name not in seen_names:
+                seen_names.add(character.name)
+                found_characters.append(character)
+
+        print(f"テキストから検出されたキャラクター（登場順）: {[char.name for char in found_characters]}")
+        return found_characters
+
+    def utterance_index(self) -> array:
+        """発話を保存用の整数の並び (発話ごとに FIELDS_PER_UTTERANCE 個) にする。台詞の文字列は持たない。"""
+        index = array("q")
+        for utterance in self.utterances:
+            index.extend((utterance.speaker_index, utterance.line_number, utterance.span[0], utterance.span[1]))
+        return index
+
+    @classmethod
+    def from_index(cls, speakers: List[str], index: Sequence[int], invalid_lines: List[int], source: str) -> "ParsedDialog":
+        """utterance_index の結果と元のテキストから復元する。台詞は元のテキストから切り出す。"""
+        speakers = list(speakers)
+        utterances = []
+        for i in range(0, len(index), FIELDS_PER_UTTERANCE):
+            speaker_index, line_number, start, end = index[i:i + FIELDS_PER_UTTERANCE]
+            utterances.append(Script(
+                order=len(utterances),
+                voice=speakers[speaker_index],
+                text=source[start:end],
+                speaker_index=speaker_index,
+                line_number=line_number,
+                span=(start, end)
+            ))
+        return cls(speakers, utterances, list(invalid_lines), source)
+
+def parse_dialog_line(line: str) -> Optional[Tuple[str, int, int]]:
+    """
+    1行を解析し、(話者名, 台詞の開始位置, 台詞の終了位置) を返す。位置は行内の文字位置。
+    "話者: 台詞" 形式でない行は None を返す。
+    """
+    match = DIALOG_LINE_PATTERN.match(line)
+    speaker = match.group(1).strip() if match else ""
+    if not speaker:
+        return None
+    start = match.start(2)
+    return speaker, start, start + len(match.group(2).rstrip())
+
+def parse_dialog(text: str) -> ParsedDialog:
+    """"話者: 台詞" 形式のテキストを1行ずつ解析し、発話のリストにする。"""
+    speaker_indexes: Dict[str, int] = {}
+    parsed = ParsedDialog(source=text)
+    offset = 0
+
+    for line_number, line in enumerate(text.split("\n")):
+        result = parse_dialog_line(line)
+        if result is not None:
+            speaker, start, end = result
+            speaker_index = speaker_indexes.setdefault(speaker, len(parsed.speakers))
+            if speaker_index == len(parsed.speakers):
+                parsed.speakers.append(speaker)
+            parsed.utterances.append(Script(
+                order=len(parsed.utterances),
+                voice=parsed.speakers[speaker_index],
+                text=line[start:end],
+                speaker_index=speaker_index,
+                line_number=line_number,
+                span=(offset + start, offset + end)
+            ))
+        elif line.strip():
+            parsed.invalid_lines.append(line_number)
+        offset += len(line) + 1
+
+    return parsed
+
+def parsed_path_for(path: Path) -> Path:
+    """ファイルの解析結果を保存するパスを返す。"""
+    path = Path(path)
+    return path.with_name(f".{path.name}{PARSED_SUFFIX}")
+
+def text_digest(text: str) -> str:
+    """解析結果と元のファイルの照合に使う、テキストの内容ハッシュを返す。"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def load_parsed_dialog(path: Path, text: str) -> Optional[ParsedDialog]:
+    """
+    path の横に保存された解析結果を読み込む。
+    text (ファイルの内容) が保存時と変わっている場合や、解析結果が無い・壊れている場合は None を返す。
+    """
+    try:
+        with open(parsed_path_for(path), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != PARSED_DIALOG_VERSION or data.get("digest") != text_digest(text):
+            return None
+        return ParsedDialog.from_index(data["speakers"], data["utterances"], data["invalid_lines"], text)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError, IndexError, AttributeError) as e:
+        print(f"警告: 台本の解析結果を読み込めませんでした ({parsed_path_for(path).name}): {e}")
+        return None
+
+def save_parsed_dialog(path: Path, text: str, parsed: ParsedDialog):
+    """解析結果を path の横に保存する。保存に失敗しても処理は続ける (次回に解析し直すだけ)。"""
+    save_parsed_index(path, text_digest(text), parsed.speakers, parsed.utterance_index(), parsed.invalid_lines)
+
+def save_parsed_index(path: Path, digest: str, speakers: List[str], index: Sequence[int], invalid_lines: List[int]):
+    """
+    整数の並びにした解析結果を path の横に保存する。
+    ファイルを書き出しながら解析した場合 (SsmlWriter など) は、元のテキストの代わりに内容ハッシュを渡す。
+    発話の数が多くても、保存のために大きな中間データを作らないよう少しずつ書き出す。
+    """
+    parsed_path = parsed_path_for(path)
+    tmp_path = parsed_path.parent / f"{parsed_path.name}.{uuid.uuid4().hex}.tmp"
+    header = {"version": PARSED_DIALOG_VERSION, "digest": digest, "speakers": speakers, "invalid_lines": invalid_lines}
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header, ensure_ascii=False, separators=(",", ":"))[:-1])
+            f.write(',"utterances":[')
+            step = FIELDS_PER_UTTERANCE * 1024
+            for i in range(0, len(index), step):
+                f.write(("," if i else "") + ",".join(map(str, index[i:i + step])))
+            f.write("]}")
+        os.replace(tmp_path, parsed_path)
+    except OSError as e:
+        print(f"警告: 台本の解析結果を保存できませんでした ({parsed_path.name}): {e}")
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+
+def parse_dialog_file(path: Path, text: str) -> ParsedDialog:
+    """
+    ファイルの内容を解析する。横に保存された解析結果が内容と一致すればそれを使い、
+    無ければ解析して保存する。
+    """
+    parsed = load_parsed_dialog(path, text)
+    if parsed is None:
+        parsed = parse_dialog(text)
+        save_parsed_dialog(path, text, parsed)
+    return parsed
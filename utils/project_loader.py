@@ -5,7 +5,11 @@ from typing import Optional, Dict, List
 from core.models import (
     Project, 
     Character, 
-    Voice
+    Voice,
+    RateLimit,
+    RetryPolicy,
+    GenerationProfile,
+    default_generation_profiles
 )
 
 
@@ -58,6 +62,23 @@ def load_project_from_file(project_file: Path) -> Optional[Project]:
         api_settings = config.get("api_settings", {})
         file_paths = config.get("file_paths", {})
         proc_settings = config.get("processing_settings", {})
+        cache_settings = config.get("cache_settings", {})
+        interjection_settings = config.get("interjection_settings", {})
+        dialog_settings = config.get("dialog_settings", {})
+        generation_settings = config.get("generation_settings", {})
+
+        # 生成プロファイル ({"fast": {"thinking_budget": 0, ...}})。書かれていない項目は組み込みの値を使う
+        generation_profiles = default_generation_profiles()
+        for profile_name, profile_dict in generation_settings.get("profiles", {}).items():
+            generation_profiles[profile_name] = GenerationProfile.from_dict(
+                profile_name, profile_dict, generation_profiles.get(profile_name)
+            )
+
+        # モデルごとのRPM/TPM制限 ({"モデル名": {"rpm": 10, "tpm": 100000}})
+        rate_limits = {
+            model_name: RateLimit.from_dict(limit_dict)
+            for model_name, limit_dict in proc_settings.get("rate_limits", {}).items()
+        }
         
         project = Project(
             project_name=project_settings.get("project_name", "無題のプロジェクト"),
@@ -73,7 +94,28 @@ def load_project_from_file(project_file: Path) -> Optional[Project]:
             # ★再構築したキャラクターリストをセット
             characters=characters_list,
             
-            wait_time=proc_settings.get("wait_seconds", 1.0)
+            wait_time=proc_settings.get("wait_seconds", 1.0),
+            max_workers=proc_settings.get("max_workers", 2),
+            segmented_audio=proc_settings.get("segmented_audio", False),
+            audio_format=proc_settings.get("audio_format", "mp3"),
+            pipeline_queue_size=proc_settings.get("pipeline_queue_size", 2),
+            rate_limits=rate_limits,
+            retry_policy=RetryPolicy.from_dict(proc_settings.get("retry", {})),
+            audio_cache_max_mb=cache_settings.get("audio_cache_max_mb", 2048),
+            response_cache_enabled=cache_settings.get("response_cache_enabled", True),
+            response_cache_max_mb=cache_settings.get("response_cache_max_mb", 256),
+            interjection_mode=interjection_settings.get("mode", "off"),
+            interjection_max_workers=interjection_settings.get("max_workers", 4),
+            interjection_memo_enabled=interjection_settings.get("memo_enabled", True),
+            interjection_memo_variants=interjection_settings.get("memo_variants", 3),
+            interjection_memo_max_mb=interjection_settings.get("memo_max_mb", 64),
+            dialog_chunk_chars=dialog_settings.get("chunk_chars", 0),
+            dialog_chunk_workers=dialog_settings.get("chunk_workers", 4),
+            dialog_slim_prompt=dialog_settings.get("slim_prompt", True),
+            dialog_profile_max_tokens=dialog_settings.get("profile_max_tokens", 0),
+            generation_profiles=generation_profiles,
+            stage_profiles=generation_settings.get("stages", {}),
+            profile_escalation=generation_settings.get("escalate", True)
         )
         
         print(f"デバッグ: プロジェクト '{project.project_name}' をファイルから読み込みました。")
@@ -132,6 +174,40 @@ def save_project_config(project_obj: Project, file_path: Path) -> bool:
         },
         "processing_settings": {
             "wait_seconds": project_obj.wait_time,
+            "max_workers": project_obj.max_workers,
+            "segmented_audio": project_obj.segmented_audio,
+            "audio_format": project_obj.audio_format,
+            "pipeline_queue_size": project_obj.pipeline_queue_size,
+            "rate_limits": {
+                model_name: limit.to_dict()
+                for model_name, limit in project_obj.rate_limits.items()
+            },
+            "retry": project_obj.retry_policy.to_dict(),
+        },
+        "cache_settings": {
+            "audio_cache_max_mb": project_obj.audio_cache_max_mb,
+            "response_cache_enabled": project_obj.response_cache_enabled,
+            "response_cache_max_mb": project_obj.response_cache_max_mb,
+        },
+        "interjection_settings": {
+            "mode": project_obj.interjection_mode,
+            "max_workers": project_obj.interjection_max_workers,
+            "memo_enabled": project_obj.interjection_memo_enabled,
+            "memo_variants": project_obj.interjection_memo_variants,
+            "memo_max_mb": project_obj.interjection_memo_max_mb,
+        },
+        "dialog_settings": {
+            "chunk_chars": project_obj.dialog_chunk_chars,
+            "chunk_workers": project_obj.dialog_chunk_workers,
+            "slim_prompt": project_obj.dialog_slim_prompt,
+            "profile_max_tokens": project_obj.dialog_profile_max_tokens,
+        },
+        "generation_settings": {
+            "profiles": {
+                name: profile.to_dict() for name, profile in project_obj.generation_profiles.items()
+            },
+            "stages": dict(project_obj.stage_profiles),
+            "escalate": project_obj.profile_escalation,
         }
     }
 
@@ -1,61 +1,218 @@
 # AiRadioDramaCreator/utils/ssml_utils.py
 
+import hashlib
+import os
 import re
-from typing import Dict
+import uuid
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union
+)
 
-# AiRadioDramaCreator/utils/ssml_utils.py
-
-import re
-from typing import List
 from core.models import Character
- 
+from utils.dialog_parser import (
+    ParsedDialog,
+    parse_dialog,
+    parse_dialog_line,
+    save_parsed_index
+)
+
+SSML_HEADER = "<speak>\n"
+SSML_FOOTER = "</speak>"
+
+# SSMLで特別な意味を持つ文字のエスケープ表。str.translate で1回の走査で置き換える
+_SSML_ESCAPE_TABLE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+
+def escape_ssml_text(text: str) -> str:
+    """台詞の中の & < > をSSMLの実体参照に置き換える。"""
+    return text.translate(_SSML_ESCAPE_TABLE)
+
+class SsmlWriter:
+    """
+    発話を1つずつ受け取り、SSMLの断片を順に write に渡すクラス。
+    SSML全体を文字列として組み立てずに済むため、ファイルへ直接書き出せば台本の長さによらずメモリ使用量はほぼ一定になる。
+    書き出しながら、内容ハッシュとSSMLの解析結果 (ボイス名の登場順と、発話ごとのSSML内の台詞の位置) も作る。
+    """
+    def __init__(self, write: Callable[[str], Any], characters: List[Character]):
+        """
+        Args:
+            write (Callable): SSMLの断片を受け取る関数 (ファイルの write やリストの append)。
+            characters (List[Character]): 話者名からボイス名を引くためのキャラクターのリスト。
+        """
+        self._write = write
+        self.character_map = {char.name: char for char in characters}
+        self.speakers: List[str] = []   # 登場順のボイス名
+        self.index = array("q")         # ParsedDialog.utterance_index と同じ形式
+        self.utterance_count = 0
+        self._voice_indexes: Dict[str, int] = {}
+        self._digest = hashlib.sha256()
+        self._offset = 0
+        self._emit(SSML_HEADER)
+
+    def _emit(self, chunk: str):
+        self._write(chunk)
+        self._digest.update(chunk.encode("utf-8"))
+        self._offset += len(chunk)
 
-# from core.character import Character # Characterクラスをインポート
+    @property
+    def digest(self) -> str:
+        """書き出した内容のハッシュ (dialog_parser.text_digest と同じ値)。"""
+        return self._digest.hexdigest()
 
-def convert_dialog_to_ssml(text: str, ordered_characters: List[Character]) -> str:
+    def add(self, speaker: str, text: str) -> bool:
+        """1発話分の <p><voice> を書き出す。話者に対応するキャラクターが無い場合は書き出さずに False を返す。"""
+        # 話者名からCharacterオブジェクトを取得
+        character = self.character_map.get(speaker)
+        if character is None:
+            # このケースは、上流で登場キャラクターを確認しているため
+            # 基本的には発生しないはずだが、念のため警告を残す
+            print(f"警告: 話者 '{speaker}' に対応するキャラクター情報が見つかりません。スキップします。")
+            return False
+
+        # Characterオブジェクトからボイス名を取得
+        voice_name = character.voice.api_name
+        speech_text = escape_ssml_text(text)
+        opening = f'\t<p><voice name="{voice_name}">'
+
+        voice_index = self._voice_indexes.setdefault(voice_name, len(self.speakers))
+        if voice_index == len(self.speakers):
+            self.speakers.append(voice_name)
+        # <speak> の次の行から、発話ごとに空行を挟んで1行ずつ並ぶ
+        start = self._offset + len(opening)
+        self.index.extend((voice_index, 1 + 2 * self.utterance_count, start, start + len(speech_text)))
+        self.utterance_count += 1
+
+        # <voice>タグを生成
+        self._emit(f'{opening}{speech_text}</voice><break time="0.1s"/></p>\n\n')
+        return True
+
+    def close(self):
+        """全体を閉じる</speak>タグを書き出す。"""
+        self._emit(SSML_FOOTER)
+
+def convert_dialog_to_ssml(text: Union[str, ParsedDialog], ordered_characters: List[Character]) -> str:
     """
-    "話者: 台詞" 形式のテキストを、<voice>タグを使ったSSMLに変換する。
+    "話者: 台詞" 形式のテキスト (または parse_dialog の解析結果) を、<voice>タグを使ったSSMLに変換する。
     引数として、テキストに登場する順に並んだCharacterオブジェクトのリストを受け取る。
     """
-    # 効率的な検索のため、キャラクター名をキーにした辞書を作成
-    # 値はCharacterオブジェクトそのもの
-    character_map = {char.name: char for char in ordered_characters}
-    
-    processed_lines = []
-    # "話者:" という行のパターン
-    pattern = re.compile(r'^\s*([^:]+):\s*(.*)$')
-
-    for line in text.strip().split('\n'):
-        line = line.strip()
-        if not line:
-            continue
-            
-        match = pattern.match(line)
-        if match:
-            speaker_name = match.group(1).strip()
-            speech_text = match.group(2).strip()
-            
-            # 話者名からCharacterオブジェクトを取得
-            character = character_map.get(speaker_name)
-            
-            if character:
-                # Characterオブジェクトからボイス名を取得
-                voice_name = character.voice.api_name
-                
-                # SSMLで特別な意味を持つ文字をエスケープ
-                # & -> &, < -> <, > -> >
-                speech_text = speech_text.replace("&", "&").replace("<", "<").replace(">", ">")
-                
-                # <voice>タグを生成
-                processed_lines.append(f'\t<p><voice name="{voice_name}">{speech_text}</voice><break time="0.1s"/></p>\n\n')
-            else:
-                # このケースは、上流の get_ordered_characters でフィルタリングされているため
-                # 基本的には発生しないはずだが、念のため警告を残す
-                print(f"警告: 話者 '{speaker_name}' に対応するキャラクター情報が見つかりません。スキップします。")
-        else:
-            # "話者:" 形式でない行は、そのままテキストとして扱うか、無視するかを選択
-            # ここでは無視する（警告を出力）
-            print(f"警告: 書式が不正な行をスキップしました: '{line}'")
-            
-    # 全体を<speak>タグで囲んで返す
-    return f"<speak>\n{''.join(processed_lines)}</speak>"
+    ssml, _ = build_ssml(text if isinstance(text, ParsedDialog) else parse_dialog(text.strip()), ordered_characters)
+    return ssml
+
+def build_ssml(parsed: ParsedDialog, ordered_characters: List[Character]) -> Tuple[str, ParsedDialog]:
+    """
+    台本の解析結果からSSMLを組み立て、(SSML, SSMLの解析結果) を返す。
+    音声生成ではSSMLの解析結果を使い、SSMLを解析し直さずに話者を特定する。
+    """
+    for line_number in parsed.invalid_lines:
+        # "話者:" 形式でない行は、そのままテキストとして扱うか、無視するかを選択
+        # ここでは無視する（警告を出力）
+        print(f"警告: 書式が不正な行をスキップしました: '{parsed.line_text(line_number)}'")
+
+    chunks: List[str] = []
+    writer = SsmlWriter(chunks.append, ordered_characters)
+    for utterance in parsed.utterances:
+        writer.add(utterance.voice, utterance.text)
+    writer.close()
+    ssml = "".join(chunks)
+    return ssml, ParsedDialog.from_index(writer.speakers, writer.index, [], ssml)
+
+def compile_ssml_file(dialog_path: Path, ssml_path: Path, characters: List[Character]) -> Optional[int]:
+    """
+    台本ファイルを1行ずつ読みながらSSMLに変換し、ssml_path へ直接書き出して、書き出した発話の数を返す。
+    台本全体もSSML全体もメモリに持たないため、書籍1冊分の台本でもメモリ使用量はほぼ一定で、時間は行数に比例する。
+    書き出したSSMLの解析結果はSSMLファイルの横に保存する。
+    既知のキャラクターの発話が1つも無い場合や、読み書きに失敗した場合は None を返す (SSMLファイルは作らない)。
+    プロセスプールからも呼べるよう、モジュールの最上位に置いている。
+    """
+    ssml_path = Path(ssml_path)
+    ssml_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = ssml_path.parent / f".{ssml_path.name}.{uuid.uuid4().hex}.tmp"
+
+    try:
+        with open(dialog_path, "r", encoding="utf-8-sig") as src, open(tmp_path, "w", encoding="utf-8") as dst:
+            writer = SsmlWriter(dst.write, characters)
+            for line in src:
+                line = line.rstrip("\r\n")
+                result = parse_dialog_line(line)
+                if result is not None:
+                    speaker, start, end = result
+                    writer.add(speaker, line[start:end])
+                elif line.strip():
+                    # "話者:" 形式でない行は無視する（警告を出力）
+                    print(f"警告: 書式が不正な行をスキップしました: '{line.strip()}'")
+            writer.close()
+
+        if writer.utterance_count == 0:
+            print(f"テキストから既知のキャラクターが見つかりませんでした ({Path(dialog_path).name})。")
+            tmp_path.unlink()
+            return None
+
+        os.replace(tmp_path, ssml_path)
+    except OSError as e:
+        print(f"エラー: SSMLへの変換に失敗しました ({Path(dialog_path).name}): {e}")
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+        return None
+
+    # 音声生成でSSMLを解析し直さずに話者を特定できるよう、SSMLの解析結果も横に保存する
+    save_parsed_index(ssml_path, writer.digest, writer.speakers, writer.index, [])
+    return writer.utterance_count
+
+
+@dataclass
+class SsmlSegment:
+    """convert_dialog_to_ssml が出力する <p><voice>...</voice>...</p> 1つ分 (1発話)。"""
+    index: int
+    voice_name: str
+    body: str # <p> から </p> まで
+
+    def to_ssml(self) -> str:
+        """この発話だけを音声生成に渡せるよう、<speak>タグで囲んだSSMLを返す。"""
+        return build_ssml_from_segments([self])
+
+# <p><voice name="...">台詞</voice>...</p> の1単位
+_SEGMENT_PATTERN = re.compile(r'<p>\s*<voice\s+name="([^"]+)">.*?</p>', re.DOTALL)
+
+def split_ssml_segments(ssml: str) -> List[SsmlSegment]:
+    """
+    SSMLを発話単位のセグメントに分割する。
+    <p><voice> 構造を持たない部分 (手で書き足したテキストなど) は対象外となる。
+    """
+    return [
+        SsmlSegment(index=i, voice_name=match.group(1).strip(), body=match.group(0).strip())
+        for i, match in enumerate(_SEGMENT_PATTERN.finditer(ssml))
+    ]
+
+def group_segments_by_speakers(segments: List[SsmlSegment], max_speakers: int = 2) -> List[List[SsmlSegment]]:
+    """
+    発話の並びを、登場するボイスが max_speakers 人以下の連続した区間に分ける。
+    区間は前から順に、次の発話で上限を超える直前までを1区間とする。
+    """
+    runs: List[List[SsmlSegment]] = []
+    current: List[SsmlSegment] = []
+    voices = set()
+
+    for segment in segments:
+        if segment.voice_name not in voices and len(voices) >= max_speakers:
+            runs.append(current)
+            current, voices = [], set()
+        current.append(segment)
+        voices.add(segment.voice_name)
+
+    if current:
+        runs.append(current)
+    return runs
+
+def build_ssml_from_segments(segments: List[SsmlSegment]) -> str:
+    """セグメントのリストを、convert_dialog_to_ssml と同じ形式のSSMLに戻す。"""
+    return "<speak>\n" + "".join(f"\t{segment.body}\n\n" for segment in segments) + "</speak>"
@@ -1,13 +1,30 @@
 import re, os, sys
-from typing import Dict, List
+import json
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Union
 
 # 循環参照を避けるため、型チェック時のみインポート
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from core.api_client import GeminiApiClient
 
+from core.api_client import estimate_tokens
+from core.async_runner import gather_limited, get_async_runner
 from core.generators import TextGenerator
-from core.models import WriteConfig, Character
+from core.models import (
+    Character,
+    CharacterNameIndex,
+    GenerationProfile,
+    Script,
+    default_generation_profiles,
+    PROFILE_QUALITY
+)
+from core.cache import InterjectionMemo, ResponseCache
+from utils.dialog_parser import ParsedDialog, parse_dialog
 
 import re
 from typing import List, Dict
@@ -17,6 +34,7 @@ def get_ordered_characters(text: str, all_characters: List[Character]) -> List[C
     テキストを解析し、登場するキャラクターを登場順に抽出し、
     Characterオブジェクトのリストとして返します。
     SSML形式 (<voice name="...">) と 台本形式 (話者名:) の両方に対応します。
+    台本形式のテキストを解析済みの場合は、ParsedDialog.ordered_characters を直接使ってください。
 
     Args:
         text (str): 解析対象のテキスト（台本やSSML）。
@@ -25,51 +43,36 @@ def get_ordered_characters(text: str, all_characters: List[Character]) -> List[C
     Returns:
         List[Character]: テキストに登場した順に並べられたCharacterオブジェクトのリスト。
     """
-    # 効率的な検索のために、名前とボイス名からCharacterオブジェクトを引ける辞書を作成
-    name_to_char_map = {char.name: char for char in all_characters}
+    # テキストがSSML形式かどうかを判定
+    is_ssml = text.strip().startswith("<speak>") and '<voice' in text
+
+    if not is_ssml:
+        # 台本形式の場合: "話者名:" 形式の行を解析した結果から取得する
+        return parse_dialog(text).ordered_characters(all_characters)
+
+    # 効率的な検索のために、ボイス名からCharacterオブジェクトを引ける辞書を作成
     voice_to_char_map = {char.voice.api_name: char for char in all_characters}
 
     found_characters: List[Character] = []
     seen_names = set()
 
-    # テキストがSSML形式かどうかを判定
-    is_ssml = text.strip().startswith("<speak>") and '<voice' in text
+    # SSML形式の場合: <voice> タグから 'name' 属性 (ボイス名) を抽出
+    ssml_pattern = re.compile(r'<voice\s+name="([^"]+)">')
+    matches = ssml_pattern.finditer(text)
 
-    if is_ssml:
-        # SSML形式の場合: <voice> タグから 'name' 属性 (ボイス名) を抽出
-        ssml_pattern = re.compile(r'<voice\s+name="([^"]+)">')
-        matches = ssml_pattern.finditer(text)
-        
-        for match in matches:
-            voice_name = match.group(1).strip()
-            
-            # ボイス名に対応するキャラクターを取得
-            character = voice_to_char_map.get(voice_name)
-            
-            if character:
-                # まだ登場していないキャラクターであればリストに追加
-                if character.name not in seen_names:
-                    seen_names.add(character.name)
-                    found_characters.append(character)
-            else:
-                print(f"警告: SSML内のボイス名 '{voice_name}' に対応するキャラクターが見つかりません。")
+    for match in matches:
+        voice_name = match.group(1).strip()
 
-    else:
-        # 台本形式の場合: "話者名:" 形式を抽出
-        script_pattern = re.compile(r'^\s*([^:]+):', re.MULTILINE)
-        matches = script_pattern.finditer(text)
-        
-        for match in matches:
-            speaker_name = match.group(1).strip()
-            
-            # 話者名に対応するキャラクターを取得
-            character = name_to_char_map.get(speaker_name)
-
-            if character:
-                # まだ登場していないキャラクターであればリストに追加
-                if character.name not in seen_names:
-                    seen_names.add(character.name)
-                    found_characters.append(character)
+        # ボイス名に対応するキャラクターを取得
+        character = voice_to_char_map.get(voice_name)
+
+        if character:
+            # まだ登場していないキャラクターであればリストに追加
+            if character.name not in seen_names:
+                seen_names.add(character.name)
+                found_characters.append(character)
+        else:
+            print(f"警告: SSML内のボイス名 '{voice_name}' に対応するキャラクターが見つかりません。")
 
     # ログ出力用にキャラクター名のリストを作成
     found_names = [char.name for char in found_characters]
@@ -77,75 +80,124 @@ def get_ordered_characters(text: str, all_characters: List[Character]) -> List[C
     
     return found_characters
 
-def split_markdown_to_files(in_file_path: str, output_folder_path: str, indent_num: int):
+class _SectionWriter:
+    """
+    Markdownの1セクション分の本文を、届いた行から順にファイルへ書き出す。
+    分割前の実装 (本文全体を .strip() してから保存) と同じ結果になるよう、
+    先頭の空白は捨て、末尾の空白は次に本文が来るまで保留しておく。
+    """
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._file = open(file_path, 'w', encoding='utf-8')
+        self._pending = ""
+        self._started = False
+
+    def write_line(self, line: str):
+        if not self._started:
+            line = line.lstrip()
+            if not line:
+                return
+            self._started = True
+        body = line.rstrip()
+        if not body:
+            self._pending += line
+            return
+        self._file.write(self._pending + body)
+        self._pending = line[len(body):]
+
+    def close(self):
+        self._file.close()
+
+def _section_file_name(title_line: str, heading_marker: str, file_counter: int, file_prefix: str) -> str:
+    title = title_line.replace(heading_marker, '').strip()
+    sanitized_title = re.sub(r'[\s\\/:\*\?"<>\|・]', '_', title)
+    sanitized_title = (sanitized_title[:50] + '..') if len(sanitized_title) > 50 else sanitized_title
+    return f"{file_prefix}{file_counter:03d}_{sanitized_title}.txt"
+
+def _split_markdown_file(in_file_path: str, output_folder_path: str, indent_num: int, file_prefix: str = "") -> List[str]:
+    """1つのMarkdownファイルを1行ずつ読みながら分割し、生成したファイル名のリストを返す。"""
+    heading_marker = "#" * indent_num
+    heading_prefix = heading_marker + " "
+    created_files: List[str] = []
+    writer: Optional[_SectionWriter] = None
+    intro_lines = 0
+    seen_text = False
+
+    try:
+        with open(in_file_path, 'r', encoding='utf-8') as f:
+            print(f"入力ファイルを読み込みました: '{in_file_path}'")
+            for line in f:
+                # 指定レベルの見出しか、導入部の先頭の見出し (どのレベルでもよい) で新しいファイルを始める
+                starts_section = line.startswith(heading_prefix) and (seen_text or writer is not None)
+                if not seen_text and line.strip():
+                    seen_text = True
+                    starts_section = line.lstrip().startswith('#')
+                if starts_section:
+                    if writer is not None:
+                        writer.close()
+                    file_name = _section_file_name(line.strip(), heading_marker, len(created_files) + 1, file_prefix)
+                    writer = _SectionWriter(os.path.join(output_folder_path, file_name))
+                    created_files.append(file_name)
+                elif writer is not None:
+                    writer.write_line(line)
+                elif line.strip():
+                    intro_lines += 1
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if intro_lines:
+        print(f"導入部 ({intro_lines}行) が見つかりました（この部分はファイル分割されません）: '{in_file_path}'")
+    return created_files
+
+def split_markdown_to_files(
+        in_file_path: Union[str, Path],
+        output_folder_path: Union[str, Path],
+        indent_num: int,
+        max_workers: Optional[int] = None) -> List[str]:
     """
     Markdownファイルを指定された見出しレベルで分割し、個別のテキストファイルとして保存する。
+    ファイル全体を読み込まずに1行ずつ処理し、見出しに達するたびに新しいファイルへ書き出すため、
+    長編でもメモリ使用量は一定になる。
+    in_file_path にフォルダを指定した場合は、その中の *.md を最大 max_workers 件ずつ並行に分割する
+    (ファイル名が重複しないよう、各ファイル名の先頭に元のMarkdownのファイル名を付ける)。
 
     Args:
-        in_file_path (str): 分割対象のMarkdownファイルのパス。
-        output_folder_path (str): 生成したファイルを保存するフォルダのパス。
+        in_file_path (str | Path): 分割対象のMarkdownファイル、またはMarkdownファイルを含むフォルダのパス。
+        output_folder_path (str | Path): 生成したファイルを保存するフォルダのパス。
         indent_num (int): 分割の基準となる見出しのレベル（`#`の数）。
+        max_workers (int): フォルダを指定した場合に並行して処理するファイル数。省略時はスレッドプールの既定値。
+
+    Returns:
+        List[str]: 生成したファイル名のリスト。
+
+    Raises:
+        FileNotFoundError: 入力ファイル (フォルダ) が見つからない場合。
+        ValueError: indent_num が1未満の場合。
+        OSError: ファイルの読み書きに失敗した場合。
     """
     # --- 引数のバリデーション ---
     if not os.path.exists(in_file_path):
-        print(f"エラー: 入力ファイルが見つかりません: '{in_file_path}'")
-        sys.exit(1) # エラーでプログラムを終了
+        raise FileNotFoundError(f"入力ファイルが見つかりません: '{in_file_path}'")
     if indent_num < 1:
-        print(f"エラー: indent_numは1以上の整数で指定してください。")
-        sys.exit(1)
+        raise ValueError("indent_numは1以上の整数で指定してください。")
 
-    # --- 1. 入力ファイルの読み込み ---
-    try:
-        with open(in_file_path, 'r', encoding='utf-8') as f:
-            markdown_text = f.read()
-        print(f"入力ファイルを読み込みました: '{in_file_path}'")
-    except Exception as e:
-        print(f"エラー: ファイルの読み込み中に問題が発生しました。 {e}")
-        sys.exit(1)
-
-    # --- 2. 保存先フォルダの準備 ---
     os.makedirs(output_folder_path, exist_ok=True)
     print(f"保存先フォルダ: '{output_folder_path}'")
 
-    # --- 3. 動的に分割パターンを生成 ---
-    split_pattern = f'\n(?={"#" * indent_num} )'
-    heading_marker_to_remove = "#" * indent_num
-    sections = re.split(split_pattern, markdown_text)
-    
-    # 最初の要素が見出しで始まらない場合（導入部など）の調整
-    if sections and not sections[0].strip().startswith('#'):
-        intro_text = sections.pop(0).strip()
-        if intro_text:
-            print(f"\n--- 導入部が見つかりました（この部分はファイル分割されません）---\n{intro_text}\n---------------------------------------------------------")
-
-    file_counter = 1
-    created_files = []
-
-    # --- 4. 分割されたセクションごとにファイルを生成 ---
-    for section in sections:
-        section = section.strip()
-        if not section:
-            continue
-
-        lines = section.split('\n')
-        title_line = lines[0].replace(heading_marker_to_remove, '').strip()
-        content = '\n'.join(lines[1:]).strip()
-
-        sanitized_title = re.sub(r'[\s\\/:\*\?"<>\|・]', '_', title_line)
-        sanitized_title = (sanitized_title[:50] + '..') if len(sanitized_title) > 50 else sanitized_title
-
-        file_name = f"{file_counter:03d}_{sanitized_title}.txt"
-        file_path = os.path.join(output_folder_path, file_name)
+    if os.path.isdir(in_file_path):
+        markdown_files = sorted(Path(in_file_path).glob("*.md"))
+        print(f"{len(markdown_files)}個のMarkdownファイルを並行に分割します: '{in_file_path}'")
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="markdown-split") as executor:
+            results = executor.map(
+                lambda path: _split_markdown_file(str(path), str(output_folder_path), indent_num, f"{path.stem}_"),
+                markdown_files
+            )
+            created_files = [name for names in results for name in names]
+    else:
+        created_files = _split_markdown_file(str(in_file_path), str(output_folder_path), indent_num)
 
-        try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            created_files.append(file_name)
-            file_counter += 1
-        except IOError as e:
-            print(f"エラー: ファイル '{file_name}' の書き込みに失敗しました。 {e}")
-
-    # --- 5. 処理結果の表示 ---
+    # --- 処理結果の表示 ---
     print("\n処理が完了しました。")
     if not created_files:
         print("指定された見出しレベルに一致するセクションが見つからなかったため、ファイルは生成されませんでした。")
@@ -153,20 +205,241 @@ def split_markdown_to_files(in_file_path: str, output_folder_path: str, indent_n
         print(f"{len(created_files)}個のファイルが生成されました:")
         for name in sorted(created_files):
             print(f"- {name}")
+    return created_files
+
+# 長いシナリオを分割して台本を生成する場合の既定値
+DEFAULT_DIALOG_CHUNK_WORKERS = 4
+# 各チャンクに添える「前の場面の終わり」の最大文字数
+CONTINUITY_CONTEXT_CHARS = 300
+
+# 場面の区切りとみなす行: Markdownの見出し、記号だけの区切り線 (---, ＊＊＊, ◇◇◇ など)、【場面名】だけの行
+_SCENE_BREAK_PATTERN = re.compile(r'^\s*(#{1,6}\s|[-*=_＊◇◆□■☆★〜~]{3,}\s*$|【[^】]*】\s*$)')
+
+def split_scenario_into_scenes(script_text: str) -> List[str]:
+    """
+    シナリオを場面ごとに分ける。区切りの行 (見出し・区切り線・【場面名】) はその後ろの場面に含める。
+    区切りが1つも無い場合は、空行で区切られた段落を場面として扱う。
+    """
+    scenes: List[List[str]] = [[]]
+    for line in script_text.strip().split('\n'):
+        if _SCENE_BREAK_PATTERN.match(line) and any(l.strip() for l in scenes[-1]):
+            scenes.append([])
+        scenes[-1].append(line)
+
+    if len(scenes) == 1:
+        scenes = [paragraph.split('\n') for paragraph in re.split(r'\n\s*\n', script_text.strip())]
+    return [text for text in ('\n'.join(scene).strip() for scene in scenes) if text]
 
-def create_dialog(script_text: str, speakers_dict: Dict[str, str], text_model_client: 'GeminiApiClient') -> str:
+def chunk_scenario(script_text: str, max_chars: int) -> List[str]:
+    """
+    シナリオを場面の境目で、それぞれ max_chars 文字以下のチャンクにまとめる。
+    1つの場面だけで max_chars を超える場合は、その場面を1チャンクとする (場面の途中では分けない)。
+    """
+    chunks: List[str] = []
+    current = ""
+    for scene in split_scenario_into_scenes(script_text):
+        if current and len(current) + len(scene) + 2 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{scene}" if current else scene
+    if current:
+        chunks.append(current)
+    return chunks
+
+def continuity_context(previous_chunk: str, max_chars: int = CONTINUITY_CONTEXT_CHARS) -> str:
+    """
+    前のチャンクの終わりの部分を、次のチャンクに添える「これまでの流れ」として返す。
+    前のチャンクの台本の完成を待たずに全チャンクを並行に生成できるよう、生成結果ではなくシナリオから作る。
+    """
+    text = previous_chunk.strip()
+    if len(text) <= max_chars:
+        return text
+    tail = text[-max_chars:]
+    # 文の途中から始まらないよう、最初の文末か改行の後ろから使う
+    boundary = max(tail.find('。'), tail.find('\n'))
+    if 0 <= boundary < len(tail) - 1:
+        tail = tail[boundary + 1:]
+    return "…" + tail.strip()
+
+def fit_character_prompt(profile: str, max_tokens: int) -> str:
+    """
+    キャラクター紹介を、推定トークン数が max_tokens 以下になるよう後ろの項目から切り詰める。
+    見出し (### 名前) は必ず残す。max_tokens が0以下の場合はそのまま返す。
+    """
+    if max_tokens <= 0 or estimate_tokens(profile) <= max_tokens:
+        return profile
+
+    lines = profile.strip().split('\n')
+    kept = [lines[0]]
+    used = estimate_tokens(lines[0])
+    for line in lines[1:]:
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            # 入りきらない項目は、残りの枠に収まる分だけ途中まで入れる
+            room = max_tokens - used - 2
+            if room >= 10:
+                kept.append(line[:room] + "…")
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept) + "\n\n"
+
+# 台本の検証で、「名前: セリフ」形式かつ登録済みの話者の行がこの割合に満たなければ不合格とする
+MIN_VALID_DIALOG_RATIO = 0.9
+
+def validate_dialog(dialog_text: Optional[str], characters: List[Character]) -> Optional[str]:
+    """
+    生成された台本が「名前: セリフ」形式になっているかを調べる。
+    問題が無ければ None を、あれば問題の説明を返す (より上の生成プロファイルで生成し直すかの判断に使う)。
+    """
+    if not dialog_text:
+        return "出力が空です"
+    parsed = parse_dialog(dialog_text)
+    if not parsed.utterances:
+        return "「名前: セリフ」形式の行がありません"
+    names = {char.name for char in characters}
+    unknown = sum(1 for utterance in parsed.utterances if utterance.voice not in names)
+    total = len(parsed.utterances) + len(parsed.invalid_lines)
+    bad = unknown + len(parsed.invalid_lines)
+    if total - bad < total * MIN_VALID_DIALOG_RATIO:
+        return f"{bad}/{total}行が「名前: セリフ」形式でないか、登録されていない話者です"
+    return None
+
+def generate_with_profiles(
+        get_generator: Callable[[GenerationProfile], TextGenerator],
+        profiles: List[GenerationProfile],
+        validate: Optional[Callable[[Optional[str]], Optional[str]]] = None,
+        label: str = "テキスト") -> Optional[str]:
+    """
+    profiles の先頭の生成プロファイルで生成し、validate が問題を返した場合は次のプロファイルで生成し直す。
+    最後のプロファイルでも検証を通らなかった場合は、その出力をそのまま返す。
+    利用枠の確保中に中断された場合は None を返す。
+    """
+    response = None
+    for position, profile in enumerate(profiles):
+        generator = get_generator(profile)
+        started = time.monotonic()
+        response = generator.generate()
+        _log_generation_time(f"{label} [{profile.name}]", generator, started)
+        if response is None:
+            return None
+        problem = validate(response) if validate else None
+        if problem is None:
+            return response
+        if position + 1 < len(profiles):
+            print(f"INFO: {label}: '{profile.name}' の出力が検証を通りませんでした ({problem})。'{profiles[position + 1].name}' で生成し直します。")
+        else:
+            print(f"警告: {label}: '{profile.name}' の出力が検証を通りませんでした ({problem})。")
+    return response
+
+async def generate_with_profiles_async(
+        get_generator: Callable[[GenerationProfile], TextGenerator],
+        profiles: List[GenerationProfile],
+        validate: Optional[Callable[[Optional[str]], Optional[str]]] = None,
+        label: str = "テキスト") -> Optional[str]:
+    """generate_with_profiles の非同期版 (TextGenerator.generate_async で生成する)。"""
+    response = None
+    for position, profile in enumerate(profiles):
+        generator = get_generator(profile)
+        started = time.monotonic()
+        response = await generator.generate_async()
+        _log_generation_time(f"{label} [{profile.name}]", generator, started)
+        if response is None:
+            return None
+        problem = validate(response) if validate else None
+        if problem is None:
+            return response
+        if position + 1 < len(profiles):
+            print(f"INFO: {label}: '{profile.name}' の出力が検証を通りませんでした ({problem})。'{profiles[position + 1].name}' で生成し直します。")
+        else:
+            print(f"警告: {label}: '{profile.name}' の出力が検証を通りませんでした ({problem})。")
+    return response
+
+def _default_profiles() -> List[GenerationProfile]:
+    """生成プロファイルが指定されなかった場合に使う、従来どおりの設定 (quality のみ)。"""
+    return [default_generation_profiles()[PROFILE_QUALITY]]
+
+def create_dialog(
+        script_text: str,
+        speakers_dict: Dict[str, str],
+        text_model_client: Optional['GeminiApiClient'] = None,
+        response_cache: Optional[ResponseCache] = None,
+        client_provider: Optional[Callable[[int, Optional[str]], Optional['GeminiApiClient']]] = None,
+        model_name: Optional[str] = None,
+        chunk_chars: int = 0,
+        chunk_workers: int = DEFAULT_DIALOG_CHUNK_WORKERS,
+        name_index: Optional[CharacterNameIndex] = None,
+        profile_max_tokens: int = 0,
+        profiles: Optional[List[GenerationProfile]] = None,
+        stop_event: Optional[threading.Event] = None) -> str:
     """
     LLMを使用して、シナリオのテキストから会話形式の台本を生成する。
+    response_cache を指定した場合、シナリオとキャラクターが前回と同じなら保存済みの台本を返す。
+    text_model_client の代わりに client_provider ((推定トークン数, モデル名) を受け取る関数) を渡すと、
+    キャッシュに無い場合だけ、生成プロファイルのモデル (未指定なら既定のモデル) の利用枠を確保する。
+    chunk_chars を指定し、シナリオがそれより長い場合は、場面の境目で chunk_chars 文字以下のチャンクに分け、
+    各チャンクの台本を最大 chunk_workers 件ずつ並行に生成して、元の順につなげる。
+    各チャンクには前のチャンクの終わりの部分を「これまでの流れ」として添える。
+    name_index を指定した場合は、シナリオに名前が出てくるキャラクターの紹介だけをプロンプトに入れる
+    (1人も見つからない場合は全員分を入れる)。profile_max_tokens を指定すると、1人分の紹介をその推定トークン数までに切り詰める。
+    profiles には試す順に生成プロファイルを渡す。出力が「名前: セリフ」形式になっていなければ次のプロファイルで生成し直す
+    (省略した場合は quality だけを使う)。stop_event がセットされると、APIのリトライの待機を打ち切る。
     """
-    def get_text_generator(script: str, characters: List[Character], client: 'GeminiApiClient') -> TextGenerator:
+    profiles = profiles or _default_profiles()
+
+    def get_text_generator(
+            script: str,
+            characters: List[Character],
+            client: Optional['GeminiApiClient'],
+            profile: GenerationProfile,
+            part: Optional[str] = None,
+            previous_context: Optional[str] = None) -> TextGenerator:
         """
         キャラクター情報とシナリオから、セリフ生成用のTextGeneratorを生成します。
         (リファクタリング後)
+        part と previous_context は、長いシナリオを分けて生成する場合にだけ指定する。
         """
+        # シナリオに登場するキャラクターだけに絞る (名前の索引で1回だけ走査する)
+        profile_characters = characters
+        if name_index is not None:
+            referenced = name_index.find(f"{script}\n{previous_context or ''}")
+            if referenced:
+                profile_characters = referenced
+
         # 各キャラクターオブジェクトにプロンプトの生成を依頼し、結果を結合する
-        character_profiles_list = [char.get_character_prompt() for char in characters]
+        character_profiles_list = [
+            fit_character_prompt(char.get_character_prompt(), profile_max_tokens) for char in profile_characters
+        ]
         character_profiles = "".join(character_profiles_list)
 
+        if name_index is not None or profile_max_tokens > 0:
+            full_tokens = sum(estimate_tokens(char.get_character_prompt()) for char in characters)
+            slim_tokens = estimate_tokens(character_profiles)
+            saved = full_tokens - slim_tokens
+            print(
+                f"INFO: キャラクター紹介を {len(profile_characters)}/{len(characters)}人分に絞りました "
+                f"(推定 {full_tokens} → {slim_tokens} トークン, {saved} トークン削減"
+                f"{f', {saved * 100 // full_tokens}%' if full_tokens else ''})。"
+            )
+
+        # 分けて生成する場合だけ、前後とのつながりについての指示を加える
+        # (分けない場合のプロンプトは従来のまま。応答キャッシュのキーも変わらない)
+        continuity_section = ""
+        if part is not None:
+            continuity_section = f"""
+            ### 分割生成について
+            このシナリオは長編の一部（{part}）です。この部分の台本だけを生成してください。
+            前後の部分の台本は別に生成され、そのままつなげられます。物語の冒頭のような挨拶や、締めくくりの言葉は入れないでください。
+            """
+            if previous_context:
+                continuity_section += f"""
+            ### これまでの流れ（直前の部分のシナリオの終わり。この部分の台本は生成しないでください）
+            {previous_context}
+            """
+            continuity_section += """
+            ---
+"""
+
         # --- AIへの指示プロンプトを作成 ---
         prompt = f"""
             あなたは、プロの脚本家です。渡されたシナリオと詳細な登場人物紹介に基づき、生き生きとした自然な会話台本を生成してください。
@@ -184,7 +457,7 @@ def create_dialog(script_text: str, speakers_dict: Dict[str, str], text_model_cl
             {character_profiles.strip()}
 
             ---
-
+{continuity_section}
             ### シナリオの要約
             {script}
 
@@ -196,113 +469,409 @@ def create_dialog(script_text: str, speakers_dict: Dict[str, str], text_model_cl
         # TextGeneratorインスタンスを生成して返す
         return TextGenerator(
             api_conn=client,
-            write_config=WriteConfig(),
+            write_config=profile.write_config(),
             prompt=prompt,
             parent=None,
-            basename=None
+            basename=None,
+            response_cache=response_cache,
+            client_provider=client_provider,
+            model_name=profile.model or model_name,
+            stop_event=stop_event
         )
 
     # 先に改行をスペースに置換したプレビュー用の文字列を作成する
     log_preview = script_text[:30].replace('\n', ' ')
     print(f"INFO: Generating dialog from script starting with '{log_preview}...'")
 
+    chunks = chunk_scenario(script_text, chunk_chars) if chunk_chars > 0 and len(script_text) > chunk_chars else []
+    if len(chunks) > 1:
+        return _create_dialog_in_chunks(chunks, speakers_dict, text_model_client, get_text_generator, chunk_workers, profiles)
+
     try:
         # TextGeneratorインスタンスを作成し、.generate()を呼び出してAPIにリクエスト
-        generator = get_text_generator(script_text, speakers_dict, text_model_client)
-        dialog_text = generator.generate()
-        return dialog_text
+        dialog_text = generate_with_profiles(
+            lambda profile: get_text_generator(script_text, speakers_dict, text_model_client, profile),
+            profiles,
+            validate=lambda text: validate_dialog(text, speakers_dict),
+            label="台本"
+        )
+        return dialog_text or "" # 利用枠の確保中に中断された場合も空文字列を返す
     except Exception as e:
         print(f"ERROR: An error occurred during dialog generation: {e}")
         return "" # エラーが発生した場合は空文字列を返す
 
-def add_ai_interjections(dialog_text: str, characters: List[Character], text_model_client: 'GeminiApiClient') -> str:
+def _log_generation_time(label: str, generator: TextGenerator, started: float):
+    """プロンプトの大きさと、応答が返るまでの時間 (利用枠の待ち時間を含む) をログに出す。"""
+    print(f"INFO: {label}: プロンプト 推定{estimate_tokens(generator.prompt)}トークン, {time.monotonic() - started:.1f}秒")
+
+def _create_dialog_in_chunks(
+        chunks: List[str],
+        characters: List[Character],
+        client: Optional['GeminiApiClient'],
+        get_text_generator: Callable[..., TextGenerator],
+        max_workers: int,
+        profiles: List[GenerationProfile]) -> str:
+    """チャンクごとの台本を並行に生成し、元の順につなげる。1つでも失敗した場合は空文字列を返す。"""
+    total = len(chunks)
+    print(f"INFO: シナリオを{total}個のチャンクに分け、最大{max_workers}件ずつ並行に台本を生成します。")
+
+    def generate_chunk(index: int) -> Optional[str]:
+        previous_context = continuity_context(chunks[index - 1]) if index > 0 else None
+        try:
+            dialog_text = generate_with_profiles(
+                lambda profile: get_text_generator(chunks[index], characters, client, profile, f"{index + 1}/{total}", previous_context),
+                profiles,
+                validate=lambda text: validate_dialog(text, characters),
+                label=f"チャンク {index + 1}/{total} の台本"
+            )
+        except Exception as e:
+            print(f"ERROR: チャンク {index + 1}/{total} の台本生成に失敗しました: {e}")
+            return None
+        if dialog_text:
+            print(f"INFO: チャンク {index + 1}/{total} の台本を生成しました。")
+        return dialog_text or None
+
+    # 結果は完了順ではなくチャンクの順に受け取る
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, total)), thread_name_prefix="dialog-chunk") as executor:
+        results = list(executor.map(generate_chunk, range(total)))
+
+    failed = [index + 1 for index, dialog_text in enumerate(results) if not dialog_text]
+    if failed:
+        # 一部が欠けた台本は話がつながらないため、全体を失敗とする (成功したチャンクは応答キャッシュに残る)
+        print(f"ERROR: {len(failed)}/{total}個のチャンクの台本を生成できませんでした: {failed}")
+        return ""
+    return "\n\n".join(dialog_text.strip() for dialog_text in results)
+
+# add_ai_interjections の生成方法
+INTERJECTION_MODE_OFF = "off"            # 相槌を挿入しない
+INTERJECTION_MODE_BATCH = "batch"        # すべての挿入位置をまとめて1回のリクエストで生成する
+INTERJECTION_MODE_PER_SPOT = "per_spot"  # 挿入位置ごとに1回ずつリクエストする
+INTERJECTION_MODES = (INTERJECTION_MODE_OFF, INTERJECTION_MODE_BATCH, INTERJECTION_MODE_PER_SPOT)
+
+# これより長い応答は相槌として不適切とみなす
+MAX_INTERJECTION_LENGTH = 40
+
+# 1箇所ずつ生成する場合に、同時に実行するリクエスト数の既定値
+DEFAULT_INTERJECTION_WORKERS = 4
+
+@dataclass
+class InterjectionSpot:
+    """相槌を挿入する位置。lines[line_index] の行の直前に、character の相槌を挿入する。"""
+    line_index: int
+    character: Character
+    previous_speech: str
+
+def find_interjection_spots(parsed: ParsedDialog, characters: List[Character]) -> List[InterjectionSpot]:
+    """同じ話者が連続して話している箇所を探し、相槌の挿入位置のリストを返す。"""
+    spots = []
+    previous: Optional[Script] = None
+    invalid_lines = iter(parsed.invalid_lines)
+    next_invalid_line = next(invalid_lines, None)
+
+    for utterance in parsed.utterances:
+        # 「話者: 台詞」形式に一致しない行（空行以外）をまたぐと、話者の連続は途切れる
+        while next_invalid_line is not None and next_invalid_line < utterance.line_number:
+            previous = None
+            next_invalid_line = next(invalid_lines, None)
+
+        # 前の話者と同じ話者が連続して話した場合
+        if previous is not None and utterance.speaker_index == previous.speaker_index:
+            # 相槌を打つ、別のキャラクターを探す
+            other_characters = [c for c in characters if c.name != utterance.voice]
+            if other_characters:
+                # ここでは単純に最初の「他のキャラクター」を選ぶ
+                # (より高度なロジックも可能: 例 ランダムに選ぶ、直前に話していない人を選ぶなど)
+                spots.append(InterjectionSpot(utterance.line_number, other_characters[0], previous.text))
+
+        previous = utterance
+
+    return spots
+
+def clean_interjection(response: Optional[str]) -> Optional[str]:
+    """AIの応答から引用符を取り除き、相槌として使える場合はその文字列を返す。使えない場合は None。"""
+    if not isinstance(response, str):
+        return None
+    interjection = response.strip().replace('"', '').replace('「', '').replace('」', '')
+    if 0 < len(interjection) <= MAX_INTERJECTION_LENGTH: # 長すぎる応答は無視
+        return interjection
+    return None
+
+@dataclass(frozen=True)
+class _InterjectionClients:
     """
-    同じ話者が連続する場合、他のキャラクターによる短い相槌をAIに生成させて挿入する。
-    Characterオブジェクトのリストを扱うように修正されています。
+    相槌の生成に使うクライアント。provider / async_provider を指定した場合は、
+    ファイル単位ではなく相槌のリクエストごとに利用枠を確保する (並行に生成するリクエストがそれぞれ別のキーを使える)。
     """
-    
-    # --- ヘルパー関数: キャラクターの個性を反映した相槌生成器 ---
-    def get_interjection_generator(previous_speech: str, character: Character) -> TextGenerator:
-        """指定されたキャラクターになりきって、相槌を生成するためのTextGeneratorを返す。"""
-        
-        # 相槌を打つキャラクターのプロフィールをプロンプト用に生成
-        character_name = character.name
-        character_profile = character.get_character_prompt()
-
-        # AIへの指示プロンプト
-        prompt = f"""
-            あなたは「{character_name}」という人物です。
-            以下の「あなたの設定」を忠実に守り、会話の聞き手として応答してください。
-
-            ### あなたの設定
-            {character_profile.strip()}
-            
-            ### 指示
-            以下の「相手のセリフ」に対して、あなたの性格や話し方を反映した、自然で短い相槌を一つだけ生成してください。
+    client: Optional['GeminiApiClient'] = None
+    provider: Optional[Callable[[int, Optional[str]], Optional['GeminiApiClient']]] = None
+    async_provider: Optional[Callable[[int, Optional[str]], Awaitable[Optional['GeminiApiClient']]]] = None
+    stop_event: Optional[threading.Event] = None
 
-            ### ルール
-            - 相槌は20文字以内にしてください。
-            - 肯定、同意、感心、簡単な質問のいずれかの内容にしてください。
-            - 相槌のセリフそのものだけを出力し、あなたの名前や他の記号（引用符など）は絶対に含めないでください。
+    def is_stopped(self) -> bool:
+        return self.stop_event is not None and self.stop_event.is_set()
 
-            ### 相手のセリフ
-            「{previous_speech}」
-
-            ### あなたの相槌
-            """
-            
+    def text_generator(self, prompt: str, profile: GenerationProfile, **write_params) -> TextGenerator:
         return TextGenerator(
-            api_conn=text_model_client,
-            write_config=WriteConfig(),
+            api_conn=self.client,
+            write_config=profile.write_config(**write_params),
             prompt=prompt,
             parent=None,
-            basename=None
+            basename=None,
+            client_provider=self.provider,
+            async_client_provider=self.async_provider,
+            model_name=profile.model,
+            stop_event=self.stop_event
         )
 
-    # --- メインロジック ---
-    lines = dialog_text.strip().split('\n')
-    new_lines = []
-    previous_speaker_name = None
-    previous_speech = ""
-    pattern = re.compile(r'^\s*([^:]+):\s*(.*)$')
-
-    for line in lines:
-        match = pattern.match(line)
-        if match:
-            current_speaker_name = match.group(1).strip()
-            current_speech = match.group(2).strip()
-            
-            # 前の話者と同じ話者が連続して話した場合
-            if previous_speaker_name and current_speaker_name == previous_speaker_name:
-                
-                # 相槌を打つ、別のキャラクターを探す
-                other_characters = [c for c in characters if c.name != current_speaker_name]
-                if other_characters:
-                    # ここでは単純に最初の「他のキャラクター」を選ぶ
-                    # (より高度なロジックも可能: 例 ランダムに選ぶ、直前に話していない人を選ぶなど)
-                    interjecting_character = other_characters[0]
-                    
-                    print(f"  - {interjecting_character.name}が相槌を生成中... (前のセリフ: '{previous_speech[:20]}...')")
-                    
-                    # 強化されたジェネレーターを呼び出す
-                    response = get_interjection_generator(previous_speech, interjecting_character).generate()
-                    
-                    generated_interjection = response.strip().replace('"', '').replace('「', '').replace('」', '')
-                    
-                    if 0 < len(generated_interjection) <= 40: # 長すぎる応答は無視
-                            new_lines.append(f"{interjecting_character.name}: {generated_interjection}\n")
-                    else:
-                        print(f"  - AIの応答が不適切でした: '{generated_interjection}'")
-
-            new_lines.append(line)
-            previous_speaker_name = current_speaker_name
-            previous_speech = current_speech
-        else:
-            # 「話者: 台詞」形式に一致しない行（空行など）もそのまま保持
-            new_lines.append(line)
-            if line.strip(): 
-                previous_speaker_name = None
-                previous_speech = ""
+def _get_interjection_generator(
+        previous_speech: str,
+        character: Character,
+        clients: _InterjectionClients,
+        profile: Optional[GenerationProfile] = None) -> TextGenerator:
+    """指定されたキャラクターになりきって、相槌を生成するためのTextGeneratorを返す。"""
+
+    # 相槌を打つキャラクターのプロフィールをプロンプト用に生成
+    character_name = character.name
+    character_profile = character.get_character_prompt()
+
+    # AIへの指示プロンプト
+    prompt = f"""
+        あなたは「{character_name}」という人物です。
+        以下の「あなたの設定」を忠実に守り、会話の聞き手として応答してください。
+
+        ### あなたの設定
+        {character_profile.strip()}
+        
+        ### 指示
+        以下の「相手のセリフ」に対して、あなたの性格や話し方を反映した、自然で短い相槌を一つだけ生成してください。
+
+        ### ルール
+        - 相槌は20文字以内にしてください。
+        - 肯定、同意、感心、簡単な質問のいずれかの内容にしてください。
+        - 相槌のセリフそのものだけを出力し、あなたの名前や他の記号（引用符など）は絶対に含めないでください。
+
+        ### 相手のセリフ
+        「{previous_speech}」
+
+        ### あなたの相槌
+        """
+        
+    return clients.text_generator(prompt, profile or _default_profiles()[0])
+
+def _get_batch_interjection_generator(
+        spots: List[InterjectionSpot],
+        clients: _InterjectionClients,
+        profile: Optional[GenerationProfile] = None) -> TextGenerator:
+    """すべての挿入位置の相槌を、JSONの入出力で一度に生成するためのTextGeneratorを返す。"""
+
+    # 相槌を打つキャラクターのプロフィールは、重複させずに一度だけ渡す
+    interjecting_characters = {spot.character.name: spot.character for spot in spots}
+    character_profiles = "".join(char.get_character_prompt() for char in interjecting_characters.values())
+
+    requests = [
+        {"id": spot_id, "character": spot.character.name, "previous_line": spot.previous_speech}
+        for spot_id, spot in enumerate(spots)
+    ]
+
+    prompt = f"""
+        あなたは、プロの脚本家です。
+        以下の「相槌リスト」の各項目について、character の人物になりきり、previous_line（相手のセリフ）に対する自然で短い相槌を一つずつ生成してください。
+
+        ### 登場人物の設定
+        {character_profiles.strip()}
 
-    return "\n".join(new_lines)
+        ### ルール
+        - 相槌は20文字以内にしてください。
+        - 肯定、同意、感心、簡単な質問のいずれかの内容にし、その人物の性格や話し方を反映してください。
+        - interjection には相槌のセリフそのものだけを入れ、名前や他の記号（引用符など）は絶対に含めないでください。
+        - 相槌リストのすべての id について、1件ずつ出力してください。
+        - 出力は次の形式のJSON配列だけにしてください: [{{"id": 0, "interjection": "なるほど"}}]
+
+        ### 相槌リスト
+        {json.dumps(requests, ensure_ascii=False, indent=2)}
+
+        ### 出力
+        """
+
+    return clients.text_generator(prompt, profile or _default_profiles()[0], response_mime_type="application/json")
+
+def _parse_batch_interjections(response: str, spot_count: int) -> Dict[int, str]:
+    """
+    一括生成の応答 (JSON配列) から {挿入位置の番号: 相槌} を取り出す。
+    形式が崩れている項目や、相槌として使えない項目は含めない。
+    """
+    text = (response or "").strip()
+    # ```json ... ``` で囲まれていても読めるように、配列の部分だけを取り出す
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end <= start:
+        return {}
+    try:
+        entries = json.loads(text[start:end + 1])
+    except ValueError:
+        return {}
+
+    interjections = {}
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        spot_id = entry.get("id")
+        if isinstance(spot_id, bool) or not isinstance(spot_id, int) or not 0 <= spot_id < spot_count:
+            continue
+        interjection = clean_interjection(entry.get("interjection"))
+        if interjection is not None:
+            interjections[spot_id] = interjection
+    return interjections
+
+def _is_valid_interjection(response: Optional[str]) -> Optional[str]:
+    """generate_with_profiles に渡す検証。相槌として使えない応答なら問題の説明を返す。"""
+    return None if clean_interjection(response) is not None else "相槌として使えない応答です"
+
+async def _generate_interjection_async(
+        spot: InterjectionSpot,
+        clients: _InterjectionClients,
+        profiles: Optional[List[GenerationProfile]] = None) -> Optional[str]:
+    """
+    1箇所分の相槌を生成する。使える応答が得られなかった場合は None。
+    相槌として使えない応答だった場合は、profiles の次の生成プロファイルで生成し直す。
+    """
+    print(f"  - {spot.character.name}が相槌を生成中... (前のセリフ: '{spot.previous_speech[:20]}...')")
+    response = await generate_with_profiles_async(
+        lambda profile: _get_interjection_generator(spot.previous_speech, spot.character, clients, profile),
+        profiles or _default_profiles(),
+        validate=_is_valid_interjection,
+        label="相槌"
+    )
+    interjection = clean_interjection(response)
+    if interjection is None:
+        print(f"  - AIの応答が不適切でした: '{response}'")
+    return interjection
+
+def _generate_interjections_concurrently(
+        spots: List[InterjectionSpot],
+        spot_ids: List[int],
+        clients: _InterjectionClients,
+        max_workers: int,
+        profiles: Optional[List[GenerationProfile]] = None) -> Dict[int, str]:
+    """
+    spot_ids の各挿入位置の相槌を、最大 max_workers 件ずつ並行に生成し、{挿入位置の番号: 相槌} を返す。
+    生成は共有の AsyncRunner のイベントループ上で行うため、同時に待つリクエストが多くてもスレッドは増えない。
+    生成に失敗した箇所は含めない (相槌を挿入しないだけで、台本全体の処理は続ける)。
+    clients.stop_event がセットされると、実行中の生成をキャンセルして空の結果を返す。
+    """
+    async def generate_one(spot_id: int) -> Optional[str]:
+        try:
+            return await _generate_interjection_async(spots[spot_id], clients, profiles)
+        except Exception as e:
+            print(f"  - 相槌の生成に失敗しました (前のセリフ: '{spots[spot_id].previous_speech[:20]}...'): {e}")
+            return None
+
+    if not spot_ids or clients.is_stopped():
+        return {}
+    # gather_limited は入力の順序で結果を返すため、どの箇所が先に終わっても元の順序に戻せる
+    try:
+        results = get_async_runner().run(gather_limited(generate_one, spot_ids, max_workers), clients.stop_event)
+    except CancelledError:
+        print("  - 中断の要求を受けたため、相槌の生成をキャンセルしました。")
+        return {}
+    return {
+        spot_id: interjection
+        for spot_id, interjection in zip(spot_ids, results)
+        if interjection is not None
+    }
+
+def _generate_interjections_in_batch(
+        spots: List[InterjectionSpot],
+        clients: _InterjectionClients,
+        max_workers: int = DEFAULT_INTERJECTION_WORKERS,
+        profiles: Optional[List[GenerationProfile]] = None) -> Dict[int, str]:
+    """
+    すべての挿入位置の相槌を1回のリクエストで生成する。検証に通らなかった箇所だけ、1箇所ずつ生成し直す。
+    一括生成には profiles の先頭の生成プロファイルを使い、生成し直す箇所では次のプロファイルへ上げていく。
+    """
+    profiles = profiles or _default_profiles()
+    print(f"  - {len(spots)}箇所の相槌を一括で生成中... [{profiles[0].name}]")
+    try:
+        response = _get_batch_interjection_generator(spots, clients, profiles[0]).generate()
+        interjections = _parse_batch_interjections(response, len(spots))
+    except Exception as e:
+        print(f"  - 相槌の一括生成に失敗しました: {e}")
+        interjections = {}
+
+    failed = [spot_id for spot_id in range(len(spots)) if spot_id not in interjections]
+    if failed and not clients.is_stopped():
+        print(f"  - {len(failed)}/{len(spots)}箇所の応答が不適切だったため、個別に生成し直します。")
+        interjections.update(_generate_interjections_concurrently(spots, failed, clients, max_workers, profiles))
+    return interjections
+
+def add_ai_interjections(
+        dialog_text: str,
+        characters: List[Character],
+        text_model_client: Optional['GeminiApiClient'] = None,
+        mode: str = INTERJECTION_MODE_PER_SPOT,
+        max_workers: int = DEFAULT_INTERJECTION_WORKERS,
+        memo: Optional[InterjectionMemo] = None,
+        parsed: Optional[ParsedDialog] = None,
+        profiles: Optional[List[GenerationProfile]] = None,
+        client_provider: Optional[Callable[[int, Optional[str]], Optional['GeminiApiClient']]] = None,
+        async_client_provider: Optional[Callable[[int, Optional[str]], Awaitable[Optional['GeminiApiClient']]]] = None,
+        stop_event: Optional[threading.Event] = None) -> str:
+    """
+    同じ話者が連続する場合、他のキャラクターによる短い相槌をAIに生成させて挿入する。
+    mode が "batch" の場合は、すべての挿入位置をまとめて1回のリクエストで生成し、
+    不適切な応答だった箇所だけを1箇所ずつ生成し直す。"per_spot" (省略時。従来どおり) の場合は最初から1箇所ずつ生成する。
+    1箇所ずつの生成は、最大 max_workers 件を並行に実行する。
+    memo を指定した場合、同じキャラクターが同じセリフに打った相槌が十分にたまっていれば、APIを呼ばずにその中から選ぶ。
+    parsed に dialog_text の解析結果を渡すと、解析し直さずにそれを使う。
+    profiles には試す順に生成プロファイルを渡す (省略した場合は quality だけを使う)。
+    text_model_client の代わりに client_provider (一括生成用) と async_client_provider (1箇所ずつの生成用) を渡すと、
+    リクエストごとに利用枠を確保する。stop_event がセットされると、残りの相槌の生成を打ち切る。
+    """
+    if parsed is None:
+        parsed = parse_dialog(dialog_text)
+    spots = find_interjection_spots(parsed, characters)
+    if not spots:
+        return dialog_text.strip()
+
+    # 相槌メモから選べる箇所は、APIに問い合わせない
+    memo_keys = [
+        InterjectionMemo.make_key(spot.character.get_character_prompt(), spot.previous_speech) if memo else None
+        for spot in spots
+    ]
+    interjections: Dict[int, str] = {}
+    if memo is not None:
+        for spot_id, key in enumerate(memo_keys):
+            remembered = memo.pick(key)
+            if remembered is not None:
+                interjections[spot_id] = remembered
+        if interjections:
+            print(f"  - {len(interjections)}/{len(spots)}箇所の相槌を相槌メモから選びました。")
+
+    clients = _InterjectionClients(text_model_client, client_provider, async_client_provider, stop_event)
+    pending = [spot_id for spot_id in range(len(spots)) if spot_id not in interjections]
+    if pending and mode == INTERJECTION_MODE_BATCH:
+        # 一括生成の応答の番号は pending 内の位置になるため、元の番号に戻す
+        generated = _generate_interjections_in_batch([spots[spot_id] for spot_id in pending], clients, max_workers, profiles)
+        generated = {pending[index]: interjection for index, interjection in generated.items()}
+    elif pending:
+        # 挿入位置は先にすべて見つけてあるため、前の相槌の完了を待たずに並行して生成できる
+        generated = _generate_interjections_concurrently(spots, pending, clients, max_workers, profiles)
+    else:
+        generated = {}
+
+    if memo is not None:
+        for spot_id, interjection in generated.items():
+            memo.add(memo_keys[spot_id], interjection, spots[spot_id].character.name, spots[spot_id].previous_speech)
+    interjections.update(generated)
+
+    # 元の行の順序を保ったまま、各挿入位置の直前に相槌を差し込む
+    inserts = {
+        spots[spot_id].line_index: f"{spots[spot_id].character.name}: {interjection}\n"
+        for spot_id, interjection in interjections.items()
+    }
+    new_lines = []
+    for line_index, line in enumerate(dialog_text.split('\n')):
+        if line_index in inserts:
+            new_lines.append(inserts[line_index])
+        new_lines.append(line)
 
+    return "\n".join(new_lines).strip()